@@ -1,7 +1,267 @@
-from django.db.models import Aggregate, IntegerField
+from typing import TYPE_CHECKING, Any
 
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import (
+    Aggregate,
+    BigIntegerField,
+    Count,
+    Expression,
+    Field,
+    Func,
+    IntegerField,
+    RowRange,
+    Value,
+    Window,
+)
+from django.db.models.expressions import Col
 
-class HLLCardinality(Aggregate):
+from .fields import HLLKMVSketchField, HLLSketchField
+from .functions import HLLHash, HLLHashColumn, HLLNativeHash
+from .operations import get_hash_columns
+from .precision import (
+    DEFAULT_EXACT_THRESHOLD,
+    DEFAULT_TARGET_ERROR,
+    MAX_PRECISION,
+    MIN_PRECISION,
+    choose_precision,
+    get_expected_cardinality,
+)
+
+if TYPE_CHECKING:
+    from django.db.models.sql.compiler import SQLCompiler, _AsSqlType
+
+STRATEGIES = ("state", "set")
+
+
+class HLLHashColumnMixin(Aggregate):
+    """
+    An HLL aggregate that hashes a column, which aggregates its hash column
+    with `from_hash_function` instead when postgres generates one,
+    see `operations.AddHLLHashColumn`
+    """
+
+    from_hash_function: str
+
+    def as_sql(  # type: ignore[override]
+        self,
+        compiler: "SQLCompiler",
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> "_AsSqlType":
+        # without the filter, which is set back on the copy
+        expressions: list[Any] = self.source_expressions
+        # without an expression, the aggregate fails in postgres
+        if expressions and isinstance(expressions[0], Col):
+            expression, *other_expressions = expressions
+            hash_column = get_hash_columns(connection).get(
+                (expression.target.model._meta.db_table, expression.target.column)
+            )
+            if hash_column is not None:
+                aggregate = self.copy()
+                aggregate.function = self.from_hash_function
+                # the from hash aggregates don't have a default precision
+                aggregate.set_source_expressions(
+                    [
+                        HLLHashColumn(expression.alias, hash_column),
+                        *(other_expressions or [Value(9)]),
+                        *([self.filter] if self.filter else []),
+                    ]
+                )
+                return aggregate.as_sql(compiler, connection, **extra_context)
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+class HLLAutoPrecisionMixin(Aggregate):
+    """
+    An HLL aggregate that chooses its precision when the query is compiled,
+    given a `target_error` or `precision="auto"` instead of a precision
+
+    e.g. `HLLCardinality("user_uuid", target_error=0.02)`
+
+    The precision is the lowest one whose error is within the target,
+    for the number of distinct values of the column that postgres expects from
+    its statistics, see `precision.choose_precision`. `"auto"` targets the error
+    of the default precision, `precision.DEFAULT_TARGET_ERROR`.
+
+    Columns expected to have at most `exact_threshold` distinct values,
+    or too few for any precision to be within the target, are counted exactly
+    with `COUNT(DISTINCT ...)` instead.
+    """
+
+    def __init__(
+        self,
+        *expressions: Any,
+        target_error: float | None = None,
+        exact_threshold: int = DEFAULT_EXACT_THRESHOLD,
+        **extra: Any,
+    ) -> None:
+        if len(expressions) > 1 and isinstance(expressions[1], str):
+            if expressions[1] != "auto":
+                raise ValueError(
+                    f"invalid precision: {expressions[1]!r} - must be an integer or 'auto'"
+                )
+            expressions = (expressions[0], *expressions[2:])
+            if target_error is None:
+                target_error = DEFAULT_TARGET_ERROR
+        elif target_error is not None and len(expressions) > 1:
+            raise ValueError("target_error can't be given with a precision")
+        if target_error is not None:
+            # raises an error for invalid targets
+            choose_precision(target_error)
+        self.target_error = target_error
+        self.exact_threshold = exact_threshold
+        super().__init__(*expressions, **extra)
+
+    def as_sql(  # type: ignore[override]
+        self,
+        compiler: "SQLCompiler",
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> "_AsSqlType":
+        if self.target_error is None:
+            return super().as_sql(compiler, connection, **extra_context)
+
+        expression, *other_expressions = self.get_source_expressions()
+        cardinality = None
+        if isinstance(expression, Col):
+            cardinality = get_expected_cardinality(
+                connection,
+                expression.target.model._meta.db_table,
+                expression.target.column,
+            )
+        precision = choose_precision(self.target_error, cardinality)
+        if precision is None or (
+            cardinality is not None and cardinality <= self.exact_threshold
+        ):
+            return Count(expression, distinct=True, filter=self.filter).as_sql(
+                compiler, connection, **extra_context
+            )
+
+        aggregate = self.copy()
+        aggregate.target_error = None
+        aggregate.set_source_expressions(
+            [expression, Value(precision), *other_expressions]
+        )
+        return aggregate.as_sql(compiler, connection, **extra_context)
+
+
+class HLLPrecisionVariantMixin(Aggregate):
+    """
+    An HLL aggregate that runs the variant of its `function` specialised for its
+    precision, e.g. `hll_cardinality_p11(user_uuid)` for `hll_cardinality(user_uuid, 11)`,
+    when the precision is a constant
+
+    The variants have the number of buckets of their precision as constants,
+    and start from an empty state of their precision, so that they don't check
+    the precision or the state on every row. They give the same approximations.
+    """
+
+    # the functions with variants, and their default precision, if any
+    precision_variant_functions: dict[str, int | None] = {
+        "hll_cardinality": 9,
+        "hll_cardinality_from_hash": None,
+    }
+
+    def as_sql(  # type: ignore[override]
+        self,
+        compiler: "SQLCompiler",
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> "_AsSqlType":
+        if (
+            self.function not in self.precision_variant_functions
+            or getattr(self, "strategy", "state") != "state"
+            or not 1 <= len(self.source_expressions) <= 2
+        ):
+            return super().as_sql(compiler, connection, **extra_context)
+
+        expression, *precision_expressions = self.source_expressions
+        precision = self.precision_variant_functions[self.function]
+        if precision_expressions:
+            (precision_expression,) = precision_expressions
+            if not isinstance(precision_expression, Value) or not isinstance(
+                precision_expression.value, int
+            ):
+                return super().as_sql(compiler, connection, **extra_context)
+            precision = precision_expression.value
+        if precision is None or not MIN_PRECISION <= precision <= MAX_PRECISION:
+            # raises the error of a missing or invalid precision
+            return super().as_sql(compiler, connection, **extra_context)
+
+        aggregate = self.copy()
+        aggregate.function = f"{self.function}_p{precision}"
+        aggregate.set_source_expressions(
+            [expression, *([self.filter] if self.filter else [])]
+        )
+        return aggregate.as_sql(compiler, connection, **extra_context)
+
+
+class HLLStrategyAggregate(Aggregate):
+    """
+    An HLL aggregate that can be computed with one of two strategies:
+
+    - "state" (the default) runs the aggregate `function`, which updates its
+      state with a PL/pgSQL call for every row
+    - "set" reduces every hash to the key of its bucket and rank with integer
+      expressions that postgres inlines (and can JIT compile), collects the
+      distinct keys with the built-in `ARRAY_AGG`, and approximates them with
+      `hll_set_approximate`
+
+    Both strategies return the same approximation.
+    """
+
+    def __init__(
+        self, *expressions: Any, strategy: str = "state", **extra: Any
+    ) -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown HLL strategy {strategy!r}, must be one of {', '.join(STRATEGIES)}"
+            )
+        self.strategy = strategy
+        super().__init__(*expressions, **extra)
+
+    def get_hash(self, expression: Expression) -> Expression:
+        """The hash of the aggregated expression"""
+        return expression
+
+    def as_sql(  # type: ignore[override]
+        self,
+        compiler: "SQLCompiler",
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> "_AsSqlType":
+        if self.strategy == "state":
+            return super().as_sql(compiler, connection, **extra_context)
+
+        expression, *precision = self.source_expressions
+        keys = self.copy()
+        keys.strategy = "state"
+        keys.template = "ARRAY_AGG(DISTINCT %(expressions)s)"
+        keys.set_source_expressions(
+            [
+                Func(
+                    self.get_hash(expression),
+                    *precision,
+                    function="hll_set_key",
+                    output_field=IntegerField(),
+                ),
+                *([self.filter] if self.filter else []),
+            ]
+        )
+        sql, params = keys.as_sql(compiler, connection)
+        for precision_expression in precision:
+            precision_sql, precision_params = compiler.compile(precision_expression)
+            sql = f"{sql}, {precision_sql}"
+            params = [*params, *precision_params]
+        return f"hll_set_approximate({sql})", params
+
+
+class HLLCardinality(
+    HLLAutoPrecisionMixin,
+    HLLHashColumnMixin,
+    HLLPrecisionVariantMixin,
+    HLLStrategyAggregate,
+):
     """
     Return an approximate distinct count based on the HyperLogLog algorithm
     as described in:
@@ -11,16 +271,28 @@ class HLLCardinality(Aggregate):
     outperform COUNT(DISTINCT ...) in many circumstances. It should also be
     more memory efficient. Notice, however that it will always be an approximate
     result rather than an exact count.
+
+    `strategy="set"` computes the same approximation without PL/pgSQL calls,
+    which is usually faster on large tables, see `HLLStrategyAggregate`.
+
+    The precision can be chosen from a target error, e.g. `target_error=0.02`,
+    see `HLLAutoPrecisionMixin`.
     """
 
     function = "hll_cardinality"
+    from_hash_function = "hll_cardinality_from_hash"
     name = "HLLCardinality"
     allow_distinct = False
     output_field = IntegerField()
     empty_result_set_value = 0
 
+    def get_hash(self, expression: Expression) -> Expression:
+        if isinstance(expression, HLLHashColumn):
+            return expression
+        return HLLHash(expression)
 
-class HLLCardinalityFromHash(Aggregate):
+
+class HLLCardinalityFromHash(HLLPrecisionVariantMixin, HLLStrategyAggregate):
     """
     Return an approximate distinct count based on the HyperLogLog algorithm
     as described in:
@@ -34,6 +306,8 @@ class HLLCardinalityFromHash(Aggregate):
     MD5 and SHA1 both produce uniform hashes, but they would have to be cast into
     an integer to be used with this function. This is not recommended as it would
     be very slow.
+
+    Also accepts `strategy="set"`, see `HLLCardinality`.
     """
 
     function = "hll_cardinality_from_hash"
@@ -41,3 +315,304 @@ class HLLCardinalityFromHash(Aggregate):
     allow_distinct = False
     output_field = IntegerField()
     empty_result_set_value = 0
+
+
+class HLLNativeCardinality(HLLCardinalityFromHash):
+    """
+    Return an approximate distinct count of integers or uuids, hashed with
+    `functions.HLLNativeHash` rather than `functions.HLLHash`
+
+    It's the same approximation as `HLLCardinality`, with different hashes,
+    at the same default precision of 9, and accepts `strategy="set"` too.
+    """
+
+    name = "HLLNativeCardinality"
+
+    def __init__(self, expression: Any, *expressions: Any, **extra: Any) -> None:
+        # hll_cardinality_from_hash doesn't have a default precision
+        super().__init__(HLLNativeHash(expression), *(expressions or (9,)), **extra)
+
+
+class HLLCompactCardinality(HLLAutoPrecisionMixin, HLLHashColumnMixin, Aggregate):
+    """
+    Return the same approximate distinct count as `HLLCardinality`,
+    keeping a compact aggregation state, and choosing its precision the same way.
+
+    The state stores one byte per bucket (the rank of the hash) in a `bytea`,
+    rather than a 32 bit hash in an `int[]`, so it is about 4 times smaller.
+    This matters when grouping by other variables, as postgres keeps one state
+    in memory per group, and copies them between parallel workers.
+    """
+
+    function = "hll_compact_cardinality"
+    from_hash_function = "hll_compact_cardinality_from_hash"
+    name = "HLLCompactCardinality"
+    allow_distinct = False
+    output_field = IntegerField()
+    empty_result_set_value = 0
+
+
+class HLLCompactCardinalityFromHash(Aggregate):
+    """
+    Return the same approximate distinct count as `HLLCardinalityFromHash`,
+    keeping a compact aggregation state, see `HLLCompactCardinality`.
+
+    Requires the input to be previously hashed, see `functions.HLLHash`
+    """
+
+    function = "hll_compact_cardinality_from_hash"
+    name = "HLLCompactCardinalityFromHash"
+    allow_distinct = False
+    output_field = IntegerField()
+    empty_result_set_value = 0
+
+
+class HLLMultiCardinalityFromHash(Aggregate):
+    """
+    Return the approximate distinct counts of several expressions in one aggregate,
+    as a list with the count of each expression in order
+
+    Requires the inputs to be previously hashed, see `functions.HLLHash`
+
+    e.g. `HLLMultiCardinalityFromHash("user_uuid_hash", "user_int_hash", precision=11)`
+
+    Each count is the same as `HLLCardinalityFromHash` of its expression, but the
+    hashes of a row are added to every count with a single PL/pgSQL call, rather
+    than one call per expression. The state keeps every bucket of every expression,
+    so it isn't sparse for small groups like `HLLCardinalityFromHash`.
+    """
+
+    function = "hll_multi_cardinality"
+    name = "HLLMultiCardinalityFromHash"
+    allow_distinct = False
+    output_field = Field()
+
+    def __init__(self, *expressions: Any, precision: int = 9, **extra: Any) -> None:
+        if not expressions:
+            raise TypeError(f"{self.__class__.__name__} requires expressions")
+        self.n_expressions = len(expressions)
+        hashes = Func(
+            *(self.get_hash(expression) for expression in expressions),
+            template="ARRAY[%(expressions)s]",
+            output_field=Field(),
+        )
+        super().__init__(hashes, precision, **extra)
+        self.empty_result_set_value = [0] * self.n_expressions
+
+    def get_hash(self, expression: Any) -> Any:
+        """The hash of an aggregated expression"""
+        return expression
+
+    def convert_value(
+        self, value: Any, expression: Any, connection: BaseDatabaseWrapper
+    ) -> list[int]:
+        # the counts of no rows
+        if value is None:
+            return [0] * self.n_expressions
+        return value
+
+
+class HLLMultiCardinality(HLLMultiCardinalityFromHash):
+    """
+    Return the approximate distinct counts of several expressions in one aggregate,
+    as a list with the count of each expression in order
+
+    e.g.
+    Session.objects.annotate(date_of_session=TruncDate("created"))
+    .values("date_of_session")
+    .annotate(approx_uniques=HLLMultiCardinality("user_uuid", "user_int", precision=11))
+
+    Each count is the same as `HLLCardinality` of its expression,
+    see `HLLMultiCardinalityFromHash`.
+    """
+
+    name = "HLLMultiCardinality"
+
+    def get_hash(self, expression: Any) -> Any:
+        return HLLHash(expression)
+
+
+class HLLCardinality64(Aggregate):
+    """
+    Return an approximate distinct count based on the HyperLogLog algorithm,
+    hashing values to 64 bits rather than 31
+
+    Large cardinalities aren't biased by hash collisions, and the approximation
+    uses the improved estimator described in:
+        https://arxiv.org/abs/1702.01284
+    which is more accurate than `HLLCardinality` for small and intermediate
+    cardinalities, so a lower precision gives the same error.
+
+    The state is the same as `HLLCompactCardinality`, one byte per bucket.
+    """
+
+    function = "hll_cardinality64"
+    name = "HLLCardinality64"
+    allow_distinct = False
+    output_field = BigIntegerField()
+    empty_result_set_value = 0
+
+
+class HLLCardinality64FromHash(Aggregate):
+    """
+    Return the same approximate distinct count as `HLLCardinality64`
+
+    Requires the input to be previously hashed to a 64 bit integer,
+    see `functions.HLLHash64`
+    """
+
+    function = "hll_cardinality64_from_hash"
+    name = "HLLCardinality64FromHash"
+    allow_distinct = False
+    output_field = BigIntegerField()
+    empty_result_set_value = 0
+
+
+class HLLSketch(HLLHashColumnMixin, Aggregate):
+    """
+    Return the HyperLogLog sketch that `HLLCardinality` would approximate,
+    instead of the approximation itself.
+
+    Sketches can be stored in a `fields.HLLSketchField`, merged with `HLLUnion`
+    and approximated with `functions.HLLSketchCardinality`, so that distinct counts
+    over any combination of stored groups don't need to rescan the original rows.
+    """
+
+    function = "hll_sketch"
+    from_hash_function = "hll_sketch_from_hash"
+    name = "HLLSketch"
+    allow_distinct = False
+    output_field = HLLSketchField()
+
+
+class HLLSketchFromHash(Aggregate):
+    """
+    Return the HyperLogLog sketch that `HLLCardinalityFromHash` would approximate,
+    instead of the approximation itself, see `HLLSketch`.
+
+    Requires the input to be previously hashed, see `functions.HLLHash`
+    """
+
+    function = "hll_sketch_from_hash"
+    name = "HLLSketchFromHash"
+    allow_distinct = False
+    output_field = HLLSketchField()
+
+
+class HLLUnion(Aggregate):
+    """
+    Merge HyperLogLog sketches, as returned by `HLLSketch`, into a single sketch.
+
+    The result is the same sketch as would be returned by aggregating
+    all the original rows at once. Sketches of different precisions are reduced
+    to the lowest one, see `functions.HLLReducePrecision`.
+    """
+
+    function = "hll_union"
+    name = "HLLUnion"
+    allow_distinct = False
+    output_field = HLLSketchField()
+
+
+class HLLKMVSketchFromHash(Aggregate):
+    """
+    Return a KMV (k minimum values) sketch of hashes: the k smallest distinct hashes,
+    with k defaulting to 1024, see `HLLKMVSketch`
+
+    Requires the input to be previously hashed, see `functions.HLLHash`
+    """
+
+    function = "hll_kmv_sketch_from_hash"
+    name = "HLLKMVSketchFromHash"
+    allow_distinct = False
+    output_field = HLLKMVSketchField()
+
+    def __init__(self, expression: Any, k: int = 1024, **extra: Any) -> None:
+        super().__init__(expression, k, **extra)
+
+
+class HLLKMVSketch(HLLKMVSketchFromHash):
+    """
+    Return a KMV (k minimum values) sketch: the k smallest distinct hashes of
+    `functions.HLLHash`, with k defaulting to 1024
+
+    Sketches can be stored in a `fields.HLLKMVSketchField`, next to a HyperLogLog
+    sketch, merged with `HLLKMVUnion`, and intersected with
+    `functions.HLLKMVIntersectionCardinality`. The relative error of an intersection
+    is about `sqrt((1 - j) / (j * k))`, for the ratio j of the intersection to the
+    union, so KMV sketches approximate small intersections of large sets better
+    than `functions.HLLIntersectionCardinality`, and the state of each is k hashes.
+    """
+
+    function = "hll_kmv_sketch"
+    name = "HLLKMVSketch"
+
+
+class HLLKMVUnion(Aggregate):
+    """
+    Merge KMV sketches, as returned by `HLLKMVSketch`, into a single sketch,
+    with the smallest k of the sketches
+    """
+
+    function = "hll_kmv_union"
+    name = "HLLKMVUnion"
+    allow_distinct = False
+    output_field = HLLKMVSketchField()
+
+
+class HLLUnionCardinality(Aggregate):
+    """
+    Merge HyperLogLog sketches, and approximate the cardinality of the merged sketch,
+    i.e. `functions.HLLSketchCardinality(HLLUnion(...))` in one aggregate.
+
+    It can also be used in a `Window`, e.g. over stored daily sketches ordered by date.
+    """
+
+    function = "hll_union_cardinality"
+    name = "HLLUnionCardinality"
+    allow_distinct = False
+    output_field = IntegerField()
+    empty_result_set_value = 0
+
+
+class HLLCumulativeCardinality(Window):
+    """
+    Return the running approximate distinct count of ordered sketches,
+    e.g. the unique users up to each day, in a single scan
+
+    The sketches, either aggregated by the groups of the query with `HLLSketch`
+    or stored, are merged in order with `hll_union_cardinality` as a window function.
+    `buckets` limits the merge to the sketch of the current row and the
+    `buckets - 1` rows before it. The window counts rows, not time units:
+    e.g. with `buckets=7` over days, days without any sessions aren't part of
+    the query, so the window spans more than 7 days.
+
+    e.g.
+    Session.objects.annotate(date_of_session=TruncDate("created"))
+    .values("date_of_session")
+    .annotate(sketch=HLLSketch("user_uuid", 11))
+    .annotate(cumulative_users=HLLCumulativeCardinality("sketch", order_by="date_of_session"))
+    """
+
+    def __init__(
+        self,
+        sketch: Any,
+        *,
+        order_by: Any,
+        partition_by: Any = None,
+        buckets: int | None = None,
+    ) -> None:
+        if buckets is not None and buckets < 1:
+            raise ValueError(f"invalid buckets: {buckets} - must be at least 1")
+        union = Func(
+            sketch,
+            function="hll_union_cardinality",
+            output_field=IntegerField(),
+        )
+        union.window_compatible = True
+        super().__init__(
+            union,
+            partition_by=partition_by,
+            order_by=order_by,
+            frame=None if buckets is None else RowRange(start=-(buckets - 1), end=0),
+        )
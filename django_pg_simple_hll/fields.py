@@ -0,0 +1,107 @@
+from typing import Any
+
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import Field, IntegerField, Model
+
+from .hashing import hll_hash
+
+
+class HLLSketchField(Field):
+    """
+    Stores a HyperLogLog sketch, as returned by `aggregate.HLLSketch`
+    and `aggregate.HLLUnion`
+
+    The sketch is the aggregation state used by `hll_cardinality`,
+    an `int[]` with the smallest hash seen in each bucket, so the precision
+    is given by its length.
+    Sketches of only a few values are sparse instead: their first element
+    is the negated precision, followed by the smallest hash of each bucket seen.
+    Sketches built with the same precision can be merged with `aggregate.HLLUnion`,
+    and approximated with `functions.HLLSketchCardinality`.
+    """
+
+    description = "HyperLogLog sketch"
+
+    def db_type(self, connection: BaseDatabaseWrapper) -> str:
+        return "int[]"
+
+    def get_prep_value(self, value: Any) -> Any:
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return list(value)
+
+
+class HLLKMVSketchField(Field):
+    """
+    Stores a KMV (k minimum values) sketch, as returned by `aggregate.HLLKMVSketch`
+    and `aggregate.HLLKMVUnion`
+
+    The sketch is an `int[]` of k, followed by the k smallest distinct hashes seen
+    in ascending order, or fewer if fewer values were seen.
+    """
+
+    description = "KMV sketch"
+
+    def db_type(self, connection: BaseDatabaseWrapper) -> str:
+        return "int[]"
+
+    def get_prep_value(self, value: Any) -> Any:
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return list(value)
+
+
+class HLLHashField(IntegerField):
+    """
+    The 31 bit hash of another field of the model, set when the model is saved,
+    including with `bulk_create`
+
+    e.g. `user_uuid_hash = HLLHashField(source="user_uuid")`
+
+    The hash is the same as `functions.HLLHash`, computed in python with
+    `hashing.hll_hash`, so that the field can be aggregated with
+    `aggregate.HLLCardinalityFromHash` without hashing at query time.
+    Existing rows can be hashed with the `hll_backfill_hashes` command.
+    """
+
+    description = "HyperLogLog hash of %(source)s"
+
+    def __init__(self, *args: Any, source: str, **kwargs: Any) -> None:
+        self.source = source
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def check(self, **kwargs: Any) -> list[checks.CheckMessage]:
+        errors = super().check(**kwargs)
+        try:
+            source = self.model._meta.get_field(self.source)
+        except FieldDoesNotExist:
+            source = None
+        if not isinstance(source, Field) or not source.concrete:
+            errors.append(
+                checks.Error(
+                    f"HLLHashField's source {self.source!r} is not a concrete field",
+                    obj=self,
+                    id="django_pg_simple_hll.E001",
+                )
+            )
+        return errors
+
+    def deconstruct(self) -> Any:
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance: Model, add: bool) -> Any:
+        source = model_instance._meta.get_field(self.source)
+        # the value of a foreign key, rather than the related object
+        value = getattr(
+            model_instance, source.attname if isinstance(source, Field) else self.source
+        )
+        hashed = None if value is None else hll_hash(value)
+        setattr(model_instance, self.attname, hashed)
+        return hashed
@@ -1,6 +1,14 @@
-from django.db.models import IntegerField
+from typing import TYPE_CHECKING, Any
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import BigIntegerField, Expression, Func, IntegerField
 from django.db.models.lookups import Transform
 
+from .fields import HLLSketchField
+
+if TYPE_CHECKING:
+    from django.db.models.sql.compiler import SQLCompiler, _AsSqlType
+
 
 class HLLHash(Transform):
     """
@@ -11,3 +19,144 @@ class HLLHash(Transform):
     function = "hll_hash"
     lookup_name = "hll_hash"
     output_field = IntegerField()
+
+
+class HLLNativeHash(Transform):
+    """
+    Faster hash function for HLL
+    - it hashes integer and uuid fields with their own postgres hash functions,
+      without casting them to text, and any other field as `HLLHash`
+    - the hashes of integers and uuids differ from `HLLHash`, so they can't be mixed
+    """
+
+    function = "hll_native_hash"
+    lookup_name = "hll_native_hash"
+    output_field = IntegerField()
+
+
+class HLLHashColumn(Expression):
+    """
+    A hash column generated by postgres, see `operations.AddHLLHashColumn`
+    - alias is the alias of its table in the query, as in `Col`
+    """
+
+    output_field = IntegerField()
+
+    def __init__(self, alias: str | None, column: str) -> None:
+        super().__init__()
+        self.alias = alias
+        self.column = column
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.alias!r}, {self.column!r})"
+
+    def as_sql(  # type: ignore[override]
+        self,
+        compiler: "SQLCompiler",
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> "_AsSqlType":
+        identifiers = (self.alias, self.column) if self.alias else (self.column,)
+        return ".".join(map(compiler.quote_name_unless_alias, identifiers)), []
+
+
+class HLLHash64(Transform):
+    """
+    64 bit hash function for HLL, see `aggregate.HLLCardinality64`
+    - it hashes and transforms any field to a signed int 64
+    """
+
+    function = "hll_hash64"
+    lookup_name = "hll_hash64"
+    output_field = BigIntegerField()
+
+
+class HLLSketchCardinality(Func):
+    """
+    Approximate the cardinality of a HyperLogLog sketch,
+    see `aggregate.HLLSketch` and `aggregate.HLLUnion`
+    """
+
+    function = "hll_sketch_cardinality"
+    arity = 1
+    output_field = IntegerField()
+
+
+class HLLReducePrecision(Func):
+    """
+    Reduce a HyperLogLog sketch to a lower precision, see `aggregate.HLLSketch`
+    - the result is the same sketch as aggregating the values at that precision,
+      so sketches stored at a high precision can be approximated at a lower one
+    """
+
+    function = "hll_reduce_precision"
+    arity = 2
+    output_field = HLLSketchField()
+
+
+class HLLSketchUnion(Func):
+    """
+    Merge HyperLogLog sketches into a single sketch, like `aggregate.HLLUnion`
+    merges the sketches of several rows
+    - e.g. the sketch of two stored sketches of a row, at the lowest of their precisions
+    - the union is NULL if any sketch is NULL
+    """
+
+    function = "hll_union_combine"
+    output_field = HLLSketchField()
+
+    def __init__(self, *expressions: Any, **extra: Any) -> None:
+        if len(expressions) < 2:
+            raise TypeError(f"{self.__class__.__name__} requires at least 2 sketches")
+        if len(expressions) > 2:
+            expressions = (HLLSketchUnion(*expressions[:-1]), expressions[-1])
+        super().__init__(*expressions, **extra)
+
+
+class HLLIntersectionCardinality(Func):
+    """
+    Approximate the number of values in both of two HyperLogLog sketches,
+    as the cardinalities of both sketches minus the cardinality of their union
+    - its error is about the error of the union, so small intersections of large
+      sketches are better approximated with `HLLKMVIntersectionCardinality`
+    """
+
+    function = "hll_intersection_cardinality"
+    arity = 2
+    output_field = IntegerField()
+
+
+class HLLDifferenceCardinality(Func):
+    """
+    Approximate the number of values in the first HyperLogLog sketch but not
+    in the second one, as the cardinality of their union minus the second one
+    """
+
+    function = "hll_difference_cardinality"
+    arity = 2
+    output_field = IntegerField()
+
+
+class HLLKMVSketchCardinality(Func):
+    """
+    Approximate the cardinality of a KMV sketch, see `aggregate.HLLKMVSketch`
+    - it's exact for sketches of less than k values
+    """
+
+    function = "hll_kmv_cardinality"
+    arity = 1
+    output_field = IntegerField()
+
+
+class HLLKMVIntersectionCardinality(Func):
+    """
+    Approximate the number of values in both of two KMV sketches,
+    see `aggregate.HLLKMVSketch`
+    - the k smallest hashes of their union are a sample of the union, and the ones
+      in both sketches are a sample of the intersection
+    - it's exact if the union has less than k values
+    """
+
+    function = "hll_kmv_intersection_cardinality"
+    arity = 2
+    output_field = IntegerField()
@@ -0,0 +1,153 @@
+"""
+The hash functions of postgres in python, so that values can be hashed
+when they're written, with the same hashes as `functions.HLLHash`
+
+`hash_bytes` is postgres' `hash_bytes` (`src/common/hashfn.c`), Bob Jenkins' lookup3
+hash as postgres computes it on little-endian servers, i.e. x86 and ARM.
+`hll_native_hash` gives the same hashes as `functions.HLLNativeHash`.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any
+from uuid import UUID
+
+_MASK_32 = 0xFFFFFFFF
+
+
+def _rot(x: int, k: int) -> int:
+    return ((x << k) | (x >> (32 - k))) & _MASK_32
+
+
+def _mix(a: int, b: int, c: int) -> tuple[int, int, int]:
+    a = (a - c) & _MASK_32
+    a ^= _rot(c, 4)
+    c = (c + b) & _MASK_32
+    b = (b - a) & _MASK_32
+    b ^= _rot(a, 6)
+    a = (a + c) & _MASK_32
+    c = (c - b) & _MASK_32
+    c ^= _rot(b, 8)
+    b = (b + a) & _MASK_32
+    a = (a - c) & _MASK_32
+    a ^= _rot(c, 16)
+    c = (c + b) & _MASK_32
+    b = (b - a) & _MASK_32
+    b ^= _rot(a, 19)
+    a = (a + c) & _MASK_32
+    c = (c - b) & _MASK_32
+    c ^= _rot(b, 4)
+    b = (b + a) & _MASK_32
+    return a, b, c
+
+
+def _final(a: int, b: int, c: int) -> int:
+    c ^= b
+    c = (c - _rot(b, 14)) & _MASK_32
+    a ^= c
+    a = (a - _rot(c, 11)) & _MASK_32
+    b ^= a
+    b = (b - _rot(a, 25)) & _MASK_32
+    c ^= b
+    c = (c - _rot(b, 16)) & _MASK_32
+    a ^= c
+    a = (a - _rot(c, 4)) & _MASK_32
+    b ^= a
+    b = (b - _rot(a, 14)) & _MASK_32
+    c ^= b
+    c = (c - _rot(b, 24)) & _MASK_32
+    return c
+
+
+def hash_bytes(data: bytes) -> int:
+    """
+    The unsigned 32 bit hash of some bytes, as postgres' `hash_bytes`
+    """
+    length = len(data)
+    a = b = c = (0x9E3779B9 + length + 3923095) & _MASK_32
+
+    offset = 0
+    while length - offset >= 12:
+        a = (a + int.from_bytes(data[offset : offset + 4], "little")) & _MASK_32
+        b = (b + int.from_bytes(data[offset + 4 : offset + 8], "little")) & _MASK_32
+        c = (c + int.from_bytes(data[offset + 8 : offset + 12], "little")) & _MASK_32
+        a, b, c = _mix(a, b, c)
+        offset += 12
+
+    # the last 11 bytes, the lowest byte of c is left for the length
+    tail = data[offset:]
+    a = (a + int.from_bytes(tail[0:4], "little")) & _MASK_32
+    b = (b + int.from_bytes(tail[4:8], "little")) & _MASK_32
+    c = (c + (int.from_bytes(tail[8:11], "little") << 8)) & _MASK_32
+    return _final(a, b, c)
+
+
+def hash_uint32(value: int) -> int:
+    """
+    The unsigned 32 bit hash of an unsigned 32 bit integer, as postgres' `hash_uint32`
+    """
+    a = b = c = (0x9E3779B9 + 4 + 3923095) & _MASK_32
+    a = (a + value) & _MASK_32
+    return _final(a, b, c)
+
+
+def hash_int8(value: int) -> int:
+    """
+    The unsigned 32 bit hash of a signed 64 bit integer, as postgres' `HASHINT8`,
+    which is the same as `HASHINT4` and `HASHINT2` for smaller integers
+    """
+    if not -(1 << 63) <= value < 1 << 63:
+        raise ValueError(f"{value} is out of the range of bigint")
+    low, high = value & _MASK_32, (value >> 32) & _MASK_32
+    # fold the high half in, so that integers in the int range hash like ints
+    return hash_uint32(low ^ (high if value >= 0 else ~high & _MASK_32))
+
+
+def hash_text(text: str) -> int:
+    """
+    The signed 32 bit hash of some text, as postgres' `HASHTEXT`
+    for UTF-8 databases and deterministic collations
+    """
+    hashed = hash_bytes(text.encode("utf-8"))
+    return hashed - (1 << 32) if hashed >= 1 << 31 else hashed
+
+
+def to_text(value: Any) -> str:
+    """
+    The text of a value, as postgres casts it with `::text`
+    for the types that don't depend on the settings of the session,
+    and for dates with an ISO `DateStyle`, postgres' default
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str | int | UUID):
+        return str(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot hash {type(value).__name__} values like postgres")
+
+
+def hll_hash(value: Any) -> int:
+    """
+    The 31 bit hash of a value, the same as `hll_hash` and `functions.HLLHash`
+
+    Supports text, integers, booleans, uuids and dates. Dates are hashed as their
+    ISO text, so they only match postgres with an ISO `DateStyle`.
+    """
+    # unset the sign bit
+    return hash_text(to_text(value)) & 0x7FFFFFFF
+
+
+def hll_native_hash(value: Any) -> int:
+    """
+    The 31 bit hash of a value, the same as `hll_native_hash` and
+    `functions.HLLNativeHash`
+
+    Integers and uuids are hashed natively, other values as `hll_hash`.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return hash_int8(value) & 0x7FFFFFFF
+    if isinstance(value, UUID):
+        return hash_bytes(value.bytes) & 0x7FFFFFFF
+    return hll_hash(value)
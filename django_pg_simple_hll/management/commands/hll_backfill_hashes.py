@@ -0,0 +1,60 @@
+from typing import Any
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from ...fields import HLLHashField
+from ...functions import HLLHash
+
+
+class Command(BaseCommand):
+    help = (
+        "Set the HLLHashField of the rows that haven't been hashed yet, "
+        "e.g. the rows saved before the field was added, in batches"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("model", help="The model, as app_label.ModelName")
+        parser.add_argument("field", help="The name of the HLLHashField")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Number of rows hashed in each transaction",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to backfill the hashes in",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            model = apps.get_model(options["model"])
+            field = model._meta.get_field(options["field"])
+        except (LookupError, ValueError, FieldDoesNotExist) as e:
+            raise CommandError(str(e)) from e
+        if not isinstance(field, HLLHashField):
+            raise CommandError(f"{options['model']}.{field.name} is not a HLLHashField")
+
+        using = options["database"]
+        rows = model._default_manager.using(using)
+        n_hashed = 0
+        while True:
+            # the rows are hashed in postgres, with the same hash as `HLLHashField`
+            with transaction.atomic(using=using):
+                # rows with a NULL source have a NULL hash
+                batch = rows.filter(
+                    **{f"{field.name}__isnull": True, f"{field.source}__isnull": False}
+                ).values("pk")
+                n_batch = rows.filter(pk__in=batch[: options["batch_size"]]).update(
+                    **{field.name: HLLHash(field.source)}
+                )
+            n_hashed += n_batch
+            if n_batch < options["batch_size"]:
+                break
+            self.stdout.write(f"Hashed {n_hashed} rows")
+
+        self.stdout.write(f"Hashed {n_hashed} rows of {options['model']}.{field.name}")
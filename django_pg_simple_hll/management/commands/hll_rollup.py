@@ -0,0 +1,48 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.module_loading import autodiscover_modules
+
+from ...rollup import get_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the rows added since the last run into the sketches of HLL rollups. "
+        "Rollups are registered in the `hll_rollups` module of installed apps."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Names of the rollups to update, all rollups are updated by default",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Discard the stored sketches, and aggregate every row again",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to update the rollups in",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        autodiscover_modules("hll_rollups")
+
+        try:
+            rollups = get_rollups(options["names"])
+        except KeyError as e:
+            raise CommandError(f"Unknown HLL rollups: {e.args[0]}") from e
+
+        for rollup in rollups:
+            updated = rollup.update(
+                using=options["database"], rebuild=options["rebuild"]
+            )
+            if updated:
+                self.stdout.write(f"Updated {rollup.name}")
+            else:
+                self.stdout.write(f"{rollup.name} is up to date")
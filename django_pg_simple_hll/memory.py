@@ -0,0 +1,249 @@
+"""
+Estimating the memory of the aggregation states of HLL queries,
+and guarding against queries that would exceed it, see `hll_memory_guard`
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from .profiling import is_select_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRECISION = 9
+DEFAULT_KMV_K = 1024
+
+# the calls of HLL aggregates in the output of EXPLAIN VERBOSE,
+# e.g. hll_cardinality_from_hash(user_uuid_hll_hash, 16)
+_AGGREGATE_CALL = re.compile(r"\b(hll_[a-z0-9_]+)\(")
+_PRECISION_VARIANT = re.compile(r"hll_cardinality(?:_from_hash)?_p(\d+)")
+
+
+class HLLMemoryError(DatabaseError):
+    """An HLL query is expected to use more memory than its budget"""
+
+
+def _array_bytes(n_elements: int, nulls: bool = True) -> int:
+    # the header of a one dimensional array and its NULL bitmap, aligned to 8 bytes
+    header = 24 + ((n_elements + 7) // 8 if nulls else 0)
+    return (header + 7) // 8 * 8 + 4 * n_elements
+
+
+def state_bytes(precision: int = DEFAULT_PRECISION, compact: bool = False) -> int:
+    """
+    The size of a dense aggregation state at a precision: an `int[]` with a bucket
+    per int, or a `bytea` with a bucket per byte for the compact and 64 bit aggregates
+
+    Sparse states, of fewer hashes than a quarter of the buckets, are smaller.
+    """
+    if compact:
+        return 4 + (1 << precision)
+    return _array_bytes(1 << precision)
+
+
+def _get_arguments(text: str, start: int) -> list[str]:
+    """The top level arguments of a call, from the position after its parenthesis"""
+    arguments = []
+    depth = 0
+    quoted = False
+    argument_start = start
+    for position in range(start, len(text)):
+        character = text[position]
+        if character == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif character in "([":
+            depth += 1
+        elif character in ")]":
+            if depth == 0:
+                arguments.append(text[argument_start:position].strip())
+                break
+            depth -= 1
+        elif character == "," and depth == 0:
+            arguments.append(text[argument_start:position].strip())
+            argument_start = position + 1
+    return arguments
+
+
+def _get_integer(arguments: list[str], index: int, default: int) -> int:
+    # constants are printed as is, or cast, e.g. 11 or '11'::integer
+    if len(arguments) > index:
+        match = re.fullmatch(r"\(?'?(\d+)'?(?:::integer)?\)?", arguments[index])
+        if match:
+            return int(match.group(1))
+    return default
+
+
+def _get_call_state_bytes(name: str, arguments: list[str]) -> int | None:
+    # the variants of a precision, e.g. hll_cardinality_p11(user_uuid)
+    variant = _PRECISION_VARIANT.fullmatch(name)
+    if variant:
+        return state_bytes(int(variant.group(1)))
+    if name in (
+        "hll_cardinality",
+        "hll_cardinality_from_hash",
+        "hll_sketch",
+        "hll_sketch_from_hash",
+    ):
+        return state_bytes(_get_integer(arguments, 1, DEFAULT_PRECISION))
+    if name in (
+        "hll_compact_cardinality",
+        "hll_compact_cardinality_from_hash",
+        "hll_cardinality64",
+        "hll_cardinality64_from_hash",
+    ):
+        return state_bytes(_get_integer(arguments, 1, DEFAULT_PRECISION), compact=True)
+    if name in ("hll_union", "hll_union_cardinality"):
+        # the precision of stored sketches isn't known
+        return state_bytes()
+    if name == "hll_multi_cardinality":
+        n_columns = (
+            len(_get_arguments(arguments[0], 6))
+            if arguments and arguments[0].startswith("ARRAY[")
+            else 1
+        )
+        precision = _get_integer(arguments, 1, DEFAULT_PRECISION)
+        return _array_bytes(1 + n_columns * (1 << precision))
+    if name in ("hll_kmv_sketch", "hll_kmv_sketch_from_hash"):
+        return _array_bytes(1 + _get_integer(arguments, 1, DEFAULT_KMV_K), nulls=False)
+    if name == "hll_kmv_union":
+        return _array_bytes(1 + DEFAULT_KMV_K, nulls=False)
+    return None
+
+
+def get_output_state_bytes(output: list[str]) -> int:
+    """
+    The size of the states of the HLL aggregates in the output of a plan node,
+    as printed by EXPLAIN VERBOSE
+    """
+    total = 0
+    for expression in output:
+        for match in _AGGREGATE_CALL.finditer(expression):
+            size = _get_call_state_bytes(
+                match.group(1), _get_arguments(expression, match.end())
+            )
+            if size is not None:
+                total += size
+    return total
+
+
+def get_hashed_aggregate_bytes(plan: dict[str, Any]) -> int:
+    """
+    The memory that the largest hashed aggregate node of a plan is expected to use
+    for its HLL states: the number of groups postgres expects times their size
+    """
+    largest = 0
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Aggregate" and node.get("Strategy") in (
+            "Hashed",
+            "Mixed",
+        ):
+            largest = max(
+                largest, node["Plan Rows"] * get_output_state_bytes(node["Output"])
+            )
+        nodes.extend(node.get("Plans", ()))
+    return largest
+
+
+@contextmanager
+def hll_memory_guard(
+    using: str = DEFAULT_DB_ALIAS,
+    budget: int | None = None,
+    on_exceed: str = "raise",
+) -> Iterator[None]:
+    """
+    Estimate the memory of the HLL states of the queries run in the block before
+    running them, and fail or aggregate with less memory when it exceeds a budget
+
+    e.g.
+    with hll_memory_guard(on_exceed="sort"):
+        Session.objects.values("user_int").annotate(n=HLLCardinality("user_uuid", 16))
+
+    The estimate of a hashed aggregate is the number of groups postgres expects times
+    the size of the dense states of its HLL aggregates, at their precision. The
+    budget defaults to the memory postgres allows a hashed aggregate, `work_mem`
+    times `hash_mem_multiplier` from postgres 13, in bytes.
+
+    on_exceed:
+    - "raise": raise an `HLLMemoryError` instead of running the query
+    - "sort": run the query without hashed aggregates, so that postgres sorts
+      the rows and keeps a single group in memory at a time. The query runs
+      in a transaction, or a savepoint, which turns them off for it only.
+    """
+    if on_exceed not in ("raise", "sort"):
+        raise ValueError(
+            f"invalid on_exceed: {on_exceed!r} - must be 'raise' or 'sort'"
+        )
+    connection = connections[using]
+
+    if budget is None:
+        with connection.cursor() as cursor:
+            # hash_mem_multiplier only exists from postgres 13
+            cursor.execute(
+                "SELECT work_mem.setting::bigint * 1024 "
+                "  * COALESCE(hash_mem.setting::float, 1) "
+                "FROM pg_settings work_mem "
+                "LEFT JOIN pg_settings hash_mem "
+                "  ON hash_mem.name = 'hash_mem_multiplier' "
+                "WHERE work_mem.name = 'work_mem'"
+            )
+            ((hash_mem,),) = cursor.fetchall()
+        budget = int(hash_mem)
+
+    def guard_query(
+        execute: Callable[..., Any],
+        sql: str,
+        params: Any,
+        many: bool,
+        context: dict[str, Any],
+    ) -> Any:
+        if many or "hll_" not in sql or not is_select_query(sql):
+            return execute(sql, params, many, context)
+
+        # the plan is queried with a cursor of the underlying connection,
+        # which doesn't call this wrapper again
+        raw_cursor = context["connection"].connection.cursor()
+        try:
+            raw_cursor.execute(f"EXPLAIN (VERBOSE, FORMAT JSON) {sql}", params)
+            ((plan,),) = raw_cursor.fetchall()
+            estimate = get_hashed_aggregate_bytes(plan[0]["Plan"])
+            if estimate <= budget:
+                return execute(sql, params, many, context)
+
+            message = (
+                f"the HLL states of the query are expected to use {estimate} "
+                f"bytes, more than the budget of {budget} bytes"
+            )
+            if on_exceed == "raise":
+                raise HLLMemoryError(message)
+            logger.warning("%s, it's run without hashed aggregates", message)
+            raw_cursor.execute("SELECT current_setting('enable_hashagg')")
+            ((enable_hashagg,),) = raw_cursor.fetchall()
+            try:
+                # a failed query rolls back the setting with its savepoint
+                with transaction.atomic(using=using):
+                    raw_cursor.execute(
+                        "SELECT set_config('enable_hashagg', 'off', true)"
+                    )
+                    return execute(sql, params, many, context)
+            finally:
+                # the setting outlives the savepoint of a transaction
+                raw_cursor.execute(
+                    "SELECT set_config('enable_hashagg', %s, true)",
+                    [enable_hashagg],
+                )
+        finally:
+            raw_cursor.close()
+
+    with connection.execute_wrapper(guard_query):
+        yield
@@ -0,0 +1,9 @@
+DROP AGGREGATE IF EXISTS hll_compact_cardinality(anyelement);
+DROP AGGREGATE IF EXISTS hll_compact_cardinality(anyelement, int);
+DROP AGGREGATE IF EXISTS hll_compact_cardinality_from_hash(int, int);
+DROP FUNCTION IF EXISTS hll_compact_hash_and_bucket(bytea, anyelement);
+DROP FUNCTION IF EXISTS hll_compact_hash_and_bucket(bytea, anyelement, int);
+DROP FUNCTION IF EXISTS hll_compact_bucket(bytea, int, int);
+DROP FUNCTION IF EXISTS hll_compact_bucket_combine(bytea, bytea);
+DROP FUNCTION IF EXISTS hll_compact_approximate(bytea);
+DROP FUNCTION IF EXISTS hll_rank(int);
@@ -0,0 +1,198 @@
+-- The rank of a hash, i.e. the position of its most significant bit
+-- counting from the left of the 31 usable bits
+-- e.g. 2^30 has a rank of 1, and 1 has a rank of 31
+-- WIDTH_BUCKET does a binary search over the powers of 2, returning the bit length
+-- of the hash, so this avoids LOG and stays a plain SQL expression that can be inlined
+-- a hash of 0 has no set bits, and gets the rank 32
+CREATE OR REPLACE FUNCTION hll_rank(hashed_input int) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT 32 - WIDTH_BUCKET(
+    hashed_input,
+    '{1,2,4,8,16,32,64,128,256,512,1024,2048,4096,8192,16384,32768,65536,131072,262144,524288,1048576,2097152,4194304,8388608,16777216,33554432,67108864,134217728,268435456,536870912,1073741824}'::int []
+)
+$$;
+
+-- The state transition function for the compact state
+-- hll_agg_state is the current running state, a bytea with one byte per bucket
+--  each byte holds the highest rank seen for that bucket, 0 means the bucket is empty
+--  this is the same information as the minimum hash kept by `hll_bucket`,
+--  in a quarter of the space and without a NULL bitmap
+-- hashed_input is the int32 hash of any element we are considering
+-- hll_precision is the precision we are using for the approximation
+--  it use used to calculate the number of buckets
+CREATE OR REPLACE FUNCTION hll_compact_bucket(
+    hll_agg_state bytea,
+    hashed_input int,
+    hll_precision int
+) RETURNS bytea
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    -- eg. a hll_precision 9 sets the number of buckets to 512, because 2**9 -> 512
+    n_buckets int := 1 << hll_precision;
+    -- bucket the hash into one of n buckets
+    -- bytea is 0-indexed, so unlike `hll_bucket` we don't add 1
+    bucket_key int := hashed_input & (n_buckets - 1);
+    bucket_rank int := hll_rank(hashed_input);
+BEGIN
+    -- we can only handle precision up to 26 or 67,108,864 buckets
+    -- to keep the same range as the int [] state
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+    -- the initial state is empty, allocate every bucket at once with a rank of 0
+    IF LENGTH(hll_agg_state) < n_buckets THEN
+        hll_agg_state := hll_agg_state || DECODE(REPEAT('00', n_buckets - LENGTH(hll_agg_state)), 'hex');
+    END IF;
+
+    -- SET_BYTE copies the state, but ranks only go up, so it is rarely called
+    -- once the buckets have been filled
+    IF GET_BYTE(hll_agg_state, bucket_key) < bucket_rank THEN
+        hll_agg_state := SET_BYTE(hll_agg_state, bucket_key, bucket_rank);
+    END IF;
+    RETURN hll_agg_state;
+END $$;
+
+-- hash and bucket in one function
+CREATE OR REPLACE FUNCTION hll_compact_hash_and_bucket(
+    hll_agg_state bytea,
+    input anyelement,
+    hll_precision int
+) RETURNS bytea
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_compact_bucket(hll_agg_state, hll_hash(input), hll_precision);
+$$;
+
+-- hash and bucket in one function with default precision of 9
+CREATE OR REPLACE FUNCTION hll_compact_hash_and_bucket(
+    hll_agg_state bytea,
+    input anyelement
+) RETURNS bytea
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+BEGIN
+    RETURN hll_compact_hash_and_bucket(hll_agg_state, input, 9);
+END $$;
+
+-- The combinefunc
+-- combines two states, taking the higher rank from each corresponding byte
+-- a parallel worker that saw no rows hands over the empty initial state,
+-- in which case the other state is returned as it is
+CREATE OR REPLACE FUNCTION hll_compact_bucket_combine(
+    hll_left_agg_state bytea,
+    hll_right_agg_state bytea
+) RETURNS bytea
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT
+    CASE
+        WHEN LENGTH(hll_left_agg_state) = 0 THEN hll_right_agg_state
+        WHEN LENGTH(hll_right_agg_state) = 0 THEN hll_left_agg_state
+        ELSE (
+            SELECT
+                STRING_AGG(
+                    SET_BYTE(
+                        '\x00'::bytea,
+                        0,
+                        GREATEST(GET_BYTE(hll_left_agg_state, bucket_key), GET_BYTE(hll_right_agg_state, bucket_key))
+                    ),
+                    ''::bytea
+                    ORDER BY bucket_key
+                )
+            FROM GENERATE_SERIES(0, LENGTH(hll_left_agg_state) - 1) AS bucket_key
+        )
+    END $$;
+
+-- The finalfunc
+-- takes the compact hll_agg_state and approximates cardinality
+-- this is the same estimate as `hll_approximate`, reading ranks instead of hashes
+CREATE OR REPLACE FUNCTION hll_compact_approximate(
+    hll_agg_state bytea
+) RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+WITH n_buckets AS (
+    -- an empty state has no buckets, and no approximation
+    SELECT NULLIF(LENGTH(hll_agg_state), 0) AS n_buckets
+),
+hll_agg_state_table AS (
+    SELECT
+        GET_BYTE(hll_agg_state, bucket_key) AS most_significant_bit,
+        bucket_key
+    FROM n_buckets, GENERATE_SERIES(0, n_buckets.n_buckets - 1) AS bucket_key
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts and aggregates
+counted AS (
+    SELECT
+        MAX(n_buckets.n_buckets) - COUNT(*) FILTER (
+            WHERE hll_agg_state_table.most_significant_bit > 0 -- ignore all empty buckets
+        ) AS n_zero_buckets,
+        SUM(POW(2, -1 * hll_agg_state_table.most_significant_bit::numeric)) FILTER (
+            WHERE hll_agg_state_table.most_significant_bit > 0
+        ) AS harmonic_mean
+    FROM hll_agg_state_table, n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
+
+-- aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality_from_hash(int, int) (
+    SFUNC = hll_compact_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+-- aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement, int) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+--  aggregation with default precision argument
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
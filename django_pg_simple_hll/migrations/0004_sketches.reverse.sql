@@ -0,0 +1,5 @@
+DROP FUNCTION IF EXISTS hll_sketch_cardinality(int []);
+DROP AGGREGATE IF EXISTS hll_union(int []);
+DROP AGGREGATE IF EXISTS hll_sketch_from_hash(int, int);
+DROP AGGREGATE IF EXISTS hll_sketch(anyelement);
+DROP AGGREGATE IF EXISTS hll_sketch(anyelement, int);
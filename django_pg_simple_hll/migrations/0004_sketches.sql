@@ -0,0 +1,51 @@
+-- Sketch aggregations
+-- these are the same as `hll_cardinality` and `hll_cardinality_from_hash`
+-- without a FINALFUNC, so they return the aggregation state itself
+-- the state can be stored, merged with `hll_union`, and
+-- approximated with `hll_sketch_cardinality` later on
+
+-- sketch aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_sketch_from_hash(int, int) (
+    SFUNC = hll_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+-- sketch aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+-- sketch aggregation with default precision argument
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+-- merges stored sketches into a single sketch
+-- sketches need to have been built with the same precision
+-- NULL sketches are ignored
+CREATE OR REPLACE AGGREGATE hll_union(int []) (
+    SFUNC = hll_bucket_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+-- approximates the cardinality of a stored sketch
+CREATE OR REPLACE FUNCTION hll_sketch_cardinality(
+    hll_sketch int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_approximate(hll_sketch)
+$$;
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("django_pg_simple_hll", "0004_sketches"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HLLRollupWatermark",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("value", models.TextField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,238 @@
+-- Sparse states
+-- a dense state is an array of n_buckets, with the smallest hash seen in each bucket
+-- a sparse state only keeps the buckets that have been seen:
+--  its first element is the negated precision, which tells it apart from a dense state
+--  as hashes are never negative, followed by the smallest hash of each bucket
+--  seen so far, sorted by bucket
+-- e.g. at precision 9, '{-9, 1025, 514}' has the hash 1025 in bucket 1
+-- and the hash 514 in bucket 2
+-- states start sparse, and are turned dense once they hold more than
+-- a quarter of the buckets (or 4096 buckets), so that small groups don't
+-- allocate every bucket
+
+-- turn a sparse state into a dense state
+-- dense and empty states are returned as they are
+CREATE OR REPLACE FUNCTION hll_densify(
+    hll_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    n_buckets int;
+    dense_agg_state int [] := '{}';
+    bucket_hash int;
+BEGIN
+    IF hll_agg_state[1] IS NULL OR hll_agg_state[1] >= 0 THEN
+        RETURN hll_agg_state;
+    END IF;
+
+    n_buckets := 1 << -hll_agg_state[1];
+    -- postgres squeezes uninitialised elements in an array,
+    -- so we add a first and last NULL elements to keep a fixed size
+    dense_agg_state[1] := NULL;
+    dense_agg_state[n_buckets] := NULL;
+    FOREACH bucket_hash IN ARRAY hll_agg_state[2:] LOOP
+        dense_agg_state[(bucket_hash & (n_buckets - 1)) + 1] := bucket_hash;
+    END LOOP;
+    RETURN dense_agg_state;
+END $$;
+
+-- The state transition function
+-- it takes the current state, and the hashed input values
+-- hll_agg_state is the current running state, either sparse or dense
+-- hashed_input is the int32 hash of any element we are considering
+-- hll_precision is the precision we are using for the approximation
+--  it use used to calculate the number of buckets
+CREATE OR REPLACE FUNCTION hll_bucket(
+    hll_agg_state int [],
+    hashed_input int,
+    hll_precision int
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    -- eg. a hll_precision 9 sets the number of buckets to 512, because 2**9 -> 512
+    n_buckets int := POW(2, hll_precision);
+    -- bucket the hash into one of n buckets
+    -- we add 1 because postgres arrays are 1-indexed
+    bucket_key int := (hashed_input & (n_buckets - 1)) + 1;
+    -- length of current state array
+    hll_agg_state_length int := ARRAY_LENGTH(hll_agg_state, 1);
+    -- pre fetch the hash for occupying the corresponding bucket for the input
+    current_hash int;
+    -- bounds of the binary search over a sparse state
+    lower_index int;
+    upper_index int;
+    middle_index int;
+    middle_bucket_key int;
+BEGIN
+    -- we can only handle precision up to 26 or 67,108,864 buckets
+    -- because array size is limited to 134,217,727 (or 2^27 - 1) in postgres
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+
+    -- the initial state is empty, start a sparse state
+    IF hll_agg_state_length IS NULL THEN
+        RETURN ARRAY[-hll_precision, hashed_input];
+    END IF;
+
+    IF hll_agg_state[1] < 0 THEN
+        -- binary search for the bucket in the sparse state
+        lower_index := 2;
+        upper_index := hll_agg_state_length;
+        WHILE lower_index <= upper_index LOOP
+            middle_index := (lower_index + upper_index) / 2;
+            middle_bucket_key := (hll_agg_state[middle_index] & (n_buckets - 1)) + 1;
+            IF middle_bucket_key = bucket_key THEN
+                IF hll_agg_state[middle_index] > hashed_input THEN
+                    hll_agg_state[middle_index] := hashed_input;
+                END IF;
+                RETURN hll_agg_state;
+            ELSIF middle_bucket_key < bucket_key THEN
+                lower_index := middle_index + 1;
+            ELSE
+                upper_index := middle_index - 1;
+            END IF;
+        END LOOP;
+
+        -- the bucket hasn't been seen, insert it in order while the state is small enough
+        IF hll_agg_state_length - 1 < LEAST(n_buckets / 4, 4096) THEN
+            RETURN hll_agg_state[:lower_index - 1] || hashed_input || hll_agg_state[lower_index:];
+        END IF;
+        hll_agg_state := hll_densify(hll_agg_state);
+    END IF;
+
+    current_hash := hll_agg_state[bucket_key];
+    IF current_hash IS NULL OR current_hash > hashed_input THEN
+        hll_agg_state[bucket_key] := hashed_input;
+    END IF;
+    RETURN hll_agg_state;
+END $$;
+
+-- The combinefunc
+-- combines two states, taking the smaller hash from each corresponding bucket
+-- the buckets of a sparse state are added to the other state one by one,
+-- two dense states are combined index by index
+-- we don't have any extra logic here for the two flanking extra elements at
+-- the beginning and the end of dense arrays because they should just be
+-- copied as they are the same
+CREATE OR REPLACE FUNCTION hll_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    sparse_agg_state int [];
+    bucket_hash int;
+    n_buckets int;
+    hll_precision int;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    END IF;
+
+    IF hll_left_agg_state[1] >= 0 OR hll_left_agg_state[1] IS NULL THEN
+        IF hll_right_agg_state[1] >= 0 OR hll_right_agg_state[1] IS NULL THEN
+            RETURN ARRAY(
+                SELECT
+                    LEAST(left_bucket_hash, right_bucket_hash)
+                FROM
+                    UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+            );
+        END IF;
+        sparse_agg_state := hll_right_agg_state;
+    ELSE
+        sparse_agg_state := hll_left_agg_state;
+        hll_left_agg_state := hll_right_agg_state;
+    END IF;
+
+    -- hll_left_agg_state can still be sparse, hll_bucket takes care of both
+    IF hll_left_agg_state[1] < 0 THEN
+        -- the state might be turned dense along the way, so keep its precision
+        hll_precision := -hll_left_agg_state[1];
+        FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+            hll_left_agg_state := hll_bucket(hll_left_agg_state, bucket_hash, hll_precision);
+        END LOOP;
+        RETURN hll_left_agg_state;
+    END IF;
+
+    -- setting the buckets of a dense state directly is cheaper
+    n_buckets := ARRAY_LENGTH(hll_left_agg_state, 1);
+    FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+        hll_left_agg_state[(bucket_hash & (n_buckets - 1)) + 1] := LEAST(
+            hll_left_agg_state[(bucket_hash & (n_buckets - 1)) + 1], bucket_hash
+        );
+    END LOOP;
+    RETURN hll_left_agg_state;
+END $$;
+
+-- The finalfunc
+-- takes the hll_agg_state and approximates cardinality
+-- the number of buckets of a sparse state is given by its precision
+CREATE OR REPLACE FUNCTION hll_approximate(
+    hll_agg_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+WITH n_buckets AS (
+    SELECT
+        CASE
+            WHEN hll_agg_state[1] < 0 THEN 1 << -hll_agg_state[1]
+            ELSE ARRAY_LENGTH(hll_agg_state, 1)
+        END AS n_buckets
+),
+hll_agg_state_table AS (
+    SELECT
+        31 - FLOOR(LOG(2, bucket_hash)) AS most_significant_bit,
+        bucket_key
+    FROM UNNEST(hll_agg_state) WITH ORDINALITY AS hll_agg_state_table(bucket_hash, bucket_key)
+    WHERE
+        bucket_hash IS NOT NULL -- ignore all null elements
+        AND bucket_hash >= 0 -- and the precision of sparse states
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts and aggregates
+counted AS (
+    SELECT
+        MAX(n_buckets.n_buckets) - COUNT(hll_agg_state_table.most_significant_bit) AS n_zero_buckets,
+        SUM(POW(2, -1 * hll_agg_state_table.most_significant_bit)) AS harmonic_mean
+    FROM hll_agg_state_table, n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
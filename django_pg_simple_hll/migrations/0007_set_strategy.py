@@ -0,0 +1,15 @@
+from django.db import migrations
+
+from . import load_sql
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_pg_simple_hll", "0006_sparse_state"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=load_sql(__file__), reverse_sql=load_sql(__file__, reverse=True)
+        )
+    ]
@@ -0,0 +1,5 @@
+DROP FUNCTION IF EXISTS hll_set_approximate(int []);
+DROP FUNCTION IF EXISTS hll_set_approximate(int [], int);
+DROP FUNCTION IF EXISTS hll_estimate(int, bigint, numeric);
+DROP FUNCTION IF EXISTS hll_set_key(int);
+DROP FUNCTION IF EXISTS hll_set_key(int, int);
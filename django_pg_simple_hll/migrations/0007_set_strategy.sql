@@ -0,0 +1,122 @@
+-- Set strategy
+-- instead of running a PL/pgSQL transition function for every row, the set strategy
+-- reduces each hash to a key made of its bucket and rank with integer expressions,
+-- which postgres inlines into the query, and leaves deduplicating the keys to
+-- built-in aggregates: either ARRAY_AGG(DISTINCT ...), e.g.
+--  SELECT hll_set_approximate(ARRAY_AGG(DISTINCT hll_set_key(hll_hash(user_uuid), 11)), 11)
+--  FROM testapp_session
+-- or a GROUP BY bucket with MAX(rank), followed by `hll_estimate`, see the README
+
+-- The key of a hash, with its bucket in the high bits and its rank - 1 in the 5 low bits
+-- so keys sort by bucket, then by rank
+-- e.g. at precision 9, the hash 1025 is in bucket 1 with a rank of 21,
+--  so its key is 1 << 5 | 20 = 52
+-- the bucket takes up to 26 bits, so the key always fits in a positive int
+CREATE OR REPLACE FUNCTION hll_set_key(
+    hashed_input int,
+    hll_precision int
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT ((hashed_input & ((1 << hll_precision) - 1)) << 5) | (hll_rank(hashed_input) - 1)
+$$;
+
+-- the key of a hash with default precision of 9
+CREATE OR REPLACE FUNCTION hll_set_key(
+    hashed_input int
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_set_key(hashed_input, 9)
+$$;
+
+-- The estimator shared by the set strategy and hand written GROUP BY queries
+-- hll_precision is the precision we are using for the approximation
+-- n_filled_buckets is the number of buckets that have seen a hash
+-- rank_sum is the sum of 2^-rank over the filled buckets
+-- this is the same estimate as `hll_approximate`, from the counts rather than the state
+CREATE OR REPLACE FUNCTION hll_estimate(
+    hll_precision int,
+    n_filled_buckets bigint,
+    rank_sum numeric
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+WITH n_buckets AS (
+    SELECT (1 << hll_precision) AS n_buckets
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts
+counted AS (
+    SELECT
+        n_buckets.n_buckets - n_filled_buckets AS n_zero_buckets,
+        rank_sum AS harmonic_mean
+    FROM n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
+
+-- The final step of the set strategy
+-- takes the keys of every hash seen, and approximates cardinality
+-- keys can be repeated, only the highest rank of each bucket is kept
+CREATE OR REPLACE FUNCTION hll_set_approximate(
+    hll_keys int [],
+    hll_precision int
+) RETURNS int
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+BEGIN
+    -- we can only handle precision up to 26 or 67,108,864 buckets
+    -- to keep the same range as the int [] state
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+
+    RETURN (
+        SELECT hll_estimate(hll_precision, COUNT(*), SUM(POW(2, -bucket_rank::numeric)))
+        FROM (
+            SELECT MAX(hll_key & 31) + 1 AS bucket_rank
+            FROM UNNEST(hll_keys) AS hll_key
+            GROUP BY hll_key >> 5
+        ) AS buckets
+    );
+END $$;
+
+-- the final step of the set strategy with default precision of 9
+CREATE OR REPLACE FUNCTION hll_set_approximate(
+    hll_keys int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_set_approximate(hll_keys, 9)
+$$;
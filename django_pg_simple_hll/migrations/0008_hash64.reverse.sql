@@ -0,0 +1,12 @@
+DROP AGGREGATE IF EXISTS hll_cardinality64(anyelement);
+DROP AGGREGATE IF EXISTS hll_cardinality64(anyelement, int);
+DROP AGGREGATE IF EXISTS hll_cardinality64_from_hash(bigint, int);
+DROP FUNCTION IF EXISTS hll_approximate64(bytea);
+DROP FUNCTION IF EXISTS hll_improved_estimate(int []);
+DROP FUNCTION IF EXISTS hll_tau(double precision);
+DROP FUNCTION IF EXISTS hll_sigma(double precision);
+DROP FUNCTION IF EXISTS hll_hash_and_bucket64(bytea, anyelement);
+DROP FUNCTION IF EXISTS hll_hash_and_bucket64(bytea, anyelement, int);
+DROP FUNCTION IF EXISTS hll_bucket64(bytea, bigint, int);
+DROP FUNCTION IF EXISTS hll_rank64(bigint, int);
+DROP FUNCTION IF EXISTS hll_hash64(anyelement);
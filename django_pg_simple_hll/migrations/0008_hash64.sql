@@ -0,0 +1,210 @@
+-- 64 bit hashing
+-- `hll_hash` keeps 31 bits of HASHTEXT, so hashes start colliding with millions of
+-- distinct values, which biases large approximations down.
+-- These aggregates hash values to 64 bits with HASHTEXTEXTENDED, keep one byte per
+-- bucket like the compact state, and approximate the cardinality with the
+-- improved estimator from Otmar Ertl, "New cardinality estimation algorithms for
+-- HyperLogLog sketches" (https://arxiv.org/abs/1702.01284), which corrects the
+-- bias of small and intermediate cardinalities without empirical tables
+
+-- hash any element to a signed 64 bit integer, every bit is used
+CREATE OR REPLACE FUNCTION hll_hash64(input anyelement) RETURNS bigint
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT HASHTEXTEXTENDED(input::text, 0)
+$$;
+
+-- The rank of a 64 bit hash, i.e. the position of the most significant bit
+-- of the 64 - hll_precision bits that are not used for bucketing, counting from the left
+-- e.g. at precision 9, a hash of 2^63 has a rank of 1, and 2^9 has a rank of 55
+-- a hash without any set bits left gets the rank 65 - hll_precision
+-- like `hll_rank`, WIDTH_BUCKET returns the bit length, so this can be inlined
+CREATE OR REPLACE FUNCTION hll_rank64(hashed_input bigint, hll_precision int) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT 65 - hll_precision - WIDTH_BUCKET(
+    -- shift the bucket bits out, and unset the sign bits that `>>` copies
+    (hashed_input >> hll_precision) & ((1::bigint << (64 - hll_precision)) - 1),
+    '{1,2,4,8,16,32,64,128,256,512,1024,2048,4096,8192,16384,32768,65536,131072,262144,524288,1048576,2097152,4194304,8388608,16777216,33554432,67108864,134217728,268435456,536870912,1073741824,2147483648,4294967296,8589934592,17179869184,34359738368,68719476736,137438953472,274877906944,549755813888,1099511627776,2199023255552,4398046511104,8796093022208,17592186044416,35184372088832,70368744177664,140737488355328,281474976710656,562949953421312,1125899906842624,2251799813685248,4503599627370496,9007199254740992,18014398509481984,36028797018963968,72057594037927936,144115188075855872,288230376151711744,576460752303423488,1152921504606846976,2305843009213693952,4611686018427387904}'::bigint []
+)
+$$;
+
+-- The state transition function
+-- hll_agg_state is the current running state, a bytea with one byte per bucket
+--  each byte holds the highest rank seen for that bucket, 0 means the bucket is empty
+-- hashed_input is the 64 bit hash of any element we are considering
+-- hll_precision is the precision we are using for the approximation
+--  it use used to calculate the number of buckets
+CREATE OR REPLACE FUNCTION hll_bucket64(
+    hll_agg_state bytea,
+    hashed_input bigint,
+    hll_precision int
+) RETURNS bytea
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    -- eg. a hll_precision 9 sets the number of buckets to 512, because 2**9 -> 512
+    n_buckets int := 1 << hll_precision;
+    -- bucket the hash into one of n buckets, using its lowest bits
+    bucket_key int := (hashed_input & (n_buckets - 1))::int;
+    bucket_rank int := hll_rank64(hashed_input, hll_precision);
+BEGIN
+    -- we can only handle precision up to 26 or 67,108,864 buckets
+    -- to keep the same range as the other states
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+    -- the initial state is empty, allocate every bucket at once with a rank of 0
+    IF LENGTH(hll_agg_state) < n_buckets THEN
+        hll_agg_state := hll_agg_state || DECODE(REPEAT('00', n_buckets - LENGTH(hll_agg_state)), 'hex');
+    END IF;
+
+    IF GET_BYTE(hll_agg_state, bucket_key) < bucket_rank THEN
+        hll_agg_state := SET_BYTE(hll_agg_state, bucket_key, bucket_rank);
+    END IF;
+    RETURN hll_agg_state;
+END $$;
+
+-- hash and bucket in one function
+CREATE OR REPLACE FUNCTION hll_hash_and_bucket64(
+    hll_agg_state bytea,
+    input anyelement,
+    hll_precision int
+) RETURNS bytea
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_bucket64(hll_agg_state, hll_hash64(input), hll_precision);
+$$;
+
+-- hash and bucket in one function with default precision of 9
+CREATE OR REPLACE FUNCTION hll_hash_and_bucket64(
+    hll_agg_state bytea,
+    input anyelement
+) RETURNS bytea
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+BEGIN
+    RETURN hll_hash_and_bucket64(hll_agg_state, input, 9);
+END $$;
+
+-- The sigma function of the improved estimator
+-- it accounts for the empty buckets, x is the fraction of empty buckets
+CREATE OR REPLACE FUNCTION hll_sigma(x double precision) RETURNS double precision
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    y double precision := 1;
+    z double precision := x;
+    previous_z double precision;
+BEGIN
+    IF x = 1 THEN
+        RETURN 'Infinity';
+    END IF;
+    LOOP
+        x := x * x;
+        previous_z := z;
+        z := z + x * y;
+        y := y + y;
+        EXIT WHEN z = previous_z;
+    END LOOP;
+    RETURN z;
+END $$;
+
+-- The tau function of the improved estimator
+-- it accounts for the saturated buckets, x is the fraction of buckets below the highest rank
+CREATE OR REPLACE FUNCTION hll_tau(x double precision) RETURNS double precision
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    y double precision := 1;
+    z double precision := 1 - x;
+    previous_z double precision;
+BEGIN
+    IF x = 0 OR x = 1 THEN
+        RETURN 0;
+    END IF;
+    LOOP
+        x := SQRT(x);
+        previous_z := z;
+        y := 0.5 * y;
+        z := z - (1 - x) * (1 - x) * y;
+        EXIT WHEN z = previous_z;
+    END LOOP;
+    RETURN z / 3;
+END $$;
+
+-- The improved estimator
+-- rank_counts[k + 1] is the number of buckets with the rank k,
+--  from 0 (empty buckets) to the highest possible rank
+CREATE OR REPLACE FUNCTION hll_improved_estimate(rank_counts int []) RETURNS double precision
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    n_buckets double precision := 0;
+    max_rank int := ARRAY_LENGTH(rank_counts, 1) - 1;
+    z double precision;
+BEGIN
+    FOR rank IN 0 .. max_rank LOOP
+        n_buckets := n_buckets + rank_counts[rank + 1];
+    END LOOP;
+
+    z := n_buckets * hll_tau(1 - rank_counts[max_rank + 1] / n_buckets);
+    FOR rank IN REVERSE max_rank - 1 .. 1 LOOP
+        z := 0.5 * (z + rank_counts[rank + 1]);
+    END LOOP;
+    z := z + n_buckets * hll_sigma(rank_counts[1] / n_buckets);
+    -- 0.7213475204444817 is 1 / (2 * ln(2))
+    RETURN 0.7213475204444817 * n_buckets * n_buckets / z;
+END $$;
+
+-- The finalfunc
+-- takes the hll_agg_state and approximates cardinality
+CREATE OR REPLACE FUNCTION hll_approximate64(
+    hll_agg_state bytea
+) RETURNS bigint
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    n_buckets int := LENGTH(hll_agg_state);
+    rank_counts int [];
+    bucket_rank int;
+    n_ranked_buckets int;
+BEGIN
+    -- an empty state has no buckets, and no approximation
+    IF n_buckets = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    -- n_buckets is 2^hll_precision, and ranks go up to 65 - hll_precision
+    rank_counts := ARRAY_FILL(0, ARRAY[66 - LOG(2, n_buckets)::int]);
+    FOR bucket_rank, n_ranked_buckets IN
+        SELECT GET_BYTE(hll_agg_state, bucket_key), COUNT(*)
+        FROM GENERATE_SERIES(0, n_buckets - 1) AS bucket_key
+        GROUP BY 1
+    LOOP
+        rank_counts[bucket_rank + 1] := n_ranked_buckets;
+    END LOOP;
+    RETURN hll_improved_estimate(rank_counts)::bigint;
+END $$;
+
+-- aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_cardinality64_from_hash(bigint, int) (
+    SFUNC = hll_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+-- aggregation with precision argument
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement, int) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+--  aggregation with default precision argument
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
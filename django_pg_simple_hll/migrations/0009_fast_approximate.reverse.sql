@@ -0,0 +1,197 @@
+-- restore the final functions from 0006_sparse_state, 0003_compact_state and 0007_set_strategy
+
+-- The finalfunc
+-- takes the hll_agg_state and approximates cardinality
+-- the number of buckets of a sparse state is given by its precision
+CREATE OR REPLACE FUNCTION hll_approximate(
+    hll_agg_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+WITH n_buckets AS (
+    SELECT
+        CASE
+            WHEN hll_agg_state[1] < 0 THEN 1 << -hll_agg_state[1]
+            ELSE ARRAY_LENGTH(hll_agg_state, 1)
+        END AS n_buckets
+),
+hll_agg_state_table AS (
+    SELECT
+        31 - FLOOR(LOG(2, bucket_hash)) AS most_significant_bit,
+        bucket_key
+    FROM UNNEST(hll_agg_state) WITH ORDINALITY AS hll_agg_state_table(bucket_hash, bucket_key)
+    WHERE
+        bucket_hash IS NOT NULL -- ignore all null elements
+        AND bucket_hash >= 0 -- and the precision of sparse states
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts and aggregates
+counted AS (
+    SELECT
+        MAX(n_buckets.n_buckets) - COUNT(hll_agg_state_table.most_significant_bit) AS n_zero_buckets,
+        SUM(POW(2, -1 * hll_agg_state_table.most_significant_bit)) AS harmonic_mean
+    FROM hll_agg_state_table, n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
+
+-- The finalfunc
+-- takes the compact hll_agg_state and approximates cardinality
+-- this is the same estimate as `hll_approximate`, reading ranks instead of hashes
+CREATE OR REPLACE FUNCTION hll_compact_approximate(
+    hll_agg_state bytea
+) RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+WITH n_buckets AS (
+    -- an empty state has no buckets, and no approximation
+    SELECT NULLIF(LENGTH(hll_agg_state), 0) AS n_buckets
+),
+hll_agg_state_table AS (
+    SELECT
+        GET_BYTE(hll_agg_state, bucket_key) AS most_significant_bit,
+        bucket_key
+    FROM n_buckets, GENERATE_SERIES(0, n_buckets.n_buckets - 1) AS bucket_key
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts and aggregates
+counted AS (
+    SELECT
+        MAX(n_buckets.n_buckets) - COUNT(*) FILTER (
+            WHERE hll_agg_state_table.most_significant_bit > 0 -- ignore all empty buckets
+        ) AS n_zero_buckets,
+        SUM(POW(2, -1 * hll_agg_state_table.most_significant_bit::numeric)) FILTER (
+            WHERE hll_agg_state_table.most_significant_bit > 0
+        ) AS harmonic_mean
+    FROM hll_agg_state_table, n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
+
+-- The estimator shared by the set strategy and hand written GROUP BY queries
+-- hll_precision is the precision we are using for the approximation
+-- n_filled_buckets is the number of buckets that have seen a hash
+-- rank_sum is the sum of 2^-rank over the filled buckets
+-- this is the same estimate as `hll_approximate`, from the counts rather than the state
+CREATE OR REPLACE FUNCTION hll_estimate(
+    hll_precision int,
+    n_filled_buckets bigint,
+    rank_sum numeric
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+WITH n_buckets AS (
+    SELECT (1 << hll_precision) AS n_buckets
+),
+alpha AS (
+    -- alpha is a correction constant related to the number of buckets used
+    -- defined as follows:
+    SELECT
+        CASE
+            WHEN n_buckets.n_buckets = 16 THEN 0.673 -- for precision 4
+            WHEN n_buckets.n_buckets = 32 THEN 0.697 -- for precision 5
+            WHEN n_buckets.n_buckets = 64 THEN 0.709 -- for precision 6
+            ELSE (0.7213 / (1 + 1.079 / n_buckets.n_buckets)) -- for precision >= 7
+        END AS alpha
+    FROM n_buckets
+),
+-- compute counts
+counted AS (
+    SELECT
+        n_buckets.n_buckets - n_filled_buckets AS n_zero_buckets,
+        rank_sum AS harmonic_mean
+    FROM n_buckets
+),
+-- estimate
+estimation AS (
+    SELECT
+        (
+            (POW(n_buckets.n_buckets, 2) * alpha.alpha) / (counted.n_zero_buckets + counted.harmonic_mean)
+        )::int AS approximated_cardinality
+    FROM counted, n_buckets, alpha
+)
+-- correct for biases
+SELECT
+    CASE
+        WHEN
+            estimation.approximated_cardinality < 2.5 * n_buckets.n_buckets
+            AND counted.n_zero_buckets > 0 THEN
+        (
+                alpha.alpha
+                * (
+                    n_buckets.n_buckets
+                    * LOG(2, (n_buckets.n_buckets::numeric / counted.n_zero_buckets)::int
+                )
+            )
+        )::int
+        ELSE estimation.approximated_cardinality
+    END AS approximated_cardinality_corrected
+FROM estimation, alpha, n_buckets, counted $$;
+
+DROP FUNCTION IF EXISTS hll_scaled_estimate(int, bigint, bigint);
+DROP FUNCTION IF EXISTS hll_alpha(int);
\ No newline at end of file
@@ -0,0 +1,136 @@
+-- Faster final functions
+-- instead of unnesting the state into CTEs, and calling numeric LOG and POW for every
+-- bucket, the final functions sum each bucket's 2^-rank in a single pass, scaled by
+-- 2^32 into an exact integer: a bucket with the rank r adds 1 << (32 - r),
+-- and an empty bucket adds 1 << 32
+-- the estimate itself is computed once per group, in double precision,
+-- with the same operations as the reference implementation in `testapp/hyperloglog.py`
+
+-- alpha is a correction constant related to the number of buckets used
+CREATE OR REPLACE FUNCTION hll_alpha(n_buckets int) RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT
+    CASE
+        WHEN n_buckets = 16 THEN 0.673 -- for precision 4
+        WHEN n_buckets = 32 THEN 0.697 -- for precision 5
+        WHEN n_buckets = 64 THEN 0.709 -- for precision 6
+        ELSE 0.7213 / (1 + 1.079 / n_buckets::double precision) -- for precision >= 7
+    END
+$$;
+
+-- The estimate
+-- n_buckets is the number of buckets, 2^hll_precision
+-- n_zero_buckets is the number of empty buckets
+-- scaled_harmonic_sum is the sum of 1 << (32 - rank) over every bucket
+-- this is a single expression, without FROM, so that postgres can inline it
+-- (it isn't STRICT for the same reason, but NULL arguments still return NULL)
+CREATE OR REPLACE FUNCTION hll_scaled_estimate(
+    n_buckets int,
+    n_zero_buckets bigint,
+    scaled_harmonic_sum bigint
+) RETURNS int
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT
+    CASE
+        -- correct for biases of small cardinalities
+        WHEN
+            ROUND(
+                (n_buckets::double precision * n_buckets * hll_alpha(n_buckets))
+                / (scaled_harmonic_sum::double precision / 4294967296)
+            ) < 2.5 * n_buckets
+            AND n_zero_buckets > 0 THEN
+            ROUND(
+                hll_alpha(n_buckets) * (
+                    n_buckets * (LN(n_buckets::double precision / n_zero_buckets) / LN(2::double precision))
+                )
+            )
+        ELSE
+            ROUND(
+                (n_buckets::double precision * n_buckets * hll_alpha(n_buckets))
+                / (scaled_harmonic_sum::double precision / 4294967296)
+            )
+    END::int
+$$;
+
+-- The estimator of the set strategy and hand written GROUP BY queries
+-- hll_precision is the precision we are using for the approximation
+-- n_filled_buckets is the number of buckets that have seen a hash
+-- rank_sum is the sum of 2^-rank over the filled buckets
+CREATE OR REPLACE FUNCTION hll_estimate(
+    hll_precision int,
+    n_filled_buckets bigint,
+    rank_sum numeric
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_scaled_estimate(
+    1 << hll_precision,
+    (1 << hll_precision) - n_filled_buckets,
+    (((1 << hll_precision) - n_filled_buckets) << 32) + (rank_sum * 4294967296)::bigint
+)
+$$;
+
+-- The finalfunc
+-- takes the hll_agg_state, either sparse or dense, and approximates cardinality
+-- like `hll_rank`, WIDTH_BUCKET returns the bit length of a hash, i.e. 32 - rank
+CREATE OR REPLACE FUNCTION hll_approximate(
+    hll_agg_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT
+    hll_scaled_estimate(
+        n_buckets.n_buckets,
+        n_buckets.n_buckets - filled.n_filled_buckets,
+        ((n_buckets.n_buckets - filled.n_filled_buckets) << 32) + filled.scaled_rank_sum
+    )
+FROM
+    (
+        SELECT
+            CASE
+                WHEN hll_agg_state[1] < 0 THEN 1 << -hll_agg_state[1]
+                ELSE ARRAY_LENGTH(hll_agg_state, 1)
+            END AS n_buckets
+    ) AS n_buckets,
+    (
+        SELECT
+            COUNT(*) AS n_filled_buckets,
+            COALESCE(
+                SUM(
+                    1::bigint << WIDTH_BUCKET(
+                        bucket_hash,
+                        '{1,2,4,8,16,32,64,128,256,512,1024,2048,4096,8192,16384,32768,65536,131072,262144,524288,1048576,2097152,4194304,8388608,16777216,33554432,67108864,134217728,268435456,536870912,1073741824}'::int []
+                    )
+                )::bigint,
+                0
+            ) AS scaled_rank_sum
+        FROM UNNEST(hll_agg_state) AS bucket_hash
+        WHERE
+            bucket_hash >= 0 -- ignore the empty buckets, and the precision of sparse states
+    ) AS filled
+$$;
+
+-- The compact finalfunc
+-- takes the compact hll_agg_state and approximates cardinality
+-- an empty bucket has a rank of 0, so it adds 1 << 32 like the others
+CREATE OR REPLACE FUNCTION hll_compact_approximate(
+    hll_agg_state bytea
+) RETURNS int
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT
+    hll_scaled_estimate(
+        n_buckets.n_buckets,
+        COUNT(*) FILTER (WHERE buckets.bucket_rank = 0),
+        SUM(1::bigint << (32 - buckets.bucket_rank))::bigint
+    )
+FROM
+    -- a stored state can be compressed, and GET_BYTE would decompress it for every
+    -- bucket, so it is copied once into a plain bytea
+    -- OFFSET 0 keeps postgres from pulling the copy up into every GET_BYTE
+    (SELECT hll_agg_state || ''::bytea AS hll_agg_state OFFSET 0) AS state,
+    -- an empty state has no buckets, and no approximation
+    LATERAL (SELECT NULLIF(LENGTH(state.hll_agg_state), 0) AS n_buckets) AS n_buckets,
+    LATERAL (
+        SELECT GET_BYTE(state.hll_agg_state, bucket_key) AS bucket_rank
+        FROM GENERATE_SERIES(0, n_buckets.n_buckets - 1) AS bucket_key
+    ) AS buckets
+GROUP BY n_buckets.n_buckets
+$$;
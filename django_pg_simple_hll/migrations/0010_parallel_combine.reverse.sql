@@ -0,0 +1,89 @@
+-- restore the combine functions from 0006_sparse_state and 0003_compact_state
+
+-- The combinefunc
+-- combines two states, taking the smaller hash from each corresponding bucket
+-- the buckets of a sparse state are added to the other state one by one,
+-- two dense states are combined index by index
+-- we don't have any extra logic here for the two flanking extra elements at
+-- the beginning and the end of dense arrays because they should just be
+-- copied as they are the same
+CREATE OR REPLACE FUNCTION hll_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    sparse_agg_state int [];
+    bucket_hash int;
+    n_buckets int;
+    hll_precision int;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    END IF;
+
+    IF hll_left_agg_state[1] >= 0 OR hll_left_agg_state[1] IS NULL THEN
+        IF hll_right_agg_state[1] >= 0 OR hll_right_agg_state[1] IS NULL THEN
+            RETURN ARRAY(
+                SELECT
+                    LEAST(left_bucket_hash, right_bucket_hash)
+                FROM
+                    UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+            );
+        END IF;
+        sparse_agg_state := hll_right_agg_state;
+    ELSE
+        sparse_agg_state := hll_left_agg_state;
+        hll_left_agg_state := hll_right_agg_state;
+    END IF;
+
+    -- hll_left_agg_state can still be sparse, hll_bucket takes care of both
+    IF hll_left_agg_state[1] < 0 THEN
+        -- the state might be turned dense along the way, so keep its precision
+        hll_precision := -hll_left_agg_state[1];
+        FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+            hll_left_agg_state := hll_bucket(hll_left_agg_state, bucket_hash, hll_precision);
+        END LOOP;
+        RETURN hll_left_agg_state;
+    END IF;
+
+    -- setting the buckets of a dense state directly is cheaper
+    n_buckets := ARRAY_LENGTH(hll_left_agg_state, 1);
+    FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+        hll_left_agg_state[(bucket_hash & (n_buckets - 1)) + 1] := LEAST(
+            hll_left_agg_state[(bucket_hash & (n_buckets - 1)) + 1], bucket_hash
+        );
+    END LOOP;
+    RETURN hll_left_agg_state;
+END $$;
+
+-- The combinefunc
+-- combines two states, taking the higher rank from each corresponding byte
+-- a parallel worker that saw no rows hands over the empty initial state,
+-- in which case the other state is returned as it is
+CREATE OR REPLACE FUNCTION hll_compact_bucket_combine(
+    hll_left_agg_state bytea,
+    hll_right_agg_state bytea
+) RETURNS bytea
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT
+    CASE
+        WHEN LENGTH(hll_left_agg_state) = 0 THEN hll_right_agg_state
+        WHEN LENGTH(hll_right_agg_state) = 0 THEN hll_left_agg_state
+        ELSE (
+            SELECT
+                STRING_AGG(
+                    SET_BYTE(
+                        '\x00'::bytea,
+                        0,
+                        GREATEST(GET_BYTE(hll_left_agg_state, bucket_key), GET_BYTE(hll_right_agg_state, bucket_key))
+                    ),
+                    ''::bytea
+                    ORDER BY bucket_key
+                )
+            FROM GENERATE_SERIES(0, LENGTH(hll_left_agg_state) - 1) AS bucket_key
+        )
+    END $$;
@@ -0,0 +1,117 @@
+-- Faster combine functions
+-- the combine functions merge the states of parallel workers, and of rollups
+-- any state can be empty, e.g. from a worker that saw no rows,
+-- and states with a different number of buckets can't be combined
+
+-- The combinefunc
+-- combines two states, taking the smaller hash from each corresponding bucket
+-- two sparse states are merged in a single query, instead of adding the buckets
+-- of one state to the other one by one
+-- the buckets of a sparse state are set directly in a dense state,
+-- two dense states are combined index by index
+CREATE OR REPLACE FUNCTION hll_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    left_n_buckets int;
+    right_n_buckets int;
+    sparse_agg_state int [];
+    bucket_hash int;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    END IF;
+
+    left_n_buckets := CASE
+        WHEN hll_left_agg_state[1] < 0 THEN 1 << -hll_left_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_left_agg_state, 1)
+    END;
+    right_n_buckets := CASE
+        WHEN hll_right_agg_state[1] < 0 THEN 1 << -hll_right_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_right_agg_state, 1)
+    END;
+    IF left_n_buckets <> right_n_buckets THEN
+        RAISE EXCEPTION 'cannot combine hll states of different precisions: % and % buckets',
+            left_n_buckets, right_n_buckets;
+    END IF;
+
+    IF hll_left_agg_state[1] < 0 AND hll_right_agg_state[1] < 0 THEN
+        -- keep the smallest hash of each bucket, sorted by bucket
+        sparse_agg_state := ARRAY(
+            SELECT MIN(sparse_hash)
+            FROM UNNEST(hll_left_agg_state[2:] || hll_right_agg_state[2:]) AS sparse_hash
+            GROUP BY sparse_hash & (left_n_buckets - 1)
+            ORDER BY sparse_hash & (left_n_buckets - 1)
+        );
+        -- with the same threshold as `hll_bucket`
+        IF ARRAY_LENGTH(sparse_agg_state, 1) <= LEAST(left_n_buckets / 4, 4096) THEN
+            RETURN hll_left_agg_state[1] || sparse_agg_state;
+        END IF;
+        RETURN hll_densify(hll_left_agg_state[1] || sparse_agg_state);
+    END IF;
+
+    IF hll_left_agg_state[1] >= 0 OR hll_left_agg_state[1] IS NULL THEN
+        IF hll_right_agg_state[1] >= 0 OR hll_right_agg_state[1] IS NULL THEN
+            RETURN ARRAY(
+                SELECT
+                    LEAST(left_bucket_hash, right_bucket_hash)
+                FROM
+                    UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+            );
+        END IF;
+        sparse_agg_state := hll_right_agg_state;
+    ELSE
+        sparse_agg_state := hll_left_agg_state;
+        hll_left_agg_state := hll_right_agg_state;
+    END IF;
+
+    FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+        hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1] := LEAST(
+            hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1], bucket_hash
+        );
+    END LOOP;
+    RETURN hll_left_agg_state;
+END $$;
+
+-- The combinefunc for the compact state
+-- combines two states, taking the higher rank from each corresponding bucket
+-- GET_BYTE on a compressed state decompresses the whole state on every call,
+-- the plpgsql variables hold a decompressed copy of each state instead
+CREATE OR REPLACE FUNCTION hll_compact_bucket_combine(
+    hll_left_agg_state bytea,
+    hll_right_agg_state bytea
+) RETURNS bytea
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    left_agg_state bytea := hll_left_agg_state || ''::bytea;
+    right_agg_state bytea := hll_right_agg_state || ''::bytea;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF LENGTH(left_agg_state) = 0 THEN
+        RETURN right_agg_state;
+    ELSIF LENGTH(right_agg_state) = 0 THEN
+        RETURN left_agg_state;
+    ELSIF LENGTH(left_agg_state) <> LENGTH(right_agg_state) THEN
+        RAISE EXCEPTION 'cannot combine hll states of different precisions: % and % buckets',
+            LENGTH(left_agg_state), LENGTH(right_agg_state);
+    END IF;
+
+    RETURN (
+        SELECT
+            STRING_AGG(
+                SET_BYTE(
+                    '\x00'::bytea,
+                    0,
+                    GREATEST(GET_BYTE(left_agg_state, bucket_key), GET_BYTE(right_agg_state, bucket_key))
+                ),
+                ''::bytea
+                ORDER BY bucket_key
+            )
+        FROM GENERATE_SERIES(0, LENGTH(left_agg_state) - 1) AS bucket_key
+    );
+END $$;
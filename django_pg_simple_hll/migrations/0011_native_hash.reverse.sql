@@ -0,0 +1,5 @@
+DROP FUNCTION IF EXISTS hll_native_hash(anyelement);
+DROP FUNCTION IF EXISTS hll_native_hash(uuid);
+DROP FUNCTION IF EXISTS hll_native_hash(bigint);
+DROP FUNCTION IF EXISTS hll_native_hash(int);
+DROP FUNCTION IF EXISTS hll_native_hash(smallint);
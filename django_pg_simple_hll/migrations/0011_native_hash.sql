@@ -0,0 +1,36 @@
+-- Native hashing
+-- `hll_hash` casts every value to text before HASHTEXT, which formats and allocates
+-- a string per row. `hll_native_hash` hashes integers and uuids with their
+-- own hash functions (the ones of hash indexes), directly on the binary value.
+-- The hashes differ from `hll_hash`, so sketches and stored hashes of one can't be
+-- merged with the other. Like hash indexes, smallints, ints and bigints of the same
+-- value have the same hash.
+-- These are plain SQL functions, so postgres inlines them in the aggregated expression,
+-- e.g. hll_cardinality_from_hash(hll_native_hash(user_uuid), 11)
+
+CREATE OR REPLACE FUNCTION hll_native_hash(input smallint) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+-- hash and unset the signing bit
+SELECT HASHINT2(input) & 2147483647
+$$;
+
+CREATE OR REPLACE FUNCTION hll_native_hash(input int) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT HASHINT4(input) & 2147483647
+$$;
+
+CREATE OR REPLACE FUNCTION hll_native_hash(input bigint) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT HASHINT8(input) & 2147483647
+$$;
+
+CREATE OR REPLACE FUNCTION hll_native_hash(input uuid) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT UUID_HASH(input) & 2147483647
+$$;
+
+-- any other type is hashed as text, like `hll_hash`
+CREATE OR REPLACE FUNCTION hll_native_hash(input anyelement) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT HASHTEXT(input::text) & 2147483647
+$$;
@@ -0,0 +1 @@
+DROP AGGREGATE IF EXISTS hll_union_cardinality(int []);
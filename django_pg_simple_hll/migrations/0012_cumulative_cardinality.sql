@@ -0,0 +1,17 @@
+-- Cumulative cardinality
+-- merges sketches like `hll_union`, and approximates the merged sketch
+-- like `hll_sketch_cardinality`. As a window function over sketches of ordered
+-- buckets, it returns the running approximation of each bucket in one scan, e.g.
+--  SELECT
+--      DATE_TRUNC('day', created) AS day,
+--      hll_union_cardinality(hll_sketch(user_uuid, 11)) OVER (ORDER BY DATE_TRUNC('day', created))
+--  FROM testapp_session GROUP BY 1
+-- or the approximation of the last 7 days with ROWS BETWEEN 6 PRECEDING AND CURRENT ROW
+CREATE OR REPLACE AGGREGATE hll_union_cardinality(int []) (
+    SFUNC = hll_bucket_combine,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
@@ -0,0 +1,20 @@
+CREATE OR REPLACE AGGREGATE hll_union_cardinality(int []) (
+    SFUNC = hll_bucket_combine,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union(int []) (
+    SFUNC = hll_bucket_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+DROP FUNCTION IF EXISTS hll_union_combine(int [], int []);
+DROP FUNCTION IF EXISTS hll_reduce_precision(int [], int);
+DROP FUNCTION IF EXISTS hll_state_precision(int []);
@@ -0,0 +1,95 @@
+-- Reducing the precision of sketches
+-- a state keeps the smallest hash of each bucket, and the bucket of a hash at
+-- a lower precision is the lower bits of its bucket at a higher precision,
+-- so the state at the lower precision is the smallest hash of the buckets
+-- that share those bits, which is exactly the state that aggregating the same
+-- values at the lower precision returns
+-- e.g. sketches stored at precision 14 can be approximated at precision 8
+
+-- the precision of a state, or NULL for an empty state
+CREATE OR REPLACE FUNCTION hll_state_precision(
+    hll_agg_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT CASE
+    WHEN hll_agg_state[1] < 0 THEN -hll_agg_state[1]
+    ELSE LOG(2, ARRAY_LENGTH(hll_agg_state, 1))::int
+END
+$$;
+
+-- reduce a state to a lower precision, sparse or dense with the same threshold
+-- as `hll_bucket`, empty states and states at that precision are returned as they are
+CREATE OR REPLACE FUNCTION hll_reduce_precision(
+    hll_agg_state int [],
+    hll_precision int
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    state_precision int := hll_state_precision(hll_agg_state);
+    n_buckets int := 1 << hll_precision;
+    sparse_agg_state int [];
+BEGIN
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+    IF state_precision IS NULL OR state_precision = hll_precision THEN
+        RETURN hll_agg_state;
+    ELSIF state_precision < hll_precision THEN
+        RAISE EXCEPTION 'cannot increase the precision of a hll state from % to %',
+            state_precision, hll_precision;
+    END IF;
+
+    -- keep the smallest hash of each bucket, sorted by bucket
+    sparse_agg_state := ARRAY(
+        SELECT MIN(sparse_hash)
+        FROM UNNEST(
+            CASE WHEN hll_agg_state[1] < 0 THEN hll_agg_state[2:] ELSE hll_agg_state END
+        ) AS sparse_hash
+        WHERE sparse_hash IS NOT NULL
+        GROUP BY sparse_hash & (n_buckets - 1)
+        ORDER BY sparse_hash & (n_buckets - 1)
+    );
+    IF ARRAY_LENGTH(sparse_agg_state, 1) <= LEAST(n_buckets / 4, 4096) THEN
+        RETURN ARRAY[-hll_precision] || sparse_agg_state;
+    END IF;
+    RETURN hll_densify(ARRAY[-hll_precision] || sparse_agg_state);
+END $$;
+
+-- combines two sketches like `hll_bucket_combine`, reducing the sketch with
+-- the higher precision to the lower one first
+CREATE OR REPLACE FUNCTION hll_union_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    left_precision int := hll_state_precision(hll_left_agg_state);
+    right_precision int := hll_state_precision(hll_right_agg_state);
+BEGIN
+    IF left_precision > right_precision THEN
+        hll_left_agg_state := hll_reduce_precision(hll_left_agg_state, right_precision);
+    ELSIF right_precision > left_precision THEN
+        hll_right_agg_state := hll_reduce_precision(hll_right_agg_state, left_precision);
+    END IF;
+    RETURN hll_bucket_combine(hll_left_agg_state, hll_right_agg_state);
+END $$;
+
+-- merges stored sketches into a single sketch, at the lowest of their precisions
+-- NULL sketches are ignored
+CREATE OR REPLACE AGGREGATE hll_union(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union_cardinality(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
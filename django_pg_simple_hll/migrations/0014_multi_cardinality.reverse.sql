@@ -0,0 +1,6 @@
+DROP AGGREGATE IF EXISTS hll_multi_cardinality(int []);
+DROP AGGREGATE IF EXISTS hll_multi_cardinality(int [], int);
+DROP FUNCTION IF EXISTS hll_multi_approximate(int []);
+DROP FUNCTION IF EXISTS hll_multi_bucket_combine(int [], int []);
+DROP FUNCTION IF EXISTS hll_multi_bucket(int [], int []);
+DROP FUNCTION IF EXISTS hll_multi_bucket(int [], int [], int);
@@ -0,0 +1,125 @@
+-- Distinct counts of several columns in one scan
+-- the hashes of the columns of a row are aggregated together, with a single
+-- transition call per row rather than one per column, e.g.
+--  SELECT hll_multi_cardinality(ARRAY[hll_hash(user_uuid), hll_hash(user_int)], 11)
+--  FROM testapp_session
+-- returns the approximations of user_uuid and user_int, as `hll_cardinality` would
+-- the state is the precision, followed by the dense state of each column:
+--  at precision 4, the buckets of the first column are the elements 2 to 17,
+--  those of the second column the elements 18 to 33, and so on
+
+-- The state transition function
+-- hll_agg_state is the current running state, empty before the first row
+-- hashed_inputs are the int32 hashes of the columns of a row, NULL hashes are ignored
+-- hll_precision is the precision of every column
+CREATE OR REPLACE FUNCTION hll_multi_bucket(
+    hll_agg_state int [],
+    hashed_inputs int [],
+    hll_precision int
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    n_buckets int := 1 << hll_precision;
+    -- the index of the element before the buckets of the current column
+    column_offset int := 1;
+    hashed_input int;
+    bucket_key int;
+BEGIN
+    IF ARRAY_LENGTH(hll_agg_state, 1) IS NULL THEN
+        IF hll_precision < 4 OR hll_precision > 26 THEN
+            RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+                hll_precision;
+        END IF;
+        -- postgres fills the buckets up to the last one with NULLs
+        hll_agg_state[1] := hll_precision;
+        hll_agg_state[1 + n_buckets * ARRAY_LENGTH(hashed_inputs, 1)] := NULL;
+    END IF;
+
+    FOREACH hashed_input IN ARRAY hashed_inputs LOOP
+        IF hashed_input IS NOT NULL THEN
+            bucket_key := column_offset + (hashed_input & (n_buckets - 1)) + 1;
+            IF hll_agg_state[bucket_key] IS NULL OR hll_agg_state[bucket_key] > hashed_input THEN
+                hll_agg_state[bucket_key] := hashed_input;
+            END IF;
+        END IF;
+        column_offset := column_offset + n_buckets;
+    END LOOP;
+    RETURN hll_agg_state;
+END $$;
+
+-- the transition function with default precision of 9
+CREATE OR REPLACE FUNCTION hll_multi_bucket(
+    hll_agg_state int [],
+    hashed_inputs int []
+) RETURNS int []
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_multi_bucket(hll_agg_state, hashed_inputs, 9);
+$$;
+
+-- The combinefunc
+-- combines two states, taking the smaller hash from each corresponding bucket,
+-- the precisions are the same so they're kept as they are
+CREATE OR REPLACE FUNCTION hll_multi_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    ELSIF ARRAY_LENGTH(hll_left_agg_state, 1) <> ARRAY_LENGTH(hll_right_agg_state, 1) THEN
+        RAISE EXCEPTION 'cannot combine hll states of different precisions or columns: % and % elements',
+            ARRAY_LENGTH(hll_left_agg_state, 1), ARRAY_LENGTH(hll_right_agg_state, 1);
+    END IF;
+
+    RETURN ARRAY(
+        SELECT
+            LEAST(left_bucket_hash, right_bucket_hash)
+        FROM
+            UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+    );
+END $$;
+
+-- The finalfunc
+-- approximates the dense state of each column with `hll_approximate`,
+-- an empty state, without any row, returns NULL as the number of columns isn't known
+CREATE OR REPLACE FUNCTION hll_multi_approximate(
+    hll_agg_state int []
+) RETURNS int []
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT
+    CASE
+        WHEN ARRAY_LENGTH(hll_agg_state, 1) IS NOT NULL THEN ARRAY(
+            SELECT
+                hll_approximate(
+                    hll_agg_state[2 + column_index * n_buckets:1 + (column_index + 1) * n_buckets]
+                )
+            FROM
+                (SELECT 1 << hll_agg_state[1] AS n_buckets) AS n_buckets,
+                GENERATE_SERIES(0, (ARRAY_LENGTH(hll_agg_state, 1) - 1) / n_buckets - 1) AS column_index
+            ORDER BY column_index
+        )
+    END
+$$;
+
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int [], int) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+--  aggregation with default precision argument
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int []) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
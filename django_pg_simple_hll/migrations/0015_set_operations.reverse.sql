@@ -0,0 +1,11 @@
+DROP AGGREGATE IF EXISTS hll_kmv_union(int []);
+DROP AGGREGATE IF EXISTS hll_kmv_sketch(anyelement, int);
+DROP AGGREGATE IF EXISTS hll_kmv_sketch_from_hash(int, int);
+DROP FUNCTION IF EXISTS hll_kmv_intersection_cardinality(int [], int []);
+DROP FUNCTION IF EXISTS hll_kmv_cardinality(int []);
+DROP FUNCTION IF EXISTS hll_kmv_combine(int [], int []);
+DROP FUNCTION IF EXISTS hll_hash_and_kmv_add(int [], anyelement, int);
+DROP FUNCTION IF EXISTS hll_kmv_add(int [], int, int);
+DROP FUNCTION IF EXISTS hll_difference_cardinality(int [], int []);
+DROP FUNCTION IF EXISTS hll_intersection_cardinality(int [], int []);
+DROP FUNCTION IF EXISTS hll_set_cardinalities(int [], int []);
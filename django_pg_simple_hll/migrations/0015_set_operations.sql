@@ -0,0 +1,215 @@
+-- Set operations on sketches
+-- the union of two sketches is `hll_union_combine`, and the cardinalities of
+-- their intersection and difference follow from the inclusion-exclusion principle
+-- e.g. the users active on both days:
+--  SELECT hll_intersection_cardinality(day_x.sketch, day_y.sketch)
+--  FROM testapp_dailysketch day_x, testapp_dailysketch day_y
+--  WHERE day_x.date = '2023-05-01' AND day_y.date = '2023-05-02'
+-- the error of the intersection is the error of the union and of both sketches,
+-- so intersections much smaller than the union are better approximated
+-- with KMV sketches, see `hll_kmv_intersection_cardinality`
+
+-- the approximations of two sketches and of their union,
+-- at the lowest of their precisions, empty sketches have a cardinality of 0
+CREATE OR REPLACE FUNCTION hll_set_cardinalities(
+    hll_left_sketch int [],
+    hll_right_sketch int [],
+    OUT left_cardinality int,
+    OUT right_cardinality int,
+    OUT union_cardinality int
+)
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    hll_precision int := LEAST(
+        hll_state_precision(hll_left_sketch), hll_state_precision(hll_right_sketch)
+    );
+BEGIN
+    IF hll_precision IS NOT NULL THEN
+        hll_left_sketch := hll_reduce_precision(hll_left_sketch, hll_precision);
+        hll_right_sketch := hll_reduce_precision(hll_right_sketch, hll_precision);
+    END IF;
+    left_cardinality := COALESCE(hll_approximate(hll_left_sketch), 0);
+    right_cardinality := COALESCE(hll_approximate(hll_right_sketch), 0);
+    union_cardinality := COALESCE(
+        hll_approximate(hll_bucket_combine(hll_left_sketch, hll_right_sketch)), 0
+    );
+END $$;
+
+-- approximates the number of values in both sketches
+CREATE OR REPLACE FUNCTION hll_intersection_cardinality(
+    hll_left_sketch int [],
+    hll_right_sketch int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT GREATEST(left_cardinality + right_cardinality - union_cardinality, 0)
+FROM hll_set_cardinalities(hll_left_sketch, hll_right_sketch)
+$$;
+
+-- approximates the number of values in the left sketch but not in the right one
+CREATE OR REPLACE FUNCTION hll_difference_cardinality(
+    hll_left_sketch int [],
+    hll_right_sketch int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT GREATEST(union_cardinality - right_cardinality, 0)
+FROM hll_set_cardinalities(hll_left_sketch, hll_right_sketch)
+$$;
+
+-- KMV sketches
+-- a KMV (k minimum values) sketch keeps the k smallest distinct hashes seen,
+-- its first element is k, followed by the hashes in ascending order
+-- e.g. '{4, 12, 351, 2022}' has seen 3 distinct hashes, which are less than k
+-- the k smallest hashes of the union of two sketches are a uniform sample of the
+-- union, and the fraction of them in both sketches approximates the fraction
+-- of the union in the intersection, however small the intersection
+
+-- The state transition function
+-- hll_kmv_state is the current state, empty before the first row
+-- hashed_input is the int32 hash of any element we are considering
+-- hll_kmv_k is the number of hashes to keep
+CREATE OR REPLACE FUNCTION hll_kmv_add(
+    hll_kmv_state int [],
+    hashed_input int,
+    hll_kmv_k int
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    hll_kmv_state_length int := ARRAY_LENGTH(hll_kmv_state, 1);
+    -- bounds of the binary search over the hashes
+    lower_index int := 2;
+    upper_index int;
+    middle_index int;
+BEGIN
+    IF hll_kmv_state_length IS NULL THEN
+        IF hll_kmv_k < 1 THEN
+            RAISE EXCEPTION 'invalid hll_kmv_k: % - must be at least 1', hll_kmv_k;
+        END IF;
+        RETURN ARRAY[hll_kmv_k, hashed_input];
+    END IF;
+
+    -- the state is full, and the hash is greater than every hash kept
+    IF hll_kmv_state_length > hll_kmv_state[1] AND hashed_input >= hll_kmv_state[hll_kmv_state_length] THEN
+        RETURN hll_kmv_state;
+    END IF;
+
+    upper_index := hll_kmv_state_length;
+    WHILE lower_index <= upper_index LOOP
+        middle_index := (lower_index + upper_index) / 2;
+        IF hll_kmv_state[middle_index] = hashed_input THEN
+            RETURN hll_kmv_state;
+        ELSIF hll_kmv_state[middle_index] < hashed_input THEN
+            lower_index := middle_index + 1;
+        ELSE
+            upper_index := middle_index - 1;
+        END IF;
+    END LOOP;
+
+    hll_kmv_state := hll_kmv_state[:lower_index - 1] || hashed_input || hll_kmv_state[lower_index:];
+    -- drop the greatest hash once there are more than k
+    IF hll_kmv_state_length > hll_kmv_state[1] THEN
+        RETURN hll_kmv_state[:hll_kmv_state_length];
+    END IF;
+    RETURN hll_kmv_state;
+END $$;
+
+-- hash and add in one function
+CREATE OR REPLACE FUNCTION hll_hash_and_kmv_add(
+    hll_kmv_state int [],
+    input anyelement,
+    hll_kmv_k int
+) RETURNS int []
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT hll_kmv_add(hll_kmv_state, hll_hash(input), hll_kmv_k);
+$$;
+
+-- The combinefunc
+-- keeps the k smallest distinct hashes of both states,
+-- with the smallest k of both so that the result is a sample of the union
+CREATE OR REPLACE FUNCTION hll_kmv_combine(
+    hll_left_kmv_state int [],
+    hll_right_kmv_state int []
+) RETURNS int []
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT CASE
+    -- a parallel worker that saw no rows hands over an empty state
+    WHEN ARRAY_LENGTH(hll_left_kmv_state, 1) IS NULL THEN hll_right_kmv_state
+    WHEN ARRAY_LENGTH(hll_right_kmv_state, 1) IS NULL THEN hll_left_kmv_state
+    ELSE LEAST(hll_left_kmv_state[1], hll_right_kmv_state[1]) || ARRAY(
+        SELECT DISTINCT kmv_hash
+        FROM UNNEST(hll_left_kmv_state[2:] || hll_right_kmv_state[2:]) AS kmv_hash
+        ORDER BY kmv_hash
+        LIMIT LEAST(hll_left_kmv_state[1], hll_right_kmv_state[1])
+    )
+END
+$$;
+
+-- approximates the cardinality of a KMV sketch:
+-- the exact count of its hashes if it has less than k,
+-- otherwise (k - 1) divided by the fraction of hashes up to its greatest one
+CREATE OR REPLACE FUNCTION hll_kmv_cardinality(
+    hll_kmv_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT CASE
+    WHEN ARRAY_LENGTH(hll_kmv_state, 1) IS NULL THEN 0
+    WHEN ARRAY_LENGTH(hll_kmv_state, 1) - 1 < hll_kmv_state[1] THEN ARRAY_LENGTH(hll_kmv_state, 1) - 1
+    ELSE ROUND(
+        (hll_kmv_state[1] - 1) * 2147483648.0 / (hll_kmv_state[ARRAY_LENGTH(hll_kmv_state, 1)]::bigint + 1)
+    )::int
+END
+$$;
+
+-- approximates the number of values in both KMV sketches:
+-- the hashes of their union that are in both sketches, exactly if the union has
+-- less than k hashes, otherwise divided by the fraction of hashes up to its greatest one
+CREATE OR REPLACE FUNCTION hll_kmv_intersection_cardinality(
+    hll_left_kmv_state int [],
+    hll_right_kmv_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT CASE
+    WHEN ARRAY_LENGTH(union_state, 1) IS NULL THEN 0
+    WHEN ARRAY_LENGTH(union_state, 1) - 1 < union_state[1] THEN n_shared_hashes
+    ELSE ROUND(
+        n_shared_hashes * (union_state[1] - 1)::numeric / union_state[1]
+        * 2147483648.0 / (union_state[ARRAY_LENGTH(union_state, 1)]::bigint + 1)
+    )::int
+END
+FROM
+    (SELECT hll_kmv_combine(hll_left_kmv_state, hll_right_kmv_state) AS union_state) AS union_state,
+    LATERAL (
+        -- every hash of the union is less than the greatest hash of both sketches,
+        -- so it's in a sketch if and only if it's in the set the sketch has seen
+        SELECT COUNT(*)::int AS n_shared_hashes
+        FROM UNNEST(union_state[2:]) AS kmv_hash
+        WHERE
+            kmv_hash = ANY(hll_left_kmv_state[2:])
+            AND kmv_hash = ANY(hll_right_kmv_state[2:])
+    ) AS shared
+$$;
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch_from_hash(int, int) (
+    SFUNC = hll_kmv_add,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_kmv_add,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+-- merges stored KMV sketches into a single sketch, with the smallest of their k
+-- NULL sketches are ignored
+CREATE OR REPLACE AGGREGATE hll_kmv_union(int []) (
+    SFUNC = hll_kmv_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
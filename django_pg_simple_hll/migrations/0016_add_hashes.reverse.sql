@@ -0,0 +1 @@
+DROP FUNCTION IF EXISTS hll_add_hashes(int [], int [], int);
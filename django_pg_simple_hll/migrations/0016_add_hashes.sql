@@ -0,0 +1,47 @@
+-- Adding batches of hashes to stored sketches
+-- `hll_add_hashes` adds every hash of an array to a state in one call, e.g. to
+-- keep a live counter of the events of a batch, without a transition call per hash
+--  UPDATE counters SET sketch = hll_add_hashes(sketch, ARRAY[hll_hash('a'), hll_hash('b')])
+-- the result is the same state as aggregating the hashes with `hll_sketch_from_hash`,
+-- and merging it into the state
+
+-- hll_agg_state is the stored state, which may be empty or NULL
+-- hashed_inputs are the int32 hashes to add, NULL hashes are ignored
+-- hll_precision is the precision of an empty state, a state keeps its own precision
+CREATE OR REPLACE FUNCTION hll_add_hashes(
+    hll_agg_state int [],
+    hashed_inputs int [],
+    hll_precision int DEFAULT 9
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    n_buckets int;
+    batch_agg_state int [];
+BEGIN
+    hll_agg_state := COALESCE(hll_agg_state, '{}');
+    hll_precision := COALESCE(hll_state_precision(hll_agg_state), hll_precision);
+    IF hll_precision < 4 OR hll_precision > 26 THEN
+        RAISE EXCEPTION 'invalid hll_precision: % - must be between 4 (16 buckets) and 26 (67,108,864 buckets) inclusive',
+            hll_precision;
+    END IF;
+    n_buckets := 1 << hll_precision;
+
+    -- the sparse state of the batch: the smallest hash of each bucket, sorted by bucket
+    batch_agg_state := ARRAY(
+        SELECT MIN(hashed_input)
+        FROM UNNEST(hashed_inputs) AS hashed_input
+        WHERE hashed_input IS NOT NULL
+        GROUP BY hashed_input & (n_buckets - 1)
+        ORDER BY hashed_input & (n_buckets - 1)
+    );
+    IF ARRAY_LENGTH(batch_agg_state, 1) IS NULL THEN
+        RETURN hll_agg_state;
+    END IF;
+
+    batch_agg_state := -hll_precision || batch_agg_state;
+    -- with the same threshold as `hll_bucket`
+    IF ARRAY_LENGTH(batch_agg_state, 1) - 1 > LEAST(n_buckets / 4, 4096) THEN
+        batch_agg_state := hll_densify(batch_agg_state);
+    END IF;
+    RETURN hll_bucket_combine(hll_agg_state, batch_agg_state);
+END $$;
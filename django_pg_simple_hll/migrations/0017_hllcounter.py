@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:23
+
+from django.db import migrations, models
+
+import django_pg_simple_hll.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_pg_simple_hll", "0016_add_hashes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HLLCounter",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("sketch", django_pg_simple_hll.fields.HLLSketchField(default=list)),
+            ],
+        ),
+    ]
@@ -0,0 +1,163 @@
+CREATE OR REPLACE AGGREGATE hll_cardinality_from_hash(int, int) (
+    SFUNC = hll_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality(anyelement, int) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality(anyelement) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch_from_hash(int, int) (
+    SFUNC = hll_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union_cardinality(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality_from_hash(int, int) (
+    SFUNC = hll_compact_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement, int) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64_from_hash(bigint, int) (
+    SFUNC = hll_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement, int) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int [], int) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int []) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch_from_hash(int, int) (
+    SFUNC = hll_kmv_add,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_kmv_add,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_union(int []) (
+    SFUNC = hll_kmv_combine,
+    STYPE = int [],
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
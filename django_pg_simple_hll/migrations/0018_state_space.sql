@@ -0,0 +1,195 @@
+-- The size of the aggregation states
+-- without SSPACE, the planner assumes that every state is as small as a varlena
+-- of unknown width, and picks a HashAggregate for any number of groups, however
+-- much memory their states use.
+-- SSPACE is the size of the dense state at the default precision of 9, as the
+-- planner can't take the precision argument into account:
+-- - int []: 24 bytes of header, a NULL bitmap of 64 bytes and 512 int buckets,
+--   2136 bytes, or 4260 bytes for `hll_multi_cardinality` of 2 columns
+-- - bytea: 4 bytes of header and 512 byte buckets, 516 bytes
+-- - KMV sketches: 24 bytes of header and 1025 ints, for k = 1024, 4124 bytes
+-- states of higher precisions are much larger, see `memory.hll_memory_guard`,
+-- which estimates them from the precision of each aggregate
+
+CREATE OR REPLACE AGGREGATE hll_cardinality_from_hash(int, int) (
+    SFUNC = hll_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality(anyelement, int) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality(anyelement) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch_from_hash(int, int) (
+    SFUNC = hll_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_sketch(anyelement) (
+    SFUNC = hll_hash_and_bucket,
+    STYPE = int [],
+    SSPACE = 2136,
+    COMBINEFUNC = hll_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    SSPACE = 2136,
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_union_cardinality(int []) (
+    SFUNC = hll_union_combine,
+    STYPE = int [],
+    SSPACE = 2136,
+    FINALFUNC = hll_approximate,
+    COMBINEFUNC = hll_union_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality_from_hash(int, int) (
+    SFUNC = hll_compact_bucket,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement, int) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_compact_cardinality(anyelement) (
+    SFUNC = hll_compact_hash_and_bucket,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_compact_approximate,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64_from_hash(bigint, int) (
+    SFUNC = hll_bucket64,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement, int) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_cardinality64(anyelement) (
+    SFUNC = hll_hash_and_bucket64,
+    STYPE = bytea,
+    SSPACE = 516,
+    FINALFUNC = hll_approximate64,
+    COMBINEFUNC = hll_compact_bucket_combine,
+    INITCOND = '',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int [], int) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    SSPACE = 4260,
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_multi_cardinality(int []) (
+    SFUNC = hll_multi_bucket,
+    STYPE = int [],
+    SSPACE = 4260,
+    FINALFUNC = hll_multi_approximate,
+    COMBINEFUNC = hll_multi_bucket_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch_from_hash(int, int) (
+    SFUNC = hll_kmv_add,
+    STYPE = int [],
+    SSPACE = 4124,
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_sketch(anyelement, int) (
+    SFUNC = hll_hash_and_kmv_add,
+    STYPE = int [],
+    SSPACE = 4124,
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
+
+CREATE OR REPLACE AGGREGATE hll_kmv_union(int []) (
+    SFUNC = hll_kmv_combine,
+    STYPE = int [],
+    SSPACE = 4124,
+    COMBINEFUNC = hll_kmv_combine,
+    INITCOND = '{}',
+    PARALLEL = SAFE
+);
@@ -0,0 +1,82 @@
+DO $do$
+DECLARE
+    hll_precision int;
+BEGIN
+    FOR hll_precision IN 4..26 LOOP
+        EXECUTE FORMAT('DROP AGGREGATE IF EXISTS hll_cardinality_p%s(anyelement)', hll_precision);
+        EXECUTE FORMAT('DROP AGGREGATE IF EXISTS hll_cardinality_from_hash_p%s(int)', hll_precision);
+        EXECUTE FORMAT('DROP FUNCTION IF EXISTS hll_hash_and_bucket_p%s(int [], anyelement)', hll_precision);
+        EXECUTE FORMAT('DROP FUNCTION IF EXISTS hll_bucket_p%s(int [], int)', hll_precision);
+    END LOOP;
+END $do$;
+
+DROP FUNCTION IF EXISTS hll_variant_approximate(int []);
+
+CREATE OR REPLACE FUNCTION hll_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    left_n_buckets int;
+    right_n_buckets int;
+    sparse_agg_state int [];
+    bucket_hash int;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    END IF;
+
+    left_n_buckets := CASE
+        WHEN hll_left_agg_state[1] < 0 THEN 1 << -hll_left_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_left_agg_state, 1)
+    END;
+    right_n_buckets := CASE
+        WHEN hll_right_agg_state[1] < 0 THEN 1 << -hll_right_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_right_agg_state, 1)
+    END;
+    IF left_n_buckets <> right_n_buckets THEN
+        RAISE EXCEPTION 'cannot combine hll states of different precisions: % and % buckets',
+            left_n_buckets, right_n_buckets;
+    END IF;
+
+    IF hll_left_agg_state[1] < 0 AND hll_right_agg_state[1] < 0 THEN
+        -- keep the smallest hash of each bucket, sorted by bucket
+        sparse_agg_state := ARRAY(
+            SELECT MIN(sparse_hash)
+            FROM UNNEST(hll_left_agg_state[2:] || hll_right_agg_state[2:]) AS sparse_hash
+            GROUP BY sparse_hash & (left_n_buckets - 1)
+            ORDER BY sparse_hash & (left_n_buckets - 1)
+        );
+        -- with the same threshold as `hll_bucket`
+        IF ARRAY_LENGTH(sparse_agg_state, 1) <= LEAST(left_n_buckets / 4, 4096) THEN
+            RETURN hll_left_agg_state[1] || sparse_agg_state;
+        END IF;
+        RETURN hll_densify(hll_left_agg_state[1] || sparse_agg_state);
+    END IF;
+
+    IF hll_left_agg_state[1] >= 0 OR hll_left_agg_state[1] IS NULL THEN
+        IF hll_right_agg_state[1] >= 0 OR hll_right_agg_state[1] IS NULL THEN
+            RETURN ARRAY(
+                SELECT
+                    LEAST(left_bucket_hash, right_bucket_hash)
+                FROM
+                    UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+            );
+        END IF;
+        sparse_agg_state := hll_right_agg_state;
+    ELSE
+        sparse_agg_state := hll_left_agg_state;
+        hll_left_agg_state := hll_right_agg_state;
+    END IF;
+
+    FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+        hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1] := LEAST(
+            hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1], bucket_hash
+        );
+    END LOOP;
+    RETURN hll_left_agg_state;
+END $$;
@@ -0,0 +1,211 @@
+-- Transition functions specialised by precision
+-- `hll_bucket` checks the precision, computes the number of buckets and tests for
+-- an empty state on every row, and `hll_hash_and_bucket` calls it through a SQL
+-- function, which hands it the state read-only, so that it's copied on every row.
+-- The variants of each precision p, from 4 to 26, are generated below:
+--  hll_bucket_p<p>(hll_agg_state int [], hashed_input int)
+--  hll_hash_and_bucket_p<p>(hll_agg_state int [], input anyelement)
+-- with the bucket mask and the sparse threshold of the precision as constants,
+-- and the hashing inlined. Their aggregates start from an empty sparse state of
+-- the precision, '{-p}', as INITCOND, so that the transition functions never see
+-- an empty state, and the precision is checked once, when the aggregate is chosen:
+--  hll_cardinality_p<p>(anyelement)
+--  hll_cardinality_from_hash_p<p>(int)
+-- e.g. hll_cardinality_p11(user_uuid) is the same as hll_cardinality(user_uuid, 11).
+-- The state is still copied on every row: postgres flattens the arrays that plpgsql
+-- hands back to an aggregate, so that only C transition functions update it in place.
+-- `aggregate.HLLCardinality` and `aggregate.HLLCardinalityFromHash` use them
+-- when their precision is a constant.
+-- Like the other aggregates, SSPACE is the size of a dense state of the precision.
+
+-- the finalfunc of the variants, NULL for groups without rows,
+-- like `hll_approximate` of an empty state
+CREATE OR REPLACE FUNCTION hll_variant_approximate(
+    hll_agg_state int []
+) RETURNS int
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT CASE WHEN CARDINALITY(hll_agg_state) > 1 THEN hll_approximate(hll_agg_state) END
+$$;
+
+-- `hll_bucket_combine` of migration 0010, which densified the merge of 2 sparse
+-- states without hashes, e.g. '{-9}': the variants start from one, and their
+-- parallel workers that see no rows of a group hand it over
+CREATE OR REPLACE FUNCTION hll_bucket_combine(
+    hll_left_agg_state int [],
+    hll_right_agg_state int []
+) RETURNS int []
+LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+DECLARE
+    left_n_buckets int;
+    right_n_buckets int;
+    sparse_agg_state int [];
+    bucket_hash int;
+BEGIN
+    -- a parallel worker that saw no rows hands over an empty state
+    IF ARRAY_LENGTH(hll_left_agg_state, 1) IS NULL THEN
+        RETURN hll_right_agg_state;
+    ELSIF ARRAY_LENGTH(hll_right_agg_state, 1) IS NULL THEN
+        RETURN hll_left_agg_state;
+    END IF;
+
+    left_n_buckets := CASE
+        WHEN hll_left_agg_state[1] < 0 THEN 1 << -hll_left_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_left_agg_state, 1)
+    END;
+    right_n_buckets := CASE
+        WHEN hll_right_agg_state[1] < 0 THEN 1 << -hll_right_agg_state[1]
+        ELSE ARRAY_LENGTH(hll_right_agg_state, 1)
+    END;
+    IF left_n_buckets <> right_n_buckets THEN
+        RAISE EXCEPTION 'cannot combine hll states of different precisions: % and % buckets',
+            left_n_buckets, right_n_buckets;
+    END IF;
+
+    IF hll_left_agg_state[1] < 0 AND hll_right_agg_state[1] < 0 THEN
+        -- keep the smallest hash of each bucket, sorted by bucket
+        sparse_agg_state := ARRAY(
+            SELECT MIN(sparse_hash)
+            FROM UNNEST(hll_left_agg_state[2:] || hll_right_agg_state[2:]) AS sparse_hash
+            GROUP BY sparse_hash & (left_n_buckets - 1)
+            ORDER BY sparse_hash & (left_n_buckets - 1)
+        );
+        -- with the same threshold as `hll_bucket`
+        IF CARDINALITY(sparse_agg_state) <= LEAST(left_n_buckets / 4, 4096) THEN
+            RETURN hll_left_agg_state[1] || sparse_agg_state;
+        END IF;
+        RETURN hll_densify(hll_left_agg_state[1] || sparse_agg_state);
+    END IF;
+
+    IF hll_left_agg_state[1] >= 0 OR hll_left_agg_state[1] IS NULL THEN
+        IF hll_right_agg_state[1] >= 0 OR hll_right_agg_state[1] IS NULL THEN
+            RETURN ARRAY(
+                SELECT
+                    LEAST(left_bucket_hash, right_bucket_hash)
+                FROM
+                    UNNEST(hll_left_agg_state, hll_right_agg_state) AS AGG_STATE(left_bucket_hash, right_bucket_hash)
+            );
+        END IF;
+        sparse_agg_state := hll_right_agg_state;
+    ELSE
+        sparse_agg_state := hll_left_agg_state;
+        hll_left_agg_state := hll_right_agg_state;
+    END IF;
+
+    FOREACH bucket_hash IN ARRAY sparse_agg_state[2:] LOOP
+        hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1] := LEAST(
+            hll_left_agg_state[(bucket_hash & (left_n_buckets - 1)) + 1], bucket_hash
+        );
+    END LOOP;
+    RETURN hll_left_agg_state;
+END $$;
+
+DO $do$
+DECLARE
+    hll_precision int;
+    -- %1$s is the bucket mask, %2$s the number of hashes of a sparse state
+    -- at most, with the same threshold as `hll_bucket`
+    bucket_body text := $body$
+    -- bounds of the binary search over a sparse state
+    lower_index int := 2;
+    upper_index int;
+    middle_index int;
+    middle_bucket_key int;
+    bucket_key int;
+BEGIN
+    bucket_key := hashed_input & %1$s;
+    IF hll_agg_state[1] < 0 THEN
+        upper_index := CARDINALITY(hll_agg_state);
+        WHILE lower_index <= upper_index LOOP
+            middle_index := (lower_index + upper_index) / 2;
+            middle_bucket_key := hll_agg_state[middle_index] & %1$s;
+            IF middle_bucket_key = bucket_key THEN
+                IF hll_agg_state[middle_index] > hashed_input THEN
+                    hll_agg_state[middle_index] := hashed_input;
+                END IF;
+                RETURN hll_agg_state;
+            ELSIF middle_bucket_key < bucket_key THEN
+                lower_index := middle_index + 1;
+            ELSE
+                upper_index := middle_index - 1;
+            END IF;
+        END LOOP;
+
+        -- the bucket hasn't been seen, insert it in order while the state is small enough
+        IF CARDINALITY(hll_agg_state) - 1 < %2$s THEN
+            RETURN hll_agg_state[:lower_index - 1] || hashed_input || hll_agg_state[lower_index:];
+        END IF;
+        hll_agg_state := hll_densify(hll_agg_state);
+    END IF;
+
+    -- we add 1 because postgres arrays are 1-indexed
+    IF hll_agg_state[bucket_key + 1] IS NULL OR hll_agg_state[bucket_key + 1] > hashed_input THEN
+        hll_agg_state[bucket_key + 1] := hashed_input;
+    END IF;
+    RETURN hll_agg_state;
+END
+$body$;
+    n_buckets int;
+BEGIN
+    FOR hll_precision IN 4..26 LOOP
+        n_buckets := 1 << hll_precision;
+
+        EXECUTE FORMAT(
+            $sql$
+            CREATE OR REPLACE FUNCTION hll_bucket_p%1$s(
+                hll_agg_state int [],
+                hashed_input int
+            ) RETURNS int []
+            LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS %2$L
+            $sql$,
+            hll_precision,
+            'DECLARE' || FORMAT(bucket_body, n_buckets - 1, LEAST(n_buckets / 4, 4096))
+        );
+
+        -- the same hash as `hll_hash`
+        EXECUTE FORMAT(
+            $sql$
+            CREATE OR REPLACE FUNCTION hll_hash_and_bucket_p%1$s(
+                hll_agg_state int [],
+                input anyelement
+            ) RETURNS int []
+            LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS %2$L
+            $sql$,
+            hll_precision,
+            'DECLARE hashed_input int := HASHTEXT(input::text) & 2147483647;'
+            || FORMAT(bucket_body, n_buckets - 1, LEAST(n_buckets / 4, 4096))
+        );
+
+        EXECUTE FORMAT(
+            $sql$
+            CREATE OR REPLACE AGGREGATE hll_cardinality_from_hash_p%1$s(int) (
+                SFUNC = hll_bucket_p%1$s,
+                STYPE = int [],
+                SSPACE = %2$s,
+                FINALFUNC = hll_variant_approximate,
+                COMBINEFUNC = hll_bucket_combine,
+                INITCOND = '{-%1$s}',
+                PARALLEL = SAFE
+            )
+            $sql$,
+            hll_precision,
+            -- the header of the array, its NULL bitmap and the buckets
+            (24 + n_buckets / 8 + 7) / 8 * 8 + 4 * n_buckets
+        );
+
+        EXECUTE FORMAT(
+            $sql$
+            CREATE OR REPLACE AGGREGATE hll_cardinality_p%1$s(anyelement) (
+                SFUNC = hll_hash_and_bucket_p%1$s,
+                STYPE = int [],
+                SSPACE = %2$s,
+                FINALFUNC = hll_variant_approximate,
+                COMBINEFUNC = hll_bucket_combine,
+                INITCOND = '{-%1$s}',
+                PARALLEL = SAFE
+            )
+            $sql$,
+            hll_precision,
+            (24 + n_buckets / 8 + 7) / 8 * 8 + 4 * n_buckets
+        );
+    END LOOP;
+END $do$;
@@ -0,0 +1,72 @@
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+from .fields import HLLSketchField
+from .hashing import hll_hash
+
+
+class HLLRollupWatermark(models.Model):
+    """
+    The high-water mark of an `rollup.HLLRollup`:
+    the greatest value of its watermark field that has been merged into its sketches
+
+    The value is stored as text, which the watermark field converts back
+    with its `to_python` method.
+    """
+
+    name = models.CharField(max_length=255, primary_key=True)
+    value = models.TextField(null=True)
+
+
+class HLLCounterManager(models.Manager["HLLCounter"]):
+    def increment(
+        self,
+        key: str,
+        values: Iterable[Any],
+        precision: int = 9,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> None:
+        """
+        Add a batch of values to the sketch of a counter, creating it if needed,
+        in a single `INSERT ... ON CONFLICT` statement
+
+        The values are hashed in python, see `hashing.hll_hash`, and NULL values are
+        ignored. The precision is the precision of new counters, existing counters
+        keep their own.
+        """
+        hashes = [hll_hash(value) for value in values if value is not None]
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        table = quote_name(opts.db_table)
+        key_column = quote_name(opts.get_field("key").column)
+        sketch_column = quote_name(opts.get_field("sketch").column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({key_column}, {sketch_column}) "
+                f"VALUES (%s, hll_add_hashes('{{}}', %s::int[], %s)) "
+                f"ON CONFLICT ({key_column}) DO UPDATE "
+                f"SET {sketch_column} = hll_add_hashes({table}.{sketch_column}, %s::int[])",
+                [key, hashes, precision, hashes],
+            )
+
+
+class HLLCounter(models.Model):
+    """
+    A live distinct count, e.g. of the users of a page, kept in a sketch
+    that values are added to in batches with `HLLCounter.objects.increment`
+
+    e.g.
+    HLLCounter.objects.increment("page:42", [user.uuid for user in visitors])
+    HLLCounter.objects.annotate(n=HLLSketchCardinality("sketch")).get(key="page:42")
+
+    Counters can also be kept up to date by postgres on inserts into a model,
+    see `operations.AddHLLCounterTrigger`.
+    """
+
+    key = models.CharField(max_length=255, primary_key=True)
+    sketch = HLLSketchField(default=list)
+
+    objects = HLLCounterManager()
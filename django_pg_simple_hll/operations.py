@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Sequence
+from typing import Any
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.migrations.operations.base import Operation
+from django.db.migrations.state import ProjectState
+
+# the generated hash columns of each database, see `get_hash_columns`
+_hash_columns: dict[str, dict[tuple[str, str], str]] = {}
+
+# how postgres prints the expression of a generated hash column, e.g. hll_hash(user_uuid)
+_HASH_EXPRESSION = re.compile(r'^hll_hash\((?:"((?:[^"]|"")+)"|([^"()]+))\)$')
+
+
+def get_hash_columns(connection: BaseDatabaseWrapper) -> dict[tuple[str, str], str]:
+    """
+    The hash columns generated by postgres with `hll_hash`, e.g. by `AddHLLHashColumn`,
+    by table and column they're generated from
+
+    They're read from the database once, and again after `AddHLLHashColumn` runs.
+    """
+    if connection.vendor != "postgresql":
+        return {}
+    if connection.alias not in _hash_columns:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, column_name, generation_expression "
+                "FROM information_schema.columns "
+                "WHERE is_generated = 'ALWAYS' "
+                "AND table_schema = ANY(CURRENT_SCHEMAS(false))"
+            )
+            hash_columns = {}
+            for table, column, expression in cursor.fetchall():
+                match = _HASH_EXPRESSION.match(expression)
+                if match:
+                    quoted_source, source = match.groups()
+                    source = source or quoted_source.replace('""', '"')
+                    hash_columns[table, source] = column
+        _hash_columns[connection.alias] = hash_columns
+    return _hash_columns[connection.alias]
+
+
+def clear_hash_columns() -> None:
+    """Read the hash columns from the database again the next time they're needed"""
+    _hash_columns.clear()
+
+
+class AddHLLHashColumn(Operation):
+    """
+    Add a column generated by postgres from a field, with `hll_hash`,
+    and optionally an index on some other fields followed by the hash
+
+    e.g. `AddHLLHashColumn("session", "user_uuid", index_fields=["created"])`
+    adds a `user_uuid_hll_hash` column to the table of `Session`, and an index
+    on `created` and `user_uuid_hll_hash`.
+
+    The column isn't a field of the model, postgres keeps it up to date.
+    `aggregate.HLLCardinality`, `aggregate.HLLCompactCardinality` and
+    `aggregate.HLLSketch` of the field aggregate the column instead of hashing
+    the field, and the index can cover aggregates filtered or grouped by its fields.
+    """
+
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(
+        self,
+        model_name: str,
+        field: str,
+        column: str | None = None,
+        index_fields: Sequence[str] = (),
+    ) -> None:
+        self.model_name = model_name
+        self.field = field
+        self.column = column
+        self.index_fields = list(index_fields)
+
+    def deconstruct(self) -> tuple[str, list[Any], dict[str, Any]]:
+        kwargs: dict[str, Any] = {"model_name": self.model_name, "field": self.field}
+        if self.column is not None:
+            kwargs["column"] = self.column
+        if self.index_fields:
+            kwargs["index_fields"] = self.index_fields
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label: str, state: ProjectState) -> None:
+        # the column isn't a field of the model
+        pass
+
+    def database_forwards(
+        self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+
+        quote_name = schema_editor.quote_name
+        table = model._meta.db_table
+        source_column = model._meta.get_field(self.field).column
+        column = self.column or f"{source_column}_hll_hash"
+        schema_editor.execute(
+            f"ALTER TABLE {quote_name(table)} ADD COLUMN {quote_name(column)} int "
+            f"GENERATED ALWAYS AS (hll_hash({quote_name(source_column)})) STORED"
+        )
+        if self.index_fields:
+            index_columns = [
+                *(model._meta.get_field(name).column for name in self.index_fields),
+                column,
+            ]
+            index_name = schema_editor._create_index_name(  # type: ignore[attr-defined]
+                table, index_columns, suffix="_hll"
+            )
+            schema_editor.execute(
+                f"CREATE INDEX {quote_name(index_name)} ON {quote_name(table)} "
+                f"({', '.join(quote_name(index_column) for index_column in index_columns)})"
+            )
+        clear_hash_columns()
+
+    def database_backwards(
+        self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+
+        # the index is dropped with the column
+        source_column = model._meta.get_field(self.field).column
+        schema_editor.execute(
+            f"ALTER TABLE {schema_editor.quote_name(model._meta.db_table)} DROP COLUMN "
+            f"{schema_editor.quote_name(self.column or f'{source_column}_hll_hash')}"
+        )
+        clear_hash_columns()
+
+    def describe(self) -> str:
+        return f"Add a HLL hash column of {self.model_name}.{self.field}"
+
+    @property
+    def migration_name_fragment(self) -> str:
+        return f"{self.model_name.lower()}_{self.field.lower()}_hll_hash"
+
+
+class AddHLLCounterTrigger(Operation):
+    """
+    Add a trigger that adds the values of a field of the rows inserted into a model
+    to `models.HLLCounter` counters, with `hll_add_hashes`
+
+    e.g. `AddHLLCounterTrigger("session", "user_uuid", name="users", key_field="group")`
+    keeps a counter of the users of each group, with keys like `users:<group id>`,
+    or a single `users` counter without `key_field`. Rows with a NULL key are ignored.
+
+    The trigger runs once per INSERT statement, and merges the hashes of all its rows
+    in a single `INSERT ... ON CONFLICT` statement. New counters have the given
+    precision, rows inserted before the trigger aren't counted.
+    """
+
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(
+        self,
+        model_name: str,
+        field: str,
+        name: str,
+        key_field: str | None = None,
+        precision: int = 9,
+    ) -> None:
+        self.model_name = model_name
+        self.field = field
+        self.name = name
+        self.key_field = key_field
+        self.precision = precision
+
+    def deconstruct(self) -> tuple[str, list[Any], dict[str, Any]]:
+        kwargs: dict[str, Any] = {
+            "model_name": self.model_name,
+            "field": self.field,
+            "name": self.name,
+        }
+        if self.key_field is not None:
+            kwargs["key_field"] = self.key_field
+        if self.precision != 9:
+            kwargs["precision"] = self.precision
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label: str, state: ProjectState) -> None:
+        # the trigger isn't part of the model
+        pass
+
+    def _get_trigger_name(
+        self, schema_editor: BaseDatabaseSchemaEditor, table: str, column: str
+    ) -> str:
+        return schema_editor._create_index_name(  # type: ignore[attr-defined]
+            table, [column, self.name], suffix="_hll_counter"
+        )
+
+    def database_forwards(
+        self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        from .models import HLLCounter
+
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+
+        quote_name = schema_editor.quote_name
+        table = model._meta.db_table
+        source_column = model._meta.get_field(self.field).column
+        column = quote_name(source_column)
+        counter_opts = HLLCounter._meta
+        counter_table = quote_name(counter_opts.db_table)
+        key_column = quote_name(counter_opts.get_field("key").column)
+        sketch_column = quote_name(counter_opts.get_field("sketch").column)
+        name = schema_editor.quote_value(self.name)
+        if self.key_field is None:
+            key, where = name, ""
+        else:
+            key_field_column = quote_name(model._meta.get_field(self.key_field).column)
+            key = f"{name} || ':' || {key_field_column}::text"
+            where = f"WHERE {key_field_column} IS NOT NULL "
+        trigger_name = quote_name(
+            self._get_trigger_name(schema_editor, table, source_column)
+        )
+
+        schema_editor.execute(
+            f"CREATE FUNCTION {trigger_name}() RETURNS trigger "
+            f"LANGUAGE plpgsql AS $$ BEGIN "
+            f"INSERT INTO {counter_table} ({key_column}, {sketch_column}) "
+            f"SELECT {key}, hll_add_hashes('{{}}', ARRAY_AGG(hll_hash({column})), "
+            f"{int(self.precision)}) "
+            f"FROM hll_new_rows {where}GROUP BY 1 "
+            f"ON CONFLICT ({key_column}) DO UPDATE "
+            f"SET {sketch_column} = hll_union_combine("
+            f"{counter_table}.{sketch_column}, EXCLUDED.{sketch_column}); "
+            f"RETURN NULL; END $$"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {trigger_name} AFTER INSERT ON {quote_name(table)} "
+            f"REFERENCING NEW TABLE AS hll_new_rows "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {trigger_name}()"
+        )
+
+    def database_backwards(
+        self,
+        app_label: str,
+        schema_editor: BaseDatabaseSchemaEditor,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+
+        # the trigger is dropped with its function
+        trigger_name = self._get_trigger_name(
+            schema_editor,
+            model._meta.db_table,
+            model._meta.get_field(self.field).column,
+        )
+        schema_editor.execute(
+            f"DROP FUNCTION {schema_editor.quote_name(trigger_name)}() CASCADE"
+        )
+
+    def describe(self) -> str:
+        return f"Add a HLL counter trigger of {self.model_name}.{self.field}"
+
+    @property
+    def migration_name_fragment(self) -> str:
+        return f"{self.model_name.lower()}_{self.field.lower()}_hll_counter"
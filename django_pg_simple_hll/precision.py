@@ -0,0 +1,115 @@
+"""
+Choosing the precision of HLL aggregates from a target error,
+see `aggregate.HLLAutoPrecisionMixin`
+
+The error of a precision is the relative standard error of the approximation of
+`aggregate.HLLCardinality` at that precision, for an expected cardinality:
+
+- under 2.5 times the number of buckets, `hll_approximate` uses linear counting,
+  whose standard error is `sqrt(m * (e^t - t - 1)) / n` for n values in m buckets,
+  with t = n / m (Whang et al.), and whose estimate is biased by `alpha / ln(2)`
+- above, the HyperLogLog estimate has a standard error of `1.04 / sqrt(m)`
+- the 31 bit hashes of n values collide, which biases estimates by about n / 2^32
+"""
+
+from __future__ import annotations
+
+from math import exp, log, sqrt
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+from .sketch import _alpha
+
+MIN_PRECISION = 4
+MAX_PRECISION = 26
+
+# the error of the default precision of 9 for large cardinalities, about 4.6%
+DEFAULT_TARGET_ERROR = 0.05
+
+# at most this many distinct values are counted exactly with COUNT(DISTINCT ...),
+# sorting rows with few distinct values is faster than hashing them
+DEFAULT_EXACT_THRESHOLD = 1000
+
+
+def standard_error(precision: int, cardinality: float | None = None) -> float:
+    """
+    The relative standard error of the approximation at a precision,
+    for an expected cardinality, or for large cardinalities when it's unknown
+    """
+    n_buckets = 1 << precision
+    if cardinality is None:
+        return 1.04 / sqrt(n_buckets)
+    if cardinality <= 0:
+        return 0.0
+
+    collision_bias = cardinality / (1 << 32)
+    load = cardinality / n_buckets
+    if load < 2.5:
+        linear_counting_bias = _alpha(n_buckets) / log(2) - 1
+        return sqrt(
+            n_buckets * (exp(load) - load - 1) / cardinality**2
+            + linear_counting_bias**2
+            + collision_bias**2
+        )
+    return sqrt(1.04**2 / n_buckets + collision_bias**2)
+
+
+def choose_precision(
+    target_error: float, cardinality: float | None = None
+) -> int | None:
+    """
+    The lowest precision whose error is within the target error,
+    for an expected cardinality, see `standard_error`
+
+    Returns None if no precision is, for targets below the bias of linear counting,
+    at cardinalities it approximates at every precision. Raises an error if
+    hash collisions alone bias the approximation by more than the target.
+    """
+    if not 0 < target_error < 1:
+        raise ValueError(
+            f"invalid target_error: {target_error} - must be between 0 and 1"
+        )
+    if cardinality is not None and cardinality / (1 << 32) >= target_error:
+        raise ValueError(
+            f"the 31 bit hashes of {cardinality:.0f} values collide too often for "
+            f"a target_error of {target_error}, see `aggregate.HLLCardinality64`"
+        )
+    for precision in range(MIN_PRECISION, MAX_PRECISION + 1):
+        if standard_error(precision, cardinality) <= target_error:
+            return precision
+    return None
+
+
+def get_expected_cardinality(
+    connection: BaseDatabaseWrapper, table: str, column: str
+) -> float | None:
+    """
+    The number of distinct values of a column that postgres expects,
+    from the statistics collected by ANALYZE, or None without statistics
+    """
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT stats.n_distinct, class.reltuples "
+            "FROM pg_class class "
+            "JOIN pg_namespace namespace ON namespace.oid = class.relnamespace "
+            "JOIN pg_stats stats ON stats.schemaname = namespace.nspname "
+            "AND stats.tablename = class.relname AND stats.attname = %s "
+            "WHERE class.relname = %s "
+            "AND namespace.nspname = ANY(CURRENT_SCHEMAS(false)) "
+            # partitioned tables only have statistics of all their partitions
+            "ORDER BY stats.inherited DESC LIMIT 1",
+            [column, table],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    n_distinct, n_rows = row
+    if n_distinct >= 0:
+        return n_distinct
+    # a negative n_distinct is a fraction of the rows, which tables never analyzed
+    # or vacuumed don't have
+    if n_rows < 0:
+        return None
+    return -n_distinct * n_rows
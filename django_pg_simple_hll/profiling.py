@@ -0,0 +1,223 @@
+"""
+Profiling of the queries that run HLL functions, see `hll_profile`
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# the calls and timings of the HLL functions in the current transaction
+FUNCTION_STATS_SQL = (
+    "SELECT funcname, calls, total_time, self_time FROM pg_stat_xact_user_functions "
+    "WHERE LEFT(funcname, 4) = 'hll_'"
+)
+
+
+class HLLProfile:
+    """
+    The profile of the queries run in a `hll_profile` block
+
+    `queries` holds one record per query, with:
+    - sql and params
+    - duration: the time of the query, in seconds
+    - functions: the calls, and total and self times in milliseconds, of each
+      HLL function that postgres tracked during the query, by name
+    - untracked_time: the time of the query not spent in those functions, in
+      milliseconds, which includes the transition and final functions of aggregates,
+      which postgres calls directly, and SQL functions it inlines, e.g. `hll_hash`
+    - plan: the `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` plan of SELECT queries
+    - groups: the number of groups of its aggregate nodes, once for parallel ones
+    - peak_memory_bytes: the peak memory of its hashed aggregate nodes
+    - state_bytes: the peak memory of its hashed aggregate nodes per group, an
+      estimate of the size of the aggregation states, including the group keys
+    - disk_bytes: the disk usage of its hashed aggregate nodes, when the states
+      don't fit in `work_mem`
+
+    `tracks_functions` is whether postgres tracked the HLL functions.
+    """
+
+    def __init__(self) -> None:
+        self.queries: list[dict[str, Any]] = []
+        self.tracks_functions = False
+
+    def __repr__(self) -> str:
+        return f"<HLLProfile: {len(self.queries)} queries>"
+
+
+def is_select_query(sql: str) -> bool:
+    """Whether a query is a SELECT, including one that starts with a CTE"""
+    keywords = sql.split(None, 1)
+    return bool(keywords) and keywords[0].upper() in ("SELECT", "WITH")
+
+
+def _get_function_stats(cursor: Any) -> dict[str, tuple[int, float, float]]:
+    cursor.execute(FUNCTION_STATS_SQL)
+    return {
+        name: (calls, total_time, self_time)
+        for name, calls, total_time, self_time in cursor.fetchall()
+    }
+
+
+def _get_aggregate_stats(plan: dict[str, Any]) -> tuple[int, int, int]:
+    """
+    The groups, and peak memory and disk usage in bytes of the aggregate nodes
+    of a plan,
+    leaving out the partial aggregates of parallel workers
+    """
+    groups = peak_memory = disk = 0
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Aggregate" and node["Partial Mode"] != "Partial":
+            groups += node["Actual Rows"] * node["Actual Loops"]
+            peak_memory += node.get("Peak Memory Usage", 0) * 1024
+            disk += node.get("Disk Usage", 0) * 1024
+        nodes.extend(node.get("Plans", ()))
+    return groups, peak_memory, disk
+
+
+@contextmanager
+def hll_profile(
+    using: str = DEFAULT_DB_ALIAS, explain: bool = True
+) -> Iterator[HLLProfile]:
+    """
+    Profile the queries run in the block, and log a record of each query
+    to the `django_pg_simple_hll.profiling` logger, with the record in `extra`
+
+    e.g.
+    with hll_profile() as profile:
+        Session.objects.aggregate(approx_unique_users=HLLCardinality("user_uuid"))
+    profile.queries[0]["functions"]
+
+    Each query runs in a transaction, or a savepoint, so that postgres tracks
+    the HLL functions of this connection only. Tracking needs `track_functions`,
+    which only superusers can set, unless it's set in the server's configuration;
+    it's set for the session until the end of the block. Functions run by
+    parallel workers aren't tracked.
+
+    With `explain`, SELECT queries are run a second time with `EXPLAIN ANALYZE`.
+    """
+    connection = connections[using]
+    profile = HLLProfile()
+
+    previous_track_functions = None
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW track_functions")
+        (track_functions,) = cursor.fetchone()
+        if track_functions == "none":
+            try:
+                with transaction.atomic(using=using):
+                    cursor.execute("SET track_functions = 'all'")
+                previous_track_functions = track_functions
+                track_functions = "all"
+            except DatabaseError:
+                logger.warning(
+                    "HLL functions can't be tracked without track_functions, "
+                    "which only superusers can set"
+                )
+    profile.tracks_functions = track_functions != "none"
+    # the savepoint queries of the transaction of a profiled query aren't profiled
+    profiling = False
+
+    def profile_query(
+        execute: Callable[..., Any],
+        sql: str,
+        params: Any,
+        many: bool,
+        context: dict[str, Any],
+    ) -> Any:
+        nonlocal profiling
+        if profiling:
+            return execute(sql, params, many, context)
+
+        # the stats are queried with a cursor of the underlying connection,
+        # which doesn't call this wrapper again
+        raw_cursor = context["connection"].connection.cursor()
+        profiling = True
+        try:
+            # the stats of the functions are of the current transaction
+            with transaction.atomic(using=using):
+                if context["connection"].pg_version >= 150000:
+                    # postgres 15 caches the stats of a transaction on their first read
+                    raw_cursor.execute("SET LOCAL stats_fetch_consistency = none")
+                before = _get_function_stats(raw_cursor)
+                start = perf_counter()
+                result = execute(sql, params, many, context)
+                duration = perf_counter() - start
+                after = _get_function_stats(raw_cursor)
+
+                functions = {}
+                for name, (calls, total_time, self_time) in after.items():
+                    previous_calls, previous_total_time, previous_self_time = (
+                        before.get(name, (0, 0.0, 0.0))
+                    )
+                    if calls > previous_calls:
+                        functions[name] = {
+                            "calls": calls - previous_calls,
+                            "total_time": total_time - previous_total_time,
+                            "self_time": self_time - previous_self_time,
+                        }
+                record: dict[str, Any] = {
+                    "sql": sql,
+                    "params": params,
+                    "duration": duration,
+                    "functions": functions,
+                    "untracked_time": duration * 1000
+                    - sum(function["self_time"] for function in functions.values()),
+                    "plan": None,
+                    "groups": None,
+                    "peak_memory_bytes": None,
+                    "disk_bytes": None,
+                    "state_bytes": None,
+                }
+
+                if explain and not many and is_select_query(sql):
+                    # the CTEs of a query can write, so its second run is undone
+                    raw_cursor.execute("SAVEPOINT hll_profile_explain")
+                    raw_cursor.execute(
+                        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params
+                    )
+                    ((plan,),) = raw_cursor.fetchall()
+                    raw_cursor.execute("ROLLBACK TO SAVEPOINT hll_profile_explain")
+                    record["plan"] = plan[0]
+                    groups, peak_memory, disk = _get_aggregate_stats(plan[0]["Plan"])
+                    record["groups"] = groups
+                    record["peak_memory_bytes"] = peak_memory
+                    record["disk_bytes"] = disk
+                    if groups and peak_memory:
+                        record["state_bytes"] = peak_memory // groups
+        finally:
+            profiling = False
+            raw_cursor.close()
+
+        profile.queries.append(record)
+        logger.info(
+            "HLL query took %.3fs, %s",
+            duration,
+            ", ".join(
+                f"{name}: {function['calls']} calls in {function['self_time']:.1f}ms"
+                for name, function in functions.items()
+            )
+            or "no HLL function tracked",
+            extra={"hll_profile": record},
+        )
+        return result
+
+    try:
+        with connection.execute_wrapper(profile_query):
+            yield profile
+    finally:
+        if previous_track_functions is not None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('track_functions', %s, false)",
+                    [previous_track_functions],
+                )
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping, Sequence
+from datetime import date, datetime, time
+from hashlib import sha256
+from itertools import combinations
+from typing import Any, TypeVar
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, BaseCache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connections
+from django.db.models import DateTimeField, Expression, F, Manager, Model, Q, QuerySet
+from django.db.models.expressions import Col
+from django.db.models.functions.datetime import TruncBase
+from django.utils import timezone
+
+from .aggregate import HLLSketch
+from .sketch import Sketch
+
+CACHE_KEY_PREFIX = "django_pg_simple_hll.approx_distinct"
+
+_M = TypeVar("_M", bound=Model)
+
+
+def _get_partition_key(cache_key: str, partition: Any) -> str:
+    return f"{cache_key}:{sha256(repr(partition).encode()).hexdigest()}"
+
+
+def _get_partition_filter(
+    sketches: QuerySet[Any], by: str | Expression, partition: Any
+) -> Q:
+    """
+    A filter of the rows of a partition and of the later ones on the column
+    the partitions are made of, which an index of the column applies to,
+    for a column or a `Trunc` of a column, e.g. `TruncDate("created")`
+    """
+    if isinstance(by, str):
+        return Q(**{f"{by}__gte": partition})
+    if not isinstance(by, TruncBase):
+        return Q()
+    (source,) = by.get_source_expressions()
+    resolved = sketches.query.annotations["_hll_partition"].get_source_expressions()[0]
+    if not isinstance(source, F) or not isinstance(resolved, Col):
+        return Q()
+    if (
+        isinstance(resolved.output_field, DateTimeField)
+        and isinstance(partition, date)
+        and not isinstance(partition, datetime)
+    ):
+        # the start of the day in the time zone of the truncation
+        partition = datetime.combine(partition, time.min)
+        if settings.USE_TZ:
+            partition = timezone.make_aware(
+                partition, by.tzinfo or timezone.get_current_timezone()
+            )
+    return Q(**{f"{source.name}__gte": partition})
+
+
+class HLLQuerySet(QuerySet[_M]):
+    """
+    A queryset that approximates distinct counts by partition, e.g. by day,
+    caching the sketches of past partitions in the Django cache framework
+
+    e.g.
+    class Session(models.Model):
+        ...
+        objects = HLLManager()
+
+    Session.objects.approx_distinct("user_uuid", by=TruncDate("created"), precision=11)
+
+    The sketches of every partition but the latest one are cached, each under its own
+    key, made of the SQL of the query, i.e. its filters, the field, the partition and
+    the precision, and of the partition. The next call only aggregates the rows of
+    the latest cached partition and any partition after it, filtered on the column
+    of the partitions, so that an index of the column applies, e.g. `created` for
+    `TruncDate("created")`. Rows must be inserted in partition order, like an
+    `rollup.HLLRollup`: rows inserted later in an older partition will not be counted
+    until the sketches are aggregated again with `refresh=True`, or the cache expires.
+    Rows with a NULL partition are ignored.
+    """
+
+    def hll_sketches(
+        self,
+        field: str | Expression,
+        by: str | Expression,
+        precision: int = 9,
+        cache: str | BaseCache | None = DEFAULT_CACHE_ALIAS,
+        timeout: float | None = DEFAULT_TIMEOUT,
+        refresh: bool = False,
+    ) -> dict[Any, Sketch]:
+        """
+        The sketch of each partition, in partition order, see `sketch.Sketch`
+
+        cache: the alias of a cache, a cache, or None to aggregate every partition
+        timeout: how long the sketches are cached for, the cache's default by default
+        """
+        sketches = (
+            self.annotate(_hll_partition=F(by) if isinstance(by, str) else by)
+            .filter(_hll_partition__isnull=False)
+            .values("_hll_partition")
+            .annotate(_hll_sketch=HLLSketch(field, precision))
+            .order_by()
+        )
+
+        backend = caches[cache] if isinstance(cache, str) else cache
+        states: dict[Any, list[int | None]] = {}
+        cached_partitions: set[Any] = set()
+        cache_key = ""
+        if backend is not None:
+            sql, params = sketches.query.sql_with_params()
+            cache_key = (
+                f"{CACHE_KEY_PREFIX}:"
+                f"{sha256(repr((self.db, sql, params)).encode()).hexdigest()}"
+            )
+            cached = None if refresh else backend.get(cache_key)
+            if cached is not None:
+                partition_keys = {
+                    partition: _get_partition_key(cache_key, partition)
+                    for partition in cached["partitions"]
+                }
+                cached_states = backend.get_many(partition_keys.values())
+                # partitions that expired are aggregated again with all the others
+                if len(cached_states) == len(partition_keys):
+                    states = {
+                        partition: cached_states[key]
+                        for partition, key in partition_keys.items()
+                    }
+                    cached_partitions = set(states)
+                    last_partition = cached["last_partition"]
+                    sketches = sketches.filter(
+                        _get_partition_filter(sketches, by, last_partition),
+                        _hll_partition__gte=last_partition,
+                    )
+
+        states.update(
+            (row["_hll_partition"], row["_hll_sketch"]) for row in sketches.iterator()
+        )
+        if backend is not None and states:
+            # the latest partition can still change, it's aggregated again next time,
+            # and each partition is cached once, under its own key
+            last_partition = max(states)
+            backend.set_many(
+                {
+                    _get_partition_key(cache_key, partition): state
+                    for partition, state in states.items()
+                    if partition != last_partition
+                    and partition not in cached_partitions
+                },
+                timeout,
+            )
+            backend.set(
+                cache_key,
+                {
+                    "partitions": [
+                        partition
+                        for partition in sorted(states)
+                        if partition != last_partition
+                    ],
+                    "last_partition": last_partition,
+                },
+                timeout,
+            )
+
+        return {
+            partition: Sketch.from_state(states[partition], precision)
+            for partition in sorted(states)
+        }
+
+    def approx_distinct(
+        self,
+        field: str | Expression,
+        by: str | Expression,
+        precision: int = 9,
+        cache: str | BaseCache | None = DEFAULT_CACHE_ALIAS,
+        timeout: float | None = DEFAULT_TIMEOUT,
+        refresh: bool = False,
+    ) -> dict[Any, int]:
+        """
+        The approximate distinct count of each partition, in partition order,
+        the same as `aggregate.HLLCardinality`, see `hll_sketches`
+        """
+        return {
+            partition: sketch.cardinality()
+            for partition, sketch in self.hll_sketches(
+                field, by, precision, cache=cache, timeout=timeout, refresh=refresh
+            ).items()
+        }
+
+    def approx_distinct_rollup(
+        self,
+        field: str | Expression,
+        dimensions: Sequence[str] | Mapping[str, str | Expression],
+        precision: int = 9,
+        grouping_sets: Iterable[Sequence[str]] | None = None,
+    ) -> dict[tuple[str, ...], dict[tuple[Any, ...], int]]:
+        """
+        The approximate distinct counts of several combinations of dimensions,
+        e.g. per day and group, per day, per group and overall, in a single scan
+
+        e.g.
+        Session.objects.approx_distinct_rollup(
+            "user_uuid", {"date": TruncDate("created"), "group": "group"}
+        )
+        {("date", "group"): {(date(2023, 5, 4), group_id): 143588, ...},
+         ("date",): {(date(2023, 5, 4),): 286123, ...},
+         ("group",): {...},
+         (): {(): 1021433}}
+
+        The rows are aggregated into sketches at the finest grain, i.e. by every
+        dimension, and the sketches are merged with `hll_union_cardinality` for each
+        grouping set, by `GROUPING SETS`, which are every combination of the
+        dimensions by default. The counts are the same as `aggregate.HLLCardinality`.
+        Each set of dimensions can only be given once, in any order.
+        """
+        expressions = (
+            dict(dimensions)
+            if isinstance(dimensions, Mapping)
+            else {dimension: dimension for dimension in dimensions}
+        )
+        names = list(expressions)
+        if not names:
+            raise ValueError("approx_distinct_rollup needs at least one dimension")
+        if grouping_sets is None:
+            sets = [
+                grouping_set
+                for size in range(len(names), -1, -1)
+                for grouping_set in combinations(names, size)
+            ]
+        else:
+            sets = [tuple(grouping_set) for grouping_set in grouping_sets]
+            seen: set[frozenset[str]] = set()
+            for grouping_set in sets:
+                if not set(grouping_set) <= set(names):
+                    raise ValueError(
+                        f"invalid grouping set: {grouping_set} - must be made of "
+                        f"the dimensions {names}"
+                    )
+                # postgres can't tell apart the rows of sets of the same dimensions
+                if frozenset(grouping_set) in seen:
+                    raise ValueError(
+                        f"duplicate grouping set: {grouping_set} - each set of "
+                        "dimensions can only be given once"
+                    )
+                seen.add(frozenset(grouping_set))
+
+        aliases = [f"_hll_dimension_{i}" for i in range(len(names))]
+        sketches = (
+            self.annotate(
+                **{
+                    alias: F(expression) if isinstance(expression, str) else expression
+                    for alias, expression in zip(
+                        aliases, expressions.values(), strict=True
+                    )
+                }
+            )
+            .values(*aliases)
+            .annotate(_hll_sketch=HLLSketch(field, precision))
+            .order_by()
+        )
+        sql, params = sketches.query.sql_with_params()
+
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        columns = {
+            name: quote_name(alias) for name, alias in zip(names, aliases, strict=True)
+        }
+        # the rows of each grouping set are told apart by which columns are grouped,
+        # so that NULL dimensions aren't mistaken for merged ones
+        rollup_sql = (
+            f"SELECT GROUPING({', '.join(columns.values())}), "
+            f"{', '.join(columns.values())}, hll_union_cardinality(_hll_sketch) "
+            f"FROM ({sql}) AS _hll_sketches "
+            f"GROUP BY GROUPING SETS ("
+            + ", ".join(
+                f"({', '.join(columns[name] for name in grouping_set)})"
+                for grouping_set in sets
+            )
+            + ")"
+        )
+
+        # the values of the dimensions are converted like `values()` converts them
+        converters = []
+        for alias in aliases:
+            expression = sketches.query.annotations[alias]
+            converters.append(
+                (
+                    connection.ops.get_db_converters(expression)
+                    + expression.get_db_converters(connection),
+                    expression,
+                )
+            )
+
+        counts: dict[tuple[str, ...], dict[tuple[Any, ...], int]] = {
+            grouping_set: {} for grouping_set in sets
+        }
+        masks = {
+            sum(
+                1 << (len(names) - 1 - i)
+                for i, name in enumerate(names)
+                if name not in grouping_set
+            ): grouping_set
+            for grouping_set in sets
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(rollup_sql, params)
+            for mask, *values, count in cursor.fetchall():
+                grouping_set = masks[mask]
+                converted = {}
+                for name, value, (value_converters, expression) in zip(
+                    names, values, converters, strict=True
+                ):
+                    if name in grouping_set:
+                        for converter in value_converters:
+                            value = converter(value, expression, connection)
+                        converted[name] = value
+                counts[grouping_set][
+                    tuple(converted[name] for name in grouping_set)
+                ] = count
+        return counts
+
+
+HLLManager = Manager.from_queryset(HLLQuerySet)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Expression, F, Field, Max, Model, QuerySet
+
+from .aggregate import HLLSketch
+from .models import HLLRollupWatermark
+
+_registry: dict[str, HLLRollup] = {}
+
+
+class HLLRollup:
+    """
+    Declares a table of HLL sketches, aggregated from a source model
+    by a time truncation and some dimensions, that can be updated incrementally.
+
+    e.g.
+    HLLRollup(
+        name="daily_sessions",
+        source=Session,
+        target=DailySessionRollup,
+        field="user_uuid",
+        truncation=TruncDate("created"),
+        truncation_field="date",
+        dimensions=["group"],
+    )
+
+    will keep one sketch of `user_uuid` per day and group in `DailySessionRollup`,
+    which needs fields named `date`, `group` and `sketch` (a `fields.HLLSketchField`),
+    and a unique constraint on `date` and `group`.
+
+    Each update only aggregates rows with a watermark (by default, the field being
+    truncated, i.e. `created`) greater than the last update, and merges them into the
+    existing sketches. Rows must be inserted in watermark order, rows inserted later
+    with a smaller watermark will not be counted until the rollup is rebuilt.
+    Merging the same rows twice doesn't change a sketch, so overlapping updates are safe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source: type[Model] | QuerySet[Any],
+        target: type[Model],
+        field: str | Expression,
+        truncation: Expression,
+        truncation_field: str,
+        dimensions: Sequence[str] = (),
+        precision: int = 9,
+        watermark: str | None = None,
+        sketch_field: str = "sketch",
+    ) -> None:
+        self.name = name
+        self.source = source
+        self.target = target
+        self.field = field
+        self.truncation = truncation
+        self.truncation_field = truncation_field
+        self.dimensions = tuple(dimensions)
+        self.precision = precision
+        self.sketch_field = sketch_field
+
+        if watermark is None:
+            # default to the field being truncated, e.g. `created` for TruncDate("created")
+            truncated = truncation.get_source_expressions()[0]
+            if not isinstance(truncated, F):
+                raise ImproperlyConfigured(
+                    f"HLLRollup {name!r} needs a watermark field, "
+                    f"as it cannot be inferred from {truncation!r}"
+                )
+            watermark = truncated.name
+        self.watermark = watermark
+
+    def __repr__(self) -> str:
+        return f"<HLLRollup: {self.name}>"
+
+    def get_source_queryset(self) -> QuerySet[Any]:
+        if isinstance(self.source, type):
+            return self.source._default_manager.all()
+        return self.source.all()
+
+    def update(self, using: str = DEFAULT_DB_ALIAS, rebuild: bool = False) -> bool:
+        """
+        Merge the rows added to the source since the last update into the sketches,
+        or aggregate every row again if `rebuild` is set.
+
+        Returns whether the sketches have been updated
+        """
+        source = self.get_source_queryset().using(using)
+        watermark_field = source.model._meta.get_field(self.watermark)
+
+        with transaction.atomic(using=using):
+            # lock the watermark so that concurrent updates can't merge the same rows twice
+            high_water_mark, _ = (
+                HLLRollupWatermark.objects.using(using)
+                .select_for_update()
+                .get_or_create(name=self.name)
+            )
+            if rebuild:
+                self.target._default_manager.using(using).all().delete()
+                high_water_mark.value = None
+
+            previous_value = (
+                None
+                if high_water_mark.value is None
+                else watermark_field.to_python(high_water_mark.value)
+            )
+            new_value = source.aggregate(value=Max(self.watermark))["value"]
+            if new_value is None or new_value == previous_value:
+                high_water_mark.save(using=using)
+                return False
+
+            rows = source.filter(**{f"{self.watermark}__lte": new_value})
+            if previous_value is not None:
+                rows = rows.filter(**{f"{self.watermark}__gt": previous_value})
+            self.merge(rows, using=using)
+
+            high_water_mark.value = str(new_value)
+            high_water_mark.save(using=using)
+        return True
+
+    def merge(self, rows: QuerySet[Any], using: str = DEFAULT_DB_ALIAS) -> None:
+        """
+        Aggregate the rows into sketches, and merge them into the target table
+        in a single `INSERT ... ON CONFLICT` statement
+        """
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        target_opts = self.target._meta
+
+        # every column is selected as an annotation, so that they keep their order
+        group_by = {
+            "_hll_truncation": self.truncation,
+            **{
+                f"_hll_dimension_{i}": F(dimension)
+                for i, dimension in enumerate(self.dimensions)
+            },
+        }
+        sketches = (
+            rows.annotate(**group_by)
+            .values(*group_by)
+            .annotate(_hll_sketch=HLLSketch(self.field, self.precision))
+            .order_by()
+        )
+        sql, params = sketches.query.sql_with_params()
+
+        def get_column(name: str) -> str:
+            field = target_opts.get_field(name)
+            if not isinstance(field, Field) or field.column is None:
+                raise ImproperlyConfigured(
+                    f"{self.target.__name__}.{name} is not a column for HLLRollup {self.name!r}"
+                )
+            return quote_name(field.column)
+
+        conflict_columns = [
+            get_column(name) for name in (self.truncation_field, *self.dimensions)
+        ]
+        sketch_column = get_column(self.sketch_field)
+        table = quote_name(target_opts.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join((*conflict_columns, sketch_column))}) "
+                f"{sql} "
+                f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE "
+                f"SET {sketch_column} = hll_bucket_combine({table}.{sketch_column}, EXCLUDED.{sketch_column})",
+                params,
+            )
+
+
+def register(rollup: HLLRollup) -> HLLRollup:
+    """
+    Register a rollup so that it's updated by the `hll_rollup` management command
+
+    Rollups are usually registered in a `hll_rollups` module of an installed app,
+    which the command imports.
+    """
+    if _registry.get(rollup.name, rollup) is not rollup:
+        raise ImproperlyConfigured(f"An HLLRollup named {rollup.name!r} already exists")
+    _registry[rollup.name] = rollup
+    return rollup
+
+
+def get_rollups(names: Iterable[str] = ()) -> list[HLLRollup]:
+    """
+    Get the registered rollups with the given names, or all of them
+    """
+    names = list(names)
+    if not names:
+        return list(_registry.values())
+
+    missing = [name for name in names if name not in _registry]
+    if missing:
+        raise KeyError(", ".join(missing))
+    return [_registry[name] for name in names]
@@ -0,0 +1,232 @@
+"""
+HyperLogLog sketches in python, in the same format as `aggregate.HLLSketch`
+
+Sketches can be loaded from a `fields.HLLSketchField`, merged and approximated
+in memory, and dumped back to be stored or merged in postgres. The hashes are
+the 31 bit hashes of `functions.HLLHash`.
+
+NumPy is optional: when it's installed, the buckets are kept in a NumPy array and
+`Sketch.add_many` adds millions of hashes per second, otherwise they're kept in
+a list with the same results.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from math import log
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    np = None  # type: ignore[assignment]
+
+# the value of an empty bucket, greater than any 31 bit hash
+EMPTY_BUCKET = 1 << 31
+
+
+def _alpha(n_buckets: int) -> float:
+    """alpha is a correction constant related to the number of buckets used"""
+    if n_buckets == 16:
+        return 0.673  # for precision 4
+    if n_buckets == 32:
+        return 0.697  # for precision 5
+    if n_buckets == 64:
+        return 0.709  # for precision 6
+    return 0.7213 / (1 + 1.079 / n_buckets)  # for precision >= 7
+
+
+def _estimate(n_buckets: int, n_zero_buckets: int, scaled_harmonic_sum: int) -> int:
+    """
+    The same estimate as `hll_scaled_estimate`, in the same floating point operations
+    scaled_harmonic_sum is the sum of 1 << (32 - rank) over every bucket
+    """
+    alpha = _alpha(n_buckets)
+    raw_estimate = round(
+        (float(n_buckets) * n_buckets * alpha) / (scaled_harmonic_sum / 4294967296)
+    )
+    if raw_estimate < 2.5 * n_buckets and n_zero_buckets > 0:
+        return round(alpha * (n_buckets * (log(n_buckets / n_zero_buckets) / log(2))))
+    return raw_estimate
+
+
+class Sketch:
+    """
+    A HyperLogLog sketch, which keeps the smallest hash seen in each bucket
+
+    e.g.
+    sketch = Sketch.from_state(DailySketch.objects.get(date=today).sketch)
+    sketch.add_many(hashes_of_new_events)
+    sketch.cardinality()
+
+    use_numpy defaults to whether numpy is installed.
+    """
+
+    def __init__(self, precision: int = 9, use_numpy: bool | None = None) -> None:
+        # the same range as `hll_bucket`
+        if precision < 4 or precision > 26:
+            raise ValueError(
+                f"invalid precision: {precision} - must be between 4 (16 buckets) "
+                "and 26 (67,108,864 buckets) inclusive"
+            )
+        if use_numpy is None:
+            use_numpy = np is not None
+        elif use_numpy and np is None:
+            raise ImportError("Sketch(use_numpy=True) requires numpy")
+
+        self.precision = precision
+        self.n_buckets = 1 << precision
+        self.use_numpy = use_numpy
+        self.buckets: Any
+        if use_numpy:
+            self.buckets = np.full(self.n_buckets, EMPTY_BUCKET, dtype=np.int64)
+        else:
+            self.buckets = [EMPTY_BUCKET] * self.n_buckets
+
+    def __repr__(self) -> str:
+        return f"<Sketch: precision={self.precision}>"
+
+    @classmethod
+    def from_state(
+        cls,
+        state: Sequence[int | None],
+        precision: int | None = None,
+        use_numpy: bool | None = None,
+    ) -> Sketch:
+        """
+        Load a sketch from its state, as stored in a `fields.HLLSketchField`
+
+        The precision is read from the state, empty states need it to be given.
+        """
+        if len(state) == 0:
+            if precision is None:
+                raise ValueError("the precision of an empty state must be given")
+            return cls(precision, use_numpy=use_numpy)
+
+        first = state[0]
+        if first is not None and first < 0:
+            # a sparse state, the negated precision followed by the hashes
+            state_precision = -first
+            hashes = state[1:]
+        else:
+            state_precision = len(state).bit_length() - 1
+            if len(state) != 1 << state_precision:
+                raise ValueError(f"invalid state of {len(state)} buckets")
+            hashes = state
+        if precision is not None and precision != state_precision:
+            raise ValueError(
+                f"the state has a precision of {state_precision}, not {precision}"
+            )
+
+        sketch = cls(state_precision, use_numpy=use_numpy)
+        sketch.add_many(hashed for hashed in hashes if hashed is not None)
+        return sketch
+
+    def to_state(self) -> list[int | None]:
+        """
+        Dump the sketch into the state that postgres would hold for the same hashes:
+        empty, sparse or dense, with the same threshold as `hll_bucket`
+        """
+        buckets = self.buckets.tolist() if self.use_numpy else self.buckets
+        hashes = [hashed for hashed in buckets if hashed != EMPTY_BUCKET]
+        if not hashes:
+            return []
+        if len(hashes) <= min(self.n_buckets // 4, 4096):
+            # the buckets are in order, so are their hashes
+            return [-self.precision, *hashes]
+        return [None if hashed == EMPTY_BUCKET else hashed for hashed in buckets]
+
+    def add(self, hashed_value: int) -> None:
+        """
+        hashed_value: the 31 bit hash to add to the sketch
+        """
+        self.add_many([hashed_value])
+
+    def add_many(self, hashed_values: Iterable[int]) -> None:
+        """
+        hashed_values: the 31 bit hashes to add to the sketch,
+        any iterable of ints, or a NumPy array
+        """
+        if not self.use_numpy:
+            buckets = self.buckets
+            mask = self.n_buckets - 1
+            for hashed in hashed_values:
+                if not 0 <= hashed < EMPTY_BUCKET:
+                    raise ValueError(f"invalid hash: {hashed} - must be 31 bits")
+                if hashed < buckets[hashed & mask]:
+                    buckets[hashed & mask] = hashed
+            return
+
+        if isinstance(hashed_values, np.ndarray):
+            hashes = hashed_values.astype(np.int64, copy=False)
+        elif isinstance(hashed_values, Sequence):
+            hashes = np.asarray(hashed_values, dtype=np.int64)
+        else:
+            hashes = np.fromiter(hashed_values, dtype=np.int64)
+        if hashes.size == 0:
+            return
+        if hashes.min() < 0 or hashes.max() >= EMPTY_BUCKET:
+            raise ValueError("invalid hashes - must be 31 bits")
+        np.minimum.at(self.buckets, hashes & (self.n_buckets - 1), hashes)
+
+    def reduce_precision(self, precision: int) -> Sketch:
+        """
+        A copy of the sketch at a lower precision, as `functions.HLLReducePrecision`
+        """
+        if precision > self.precision:
+            raise ValueError(
+                f"cannot increase the precision of a sketch from {self.precision} "
+                f"to {precision}"
+            )
+        sketch = Sketch(precision, use_numpy=self.use_numpy)
+        # the bucket of a hash at the lower precision is the remainder of its bucket
+        if self.use_numpy:
+            sketch.buckets = self.buckets.reshape(-1, sketch.n_buckets).min(axis=0)
+        else:
+            sketch.buckets = [
+                min(self.buckets[bucket_key :: sketch.n_buckets])
+                for bucket_key in range(sketch.n_buckets)
+            ]
+        return sketch
+
+    def merge(self, other: Sketch) -> None:
+        """
+        Merge another sketch of the same precision into this one,
+        as `aggregate.HLLUnion` does, see `reduce_precision`
+        """
+        if other.precision != self.precision:
+            raise ValueError(
+                "cannot merge sketches of different precisions: "
+                f"{self.precision} and {other.precision}"
+            )
+        if self.use_numpy:
+            np.minimum(self.buckets, other.buckets, out=self.buckets)
+        else:
+            other_buckets = other.buckets.tolist() if other.use_numpy else other.buckets
+            self.buckets = [
+                min(hashed, other_hashed)
+                for hashed, other_hashed in zip(
+                    self.buckets, other_buckets, strict=True
+                )
+            ]
+
+    def cardinality(self) -> int:
+        """
+        The approximate number of distinct values added to the sketch,
+        the same as `functions.HLLSketchCardinality`
+        """
+        if self.use_numpy:
+            filled = self.buckets[self.buckets != EMPTY_BUCKET]
+            n_zero_buckets = self.n_buckets - filled.size
+            # 1 << (32 - rank) is the power of 2 above the hash, i.e. 1 << its bit length,
+            # which frexp returns as the exponent of the hash
+            _, bit_lengths = np.frexp(filled.astype(np.float64))
+            filled_sum = int(np.left_shift(np.int64(1), bit_lengths).sum())
+        else:
+            filled = [hashed for hashed in self.buckets if hashed != EMPTY_BUCKET]
+            n_zero_buckets = self.n_buckets - len(filled)
+            filled_sum = sum(1 << hashed.bit_length() for hashed in filled)
+
+        return _estimate(
+            self.n_buckets, n_zero_buckets, filled_sum + (n_zero_buckets << 32)
+        )
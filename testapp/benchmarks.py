@@ -0,0 +1,289 @@
+"""
+Benchmarks of the HLL aggregates, run them with `django-admin hll_benchmark`
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from itertools import product
+from time import perf_counter
+from typing import Any
+
+from django.db import connection, transaction
+from django.db.models import Aggregate, Count, Field
+from django.db.models.functions import TruncDate
+from django_pg_simple_hll.aggregate import HLLCardinality, HLLCardinalityFromHash
+from django_pg_simple_hll.functions import HLLHash
+
+from .data import generate_test_data
+from .models import Group, Session
+
+# the final functions, and the SQL expression that reads the state they approximate
+FINAL_FUNCTIONS = {
+    "hll_approximate": "hll_approximate(dense_state)",
+    "hll_approximate (sparse)": "hll_approximate(state)",
+    "hll_compact_approximate": "hll_compact_approximate(compact_state)",
+}
+
+# the aggregates timed by the parallel benchmark
+PARALLEL_AGGREGATES = {
+    "HLLCardinality": "hll_cardinality",
+    "HLLCompactCardinality": "hll_compact_cardinality",
+    "HLLCardinality64": "hll_cardinality64",
+}
+
+# the aggregates timed by the benchmark suite, from a field and a precision
+# Count doesn't have a precision, and gets None instead
+SUITE_AGGREGATES: dict[str, Callable[[str, Any], Aggregate]] = {
+    "Count": lambda field, precision: Count(field, distinct=True),
+    "HLLCardinality": HLLCardinality,
+    "HLLCardinalityFromHash": lambda field, precision: HLLCardinalityFromHash(
+        HLLHash(field), precision
+    ),
+}
+SUITE_FIELDS = ("user_int", "user_uuid", "user_str")
+SUITE_PRECISIONS = (8, 11, 14)
+# the facets of the suite, total aggregates have no facet
+SUITE_FACETS = ("total", "date")
+# the results of the suite are compared by all their keys but the time
+SUITE_RESULT_KEYS = ("aggregate", "field", "precision", "facet", "workers")
+
+
+def time_query(sql: str, params: Sequence[Any] = (), repeat: int = 3) -> float:
+    """Run a query `repeat` times, and return its fastest time in seconds"""
+    timings = []
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            start = perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def time_function(function: Callable[[], Any], repeat: int = 3) -> float:
+    """Call a function `repeat` times, and return its fastest time in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_final_functions(
+    precision: int = 12,
+    n_groups: int = 10_000,
+    n_values_per_group: int = 100,
+    repeat: int = 3,
+) -> dict[str, float]:
+    """
+    Time the final functions on their own, in microseconds per group
+
+    The states of `n_groups` groups of distinct values are aggregated once into
+    a temporary table, and the time it takes to read them back is subtracted
+    from the time it takes to approximate them.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE hll_benchmark_states ON COMMIT DROP AS "
+            "SELECT hll_sketch_from_hash(hll_hash(value), %s) AS state "
+            "FROM GENERATE_SERIES(1, %s) AS value "
+            "GROUP BY value %% %s",
+            [precision, n_groups * n_values_per_group, n_groups],
+        )
+        cursor.execute(
+            "ALTER TABLE hll_benchmark_states "
+            "ADD COLUMN dense_state int [], ADD COLUMN compact_state bytea"
+        )
+        cursor.execute(
+            "UPDATE hll_benchmark_states SET "
+            "dense_state = hll_densify(state), "
+            "compact_state = ("
+            "  SELECT STRING_AGG("
+            "    SET_BYTE('\\x00'::bytea, 0, COALESCE(hll_rank(bucket_hash), 0)),"
+            "    ''::bytea ORDER BY bucket_key"
+            "  )"
+            "  FROM UNNEST(hll_densify(state)) WITH ORDINALITY AS buckets(bucket_hash, bucket_key)"
+            ")"
+        )
+        cursor.execute("ANALYZE hll_benchmark_states")
+
+        scan_time = time_query(
+            "SELECT COUNT(state), COUNT(dense_state), COUNT(compact_state) "
+            "FROM hll_benchmark_states",
+            repeat=repeat,
+        )
+        results = {}
+        for name, expression in FINAL_FUNCTIONS.items():
+            final_time = time_query(
+                f"SELECT SUM({expression}) FROM hll_benchmark_states",
+                repeat=repeat,
+            )
+            results[name] = max(final_time - scan_time, 0) / n_groups * 1e6
+    return results
+
+
+@contextmanager
+def force_parallel_plans(n_workers: int) -> Iterator[None]:
+    """
+    Plan parallel aggregates with up to `n_workers` workers per query, however small
+    the tables are, until the end of the transaction. 0 workers disables them.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL max_parallel_workers_per_gather = %s", [n_workers])
+        cursor.execute("SET LOCAL parallel_setup_cost = 0")
+        cursor.execute("SET LOCAL parallel_tuple_cost = 0")
+        cursor.execute("SET LOCAL min_parallel_table_scan_size = 0")
+        yield
+
+
+def _find_workers_launched(plan: dict[str, Any]) -> int:
+    """The number of workers launched by the Gather nodes of an EXPLAIN ANALYZE plan"""
+    return plan.get("Workers Launched", 0) + sum(
+        _find_workers_launched(child) for child in plan.get("Plans", [])
+    )
+
+
+def benchmark_parallel(
+    field: str = "user_uuid",
+    precision: int = 12,
+    max_workers: int = 8,
+    repeat: int = 3,
+) -> dict[str, list[tuple[int, int, float]]]:
+    """
+    Time the aggregates over the whole session table with 0 to `max_workers` workers
+
+    Returns the (planned workers, launched workers, seconds) of each run, the
+    number of workers launched is capped by `max_parallel_workers`.
+    """
+    model_field = Session._meta.get_field(field)
+    if not isinstance(model_field, Field) or model_field.column is None:
+        raise ValueError(f"Session.{field} is not a column")
+    column = connection.ops.quote_name(model_field.column)
+    table = connection.ops.quote_name(Session._meta.db_table)
+
+    results: dict[str, list[tuple[int, int, float]]] = {}
+    for name, function in PARALLEL_AGGREGATES.items():
+        results[name] = []
+        for n_workers in range(max_workers + 1):
+            timings = []
+            with force_parallel_plans(n_workers), connection.cursor() as cursor:
+                for _ in range(repeat):
+                    # TIMING OFF only counts rows, so it barely slows the query down
+                    cursor.execute(
+                        f"EXPLAIN (ANALYZE, TIMING OFF, FORMAT JSON) "
+                        f"SELECT {function}({column}, %s) FROM {table}",
+                        [precision],
+                    )
+                    ((explain,),) = cursor.fetchall()
+                    timings.append(
+                        (
+                            _find_workers_launched(explain[0]["Plan"]),
+                            explain[0]["Execution Time"] / 1000,
+                        )
+                    )
+            workers_launched, seconds = min(timings, key=lambda timing: timing[1])
+            results[name].append((n_workers, workers_launched, seconds))
+    return results
+
+
+def load_sessions(n_user_ids: int) -> int:
+    """
+    Replace the sessions with the test data of `n_user_ids` users,
+    4 sessions per user over a week, and return the number of sessions
+
+    e.g. 140k users give the 560k rows of the tests, 14M users give 56M rows
+    """
+    with transaction.atomic():
+        Session.objects.all().delete()
+        Group.objects.all().delete()
+        generate_test_data(n_user_ids=n_user_ids)
+    return Session.objects.count()
+
+
+def _run_suite_query(facet: str, aggregate: Aggregate) -> None:
+    if facet == "total":
+        Session.objects.aggregate(unique_users=aggregate)
+    elif facet == "date":
+        list(
+            Session.objects.annotate(date=TruncDate("created"))
+            .values("date")
+            .annotate(unique_users=aggregate)
+            .order_by()
+        )
+    else:
+        raise ValueError(f"Unknown facet {facet!r}")
+
+
+def benchmark_suite(
+    fields: Sequence[str] = SUITE_FIELDS,
+    precisions: Sequence[int] = SUITE_PRECISIONS,
+    facets: Sequence[str] = SUITE_FACETS,
+    workers: Sequence[int] = (0, 4),
+    repeat: int = 3,
+) -> dict[str, Any]:
+    """
+    Time every aggregate of `SUITE_AGGREGATES` over the sessions, for each field,
+    precision, facet and number of parallel workers (0 runs serial plans)
+
+    Returns the results with the metadata of the run, in a JSON serialisable dict.
+    `Count` is timed once, with a precision of None.
+    """
+    results = []
+    for (name, aggregate), field, facet, n_workers in product(
+        SUITE_AGGREGATES.items(), fields, facets, workers
+    ):
+        for precision in (None,) if name == "Count" else precisions:
+            query = partial(_run_suite_query, facet, aggregate(field, precision))
+            with force_parallel_plans(n_workers):
+                seconds = time_function(query, repeat=repeat)
+            results.append(
+                {
+                    "aggregate": name,
+                    "field": field,
+                    "precision": precision,
+                    "facet": facet,
+                    "workers": n_workers,
+                    "seconds": seconds,
+                }
+            )
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT VERSION()")
+        (server_version,) = cursor.fetchone()
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "server_version": server_version,
+        "n_sessions": Session.objects.count(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_suites(
+    baseline: dict[str, Any], current: dict[str, Any]
+) -> list[tuple[dict[str, Any], float, float]]:
+    """
+    Match the results of two runs of the suite, and return the keys of each result
+    with its baseline and current times, results missing from either run are skipped
+    """
+    baseline_seconds = {
+        tuple(result[key] for key in SUITE_RESULT_KEYS): result["seconds"]
+        for result in baseline["results"]
+    }
+    comparison = []
+    for result in current["results"]:
+        key = tuple(result[key] for key in SUITE_RESULT_KEYS)
+        if key in baseline_seconds:
+            comparison.append(
+                (
+                    dict(zip(SUITE_RESULT_KEYS, key, strict=True)),
+                    baseline_seconds[key],
+                    result["seconds"],
+                )
+            )
+    return comparison
@@ -0,0 +1,80 @@
+"""
+The test data, generated for the tests and the benchmarks
+"""
+
+from datetime import datetime, timedelta
+from hashlib import md5
+from uuid import UUID
+
+from django.db import connection
+from django.utils.timezone import now
+
+from .models import Group, Session
+
+TEST_DATA_BASE_TIMESTAMP = now().replace(hour=0, minute=0, second=0, microsecond=0)
+TEST_DATA_N_USER_IDS = 140_000
+TEST_DATA_N_SESSION_DAYS = 7
+
+
+def uuid_hash_31bit(id: UUID) -> int:
+    """
+    return a 31bit hash of the uuid
+    the same as `USER_HASH_SQL`, which computes it in postgres
+    """
+    return int.from_bytes(
+        md5(id.hex.encode("utf-8")).digest()[:4],
+        byteorder="big",
+        signed=False,
+    ) % (2**31 - 1)
+
+
+# the 31bit hash of the user_uuid column, see `uuid_hash_31bit`
+USER_HASH_SQL = (
+    "MOD(('x' || LEFT(MD5(REPLACE(user_uuid::text, '-', '')), 8))::bit(32)::bigint,"
+    " 2147483647)"
+)
+
+
+def generate_test_data(
+    n_user_ids: int = TEST_DATA_N_USER_IDS,
+    n_session_days: int = TEST_DATA_N_SESSION_DAYS,
+    base_timestamp: datetime = TEST_DATA_BASE_TIMESTAMP,
+) -> None:
+    """
+    Creates a list of users and inserts sessions for those users for each day of the week.
+
+    It's run once by the `django_db_setup` fixture, because it's expensive to create
+    the data, and we want to reuse it
+
+    The first day it will insert sessions for 1/n_session_days of the users
+    For every day after that, it will insert sessions for a further 1/n_session_days
+    of users and all previous users
+
+    The sessions are generated in postgres with `GENERATE_SERIES`, one statement
+    per day, so that millions of rows don't go through python. The n-th user has
+    the user_int n, the user_uuid UUID(int=n), and a session at a random time of
+    each day.
+    """
+    group_table = connection.ops.quote_name(Group._meta.db_table)
+    session_table = connection.ops.quote_name(Session._meta.db_table)
+
+    with connection.cursor() as cursor:
+        for day_of_week in range(n_session_days + 1):
+            group = Group.objects.create(
+                id=UUID(int=day_of_week),
+                created=base_timestamp + timedelta(days=day_of_week),
+            )
+            total_sessions_per_day = int(day_of_week * (n_user_ids / n_session_days))
+            cursor.execute(
+                f"INSERT INTO {session_table} "
+                "(user_uuid, user_int, user_str, user_hash, created, group_id) "
+                f"SELECT user_uuid, user_int, user_int || '-' || user_uuid, {USER_HASH_SQL}, "
+                "  %s::timestamptz"
+                "    + FLOOR(RANDOM() * 24) * INTERVAL '1 hour'"
+                "    + FLOOR(RANDOM() * 60) * INTERVAL '1 minute',"
+                "  %s "
+                "FROM GENERATE_SERIES(0, %s - 1) AS user_int, "
+                "LATERAL (SELECT LPAD(TO_HEX(user_int), 32, '0')::uuid AS user_uuid) AS users",
+                [group.created, group.id, total_sessions_per_day],
+            )
+        cursor.execute(f"ANALYZE {group_table}, {session_table}")
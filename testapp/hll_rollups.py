@@ -0,0 +1,16 @@
+from django.db.models.functions import TruncDate
+from django_pg_simple_hll.rollup import HLLRollup, register
+
+from .models import Session, SessionDailyRollup
+
+daily_sessions_by_group = register(
+    HLLRollup(
+        name="daily_sessions_by_group",
+        source=Session,
+        target=SessionDailyRollup,
+        field="user_uuid",
+        truncation=TruncDate("created"),
+        truncation_field="date",
+        dimensions=["group"],
+    )
+)
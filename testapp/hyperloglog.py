@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from collections.abc import Iterable
-from math import floor, log
+from math import floor, inf, log, sqrt
 
 
 class HyperLogLog:
@@ -73,3 +73,69 @@ class HyperLogLog:
             )
 
         return raw_estimate
+
+
+class HyperLogLog64:
+    """
+    Reference implementation of HyperLogLog with 64 bit hashes and
+    the improved estimator from https://arxiv.org/abs/1702.01284 for testing purposes
+    """
+
+    def __init__(self, precision: int) -> None:
+        """
+        precision: number of bits to use for the hash bucketing
+        """
+        self.precision = precision
+        self.n_buckets = 1 << precision
+        # the rank of each bucket, 0 for empty buckets
+        self.buckets = [0] * self.n_buckets
+
+    def add(self, hashed_value: int) -> None:
+        """
+        hashed_value: the signed 64 bit hash to add to the HyperLogLog
+        """
+        hashed_value &= (1 << 64) - 1
+        bucket = hashed_value & (self.n_buckets - 1)
+        rank = 64 - self.precision - (hashed_value >> self.precision).bit_length() + 1
+        self.buckets[bucket] = max(self.buckets[bucket], rank)
+
+    @staticmethod
+    def _sigma(x: float) -> float:
+        if x == 1:
+            return inf
+        y = 1.0
+        z = x
+        while True:
+            x = x * x
+            previous_z = z
+            z = z + x * y
+            y = y + y
+            if z == previous_z:
+                return z
+
+    @staticmethod
+    def _tau(x: float) -> float:
+        if x in (0, 1):
+            return 0.0
+        y = 1.0
+        z = 1 - x
+        while True:
+            x = sqrt(x)
+            previous_z = z
+            y = 0.5 * y
+            z = z - (1 - x) * (1 - x) * y
+            if z == previous_z:
+                return z / 3
+
+    def cardinality(self) -> int:
+        max_rank = 65 - self.precision
+        rank_counts = [0] * (max_rank + 1)
+        for rank in self.buckets:
+            rank_counts[rank] += 1
+
+        n_buckets = float(self.n_buckets)
+        z = n_buckets * self._tau(1 - rank_counts[max_rank] / n_buckets)
+        for rank in range(max_rank - 1, 0, -1):
+            z = 0.5 * (z + rank_counts[rank])
+        z = z + n_buckets * self._sigma(rank_counts[0] / n_buckets)
+        return round(0.7213475204444817 * n_buckets * n_buckets / z)
@@ -0,0 +1,151 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ...benchmarks import (
+    SUITE_FACETS,
+    SUITE_FIELDS,
+    SUITE_PRECISIONS,
+    SUITE_RESULT_KEYS,
+    benchmark_final_functions,
+    benchmark_parallel,
+    benchmark_suite,
+    compare_suites,
+    load_sessions,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the HLL aggregates"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "benchmark",
+            choices=["final", "parallel", "suite"],
+            help=(
+                "final: the cost of the final functions per group, "
+                "parallel: the speedup of the aggregates with more workers, "
+                "suite: COUNT(DISTINCT ...) and the HLL aggregates over every field, "
+                "precision, facet and number of workers"
+            ),
+        )
+        parser.add_argument("--precision", type=int, default=12)
+        parser.add_argument("--groups", type=int, default=10_000)
+        parser.add_argument("--values-per-group", type=int, default=100)
+        parser.add_argument(
+            "--field",
+            default="user_uuid",
+            help="The session field aggregated by the parallel benchmark",
+        )
+        parser.add_argument("--max-workers", type=int, default=8)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of runs of each query, the fastest one is kept",
+        )
+
+        suite = parser.add_argument_group("suite")
+        suite.add_argument(
+            "--load-user-ids",
+            type=int,
+            help=(
+                "Replace the sessions with the test data of this many users before "
+                "running the suite, 140000, 1400000 and 14000000 users give "
+                "560k, 5.6M and 56M sessions"
+            ),
+        )
+        suite.add_argument("--fields", nargs="+", default=SUITE_FIELDS)
+        suite.add_argument(
+            "--precisions", nargs="+", type=int, default=SUITE_PRECISIONS
+        )
+        suite.add_argument(
+            "--facets", nargs="+", choices=SUITE_FACETS, default=SUITE_FACETS
+        )
+        suite.add_argument(
+            "--workers",
+            nargs="+",
+            type=int,
+            default=[0, 4],
+            help="Numbers of parallel workers, 0 runs serial plans",
+        )
+        suite.add_argument(
+            "--output", type=Path, help="Write the results to this JSON file"
+        )
+        suite.add_argument(
+            "--compare",
+            type=Path,
+            help="Compare the results with a JSON file written by a previous run",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["benchmark"] == "parallel":
+            self.handle_parallel(**options)
+            return
+        if options["benchmark"] == "suite":
+            self.handle_suite(**options)
+            return
+
+        results = benchmark_final_functions(
+            precision=options["precision"],
+            n_groups=options["groups"],
+            n_values_per_group=options["values_per_group"],
+            repeat=options["repeat"],
+        )
+        for name, microseconds in results.items():
+            self.stdout.write(f"{name}: {microseconds:.1f} µs per group")
+
+    def handle_parallel(self, **options: Any) -> None:
+        results = benchmark_parallel(
+            field=options["field"],
+            precision=options["precision"],
+            max_workers=options["max_workers"],
+            repeat=options["repeat"],
+        )
+        for name, runs in results.items():
+            _, _, serial_seconds = runs[0]
+            for n_workers, workers_launched, seconds in runs:
+                self.stdout.write(
+                    f"{name}: {n_workers} workers ({workers_launched} launched) "
+                    f"{seconds:.3f} s, {serial_seconds / seconds:.1f}x speedup"
+                )
+
+    def handle_suite(self, **options: Any) -> None:
+        if options["load_user_ids"] is not None:
+            n_sessions = load_sessions(options["load_user_ids"])
+            self.stderr.write(f"Loaded {n_sessions} sessions")
+
+        suite = benchmark_suite(
+            fields=options["fields"],
+            precisions=options["precisions"],
+            facets=options["facets"],
+            workers=options["workers"],
+            repeat=options["repeat"],
+        )
+        if options["output"] is not None:
+            options["output"].write_text(json.dumps(suite, indent=2))
+
+        results: list[tuple[dict[str, Any], float | None, float]]
+        if options["compare"] is None:
+            results = [
+                (
+                    {key: result[key] for key in SUITE_RESULT_KEYS},
+                    None,
+                    result["seconds"],
+                )
+                for result in suite["results"]
+            ]
+        else:
+            baseline = json.loads(options["compare"].read_text())
+            results = list(compare_suites(baseline, suite))
+
+        for keys, baseline_seconds, seconds in results:
+            line = (
+                f"{keys['aggregate']} {keys['field']} precision={keys['precision']} "
+                f"{keys['facet']} workers={keys['workers']}: {seconds:.3f} s"
+            )
+            if baseline_seconds is not None:
+                line += f", {seconds / baseline_seconds:.2f}x baseline"
+            self.stdout.write(line)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:13
+
+import django_pg_simple_hll.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("testapp", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("sketch", django_pg_simple_hll.fields.HLLSketchField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:22
+
+import django.db.models.deletion
+import django_pg_simple_hll.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("testapp", "0002_daily_sketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("sketch", django_pg_simple_hll.fields.HLLSketchField()),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="testapp.group"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="sessiondailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("date", "group"), name="unique_session_daily_rollup"
+            ),
+        ),
+    ]
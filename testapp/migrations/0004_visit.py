@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:28
+
+import django_pg_simple_hll.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("testapp", "0003_session_daily_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Visit",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_uuid", models.UUIDField(null=True)),
+                (
+                    "user_uuid_hash",
+                    django_pg_simple_hll.fields.HLLHashField(
+                        editable=False, null=True, source="user_uuid"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,13 @@
+from django.db import migrations
+from django_pg_simple_hll.operations import AddHLLHashColumn
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("testapp", "0004_visit"),
+        ("django_pg_simple_hll", "0010_parallel_combine"),
+    ]
+
+    operations = [
+        AddHLLHashColumn("visit", "user_uuid"),
+    ]
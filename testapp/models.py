@@ -1,6 +1,8 @@
 import uuid
 
 from django.db import models
+from django_pg_simple_hll.fields import HLLHashField, HLLSketchField
+from django_pg_simple_hll.queryset import HLLManager
 
 
 class Group(models.Model):
@@ -16,3 +18,28 @@ class Session(models.Model):
     created = models.DateTimeField()
 
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="sessions")
+
+    objects = HLLManager()
+
+
+class DailySketch(models.Model):
+    date = models.DateField(unique=True)
+    sketch = HLLSketchField()
+
+
+class SessionDailyRollup(models.Model):
+    date = models.DateField()
+    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    sketch = HLLSketchField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "group"], name="unique_session_daily_rollup"
+            ),
+        ]
+
+
+class Visit(models.Model):
+    user_uuid = models.UUIDField(null=True)
+    user_uuid_hash = HLLHashField(source="user_uuid", null=True)
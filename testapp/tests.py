@@ -1,19 +1,89 @@
 import json
-from datetime import timedelta
+from collections.abc import Callable
+from datetime import UTC, date, datetime, time, timedelta
+from io import StringIO
 from itertools import product
 from pathlib import Path
+from uuid import UUID
 
 import pytest
+from django.apps import apps
+from django.core.cache import cache
 from django.core.exceptions import FieldError
-from django.db.models import Case, F, Q, When
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.db.models import (
+    Aggregate,
+    Case,
+    Count,
+    F,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
 from django.db.models.functions import TruncDate
-from django.db.utils import DataError, ProgrammingError
-from django_pg_simple_hll.aggregate import HLLCardinality, HLLCardinalityFromHash
-from django_pg_simple_hll.functions import HLLHash
-
-from .conftest import TEST_DATA_BASE_TIMESTAMP, TEST_DATA_N_SESSION_DAYS
-from .hyperloglog import HyperLogLog
-from .models import Group, Session
+from django.db.utils import DataError, InternalError, ProgrammingError
+from django.test.utils import CaptureQueriesContext
+from django_pg_simple_hll.aggregate import (
+    HLLCardinality,
+    HLLCardinality64,
+    HLLCardinality64FromHash,
+    HLLCardinalityFromHash,
+    HLLCompactCardinality,
+    HLLCompactCardinalityFromHash,
+    HLLCumulativeCardinality,
+    HLLKMVSketch,
+    HLLKMVSketchFromHash,
+    HLLMultiCardinality,
+    HLLMultiCardinalityFromHash,
+    HLLNativeCardinality,
+    HLLSketch,
+    HLLSketchFromHash,
+    HLLUnion,
+    HLLUnionCardinality,
+)
+from django_pg_simple_hll.functions import (
+    HLLDifferenceCardinality,
+    HLLHash,
+    HLLHash64,
+    HLLIntersectionCardinality,
+    HLLNativeHash,
+    HLLReducePrecision,
+    HLLSketchCardinality,
+    HLLSketchUnion,
+)
+from django_pg_simple_hll.hashing import hll_hash, hll_native_hash
+from django_pg_simple_hll.memory import (
+    HLLMemoryError,
+    get_output_state_bytes,
+    hll_memory_guard,
+    state_bytes,
+)
+from django_pg_simple_hll.models import HLLCounter
+from django_pg_simple_hll.operations import (
+    AddHLLCounterTrigger,
+    AddHLLHashColumn,
+    get_hash_columns,
+)
+from django_pg_simple_hll.precision import (
+    choose_precision,
+    get_expected_cardinality,
+    standard_error,
+)
+from django_pg_simple_hll.profiling import hll_profile
+from django_pg_simple_hll.sketch import Sketch
+
+from .benchmarks import force_parallel_plans, load_sessions
+from .data import (
+    TEST_DATA_BASE_TIMESTAMP,
+    TEST_DATA_N_SESSION_DAYS,
+    TEST_DATA_N_USER_IDS,
+    uuid_hash_31bit,
+)
+from .hyperloglog import HyperLogLog, HyperLogLog64
+from .models import DailySketch, Group, Session, SessionDailyRollup, Visit
 
 FIELDS = ("user_int", "user_uuid", "user_str")
 PRECISIONS_TO_TEST = (4, 5, 8, 9, 10, 11, 12)
@@ -56,6 +126,47 @@ def _get_reference_approximation(field: str, precision: int) -> dict[int, int]:
     return fixtures
 
 
+def _get_reference_approximation64(field: str, precision: int) -> dict[int, int]:
+    """
+    Get the reference approximation with 64 bit hashes for a given field and precision
+    Calculate values only once, and store them in a JSON file for future use
+    """
+    fixture_path = FIXTURES_DIR / f"{field}.{precision}.64.json"
+
+    if fixture_path.exists():
+        with open(fixture_path) as f:
+            return {int(key): val for key, val in json.load(f).items()}
+
+    fixtures = {}
+    for day_of_week in range(TEST_DATA_N_SESSION_DAYS):
+        timestamp = TEST_DATA_BASE_TIMESTAMP + timedelta(days=day_of_week + 2)
+        hashes = Session.objects.filter(created__lt=timestamp).values_list(
+            HLLHash64(F(field)), flat=True
+        )
+
+        hll = HyperLogLog64(precision)
+        for hashed_value in hashes:
+            hll.add(hashed_value)
+
+        fixtures[day_of_week] = hll.cardinality()
+
+    with open(fixture_path, "w") as f:
+        json.dump(fixtures, f)
+
+    return fixtures
+
+
+def _store_daily_sketches(field: str, precision: int) -> None:
+    """Store a sketch of the given field for every day of sessions"""
+    DailySketch.objects.bulk_create(
+        DailySketch(date=row["date_of_session"], sketch=row["sketch"])
+        for row in Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(sketch=HLLSketch(field, precision))
+        .order_by()
+    )
+
+
 @pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
 @pytest.mark.django_db()
 def test_hll_cardinality_total(field: str, precision: int) -> None:
@@ -176,6 +287,108 @@ def test_hll_cardinality_from_hash_raises_error_with_no_hash(field: str) -> None
         )
 
 
+@pytest.mark.parametrize(
+    ("target_error", "cardinality", "expected_precision"),
+    [
+        (0.05, None, 9),
+        (0.02, None, 12),
+        (0.05, 140_000, 9),
+        (0.05, 1000, 10),
+        (0.3, 100, 4),
+        (0.01, 1_000_000, 14),
+        # linear counting is biased by about 4%
+        (0.02, 5000, None),
+    ],
+)
+def test_choose_precision(
+    target_error: float, cardinality: int | None, expected_precision: int | None
+) -> None:
+    assert choose_precision(target_error, cardinality) == expected_precision
+    if expected_precision is not None:
+        assert standard_error(expected_precision, cardinality) <= target_error
+        if expected_precision > 4:
+            assert standard_error(expected_precision - 1, cardinality) > target_error
+
+
+@pytest.mark.parametrize(
+    ("target_error", "cardinality", "match"),
+    [
+        (0, None, "invalid target_error"),
+        (1, None, "invalid target_error"),
+        (0.01, 10**9, "collide"),
+    ],
+)
+def test_choose_precision_raises_error(
+    target_error: float, cardinality: int | None, match: str
+) -> None:
+    with pytest.raises(ValueError, match=match):
+        choose_precision(target_error, cardinality)
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_cardinality_target_error(field: str) -> None:
+    # the statistics of the test data expect over 10240 distinct values,
+    # which are approximated within 2% from a precision of 12
+    assert (get_expected_cardinality(connection, "testapp_session", field) or 0) > 10240
+    assert Session.objects.aggregate(
+        target_error=HLLCardinality(field, target_error=0.02),
+        compact_target_error=HLLCompactCardinality(field, target_error=0.02),
+        auto=HLLCardinality(field, "auto", strategy="set"),
+    ) == Session.objects.aggregate(
+        target_error=HLLCardinality(field, 12),
+        compact_target_error=HLLCompactCardinality(field, 12),
+        auto=HLLCardinality(field, 9),
+    )
+
+
+@pytest.mark.django_db()
+def test_hll_cardinality_target_error_without_statistics() -> None:
+    # expressions other than columns don't have statistics
+    assert Session.objects.aggregate(
+        approx_unique_users=HLLCardinality(F("user_int") + 1, target_error=0.02)
+    ) == Session.objects.aggregate(
+        approx_unique_users=HLLCardinality(F("user_int") + 1, 12)
+    )
+
+
+@pytest.mark.django_db()
+def test_hll_cardinality_target_error_counts_exactly() -> None:
+    assert get_expected_cardinality(connection, "testapp_session", "group_id") == 7
+    approximations = Session.objects.aggregate(
+        approx_groups=HLLCardinality("group_id", "auto"),
+        approx_filtered_groups=HLLCardinality(
+            "group_id", "auto", filter=Q(user_int__lt=20_000)
+        ),
+        approx_users=HLLCardinality(
+            "user_uuid", target_error=0.02, exact_threshold=10**6
+        ),
+    )
+    assert approximations == Session.objects.aggregate(
+        approx_groups=Count("group_id", distinct=True),
+        approx_filtered_groups=Count(
+            "group_id", distinct=True, filter=Q(user_int__lt=20_000)
+        ),
+        approx_users=Count("user_uuid", distinct=True),
+    )
+    assert approximations["approx_groups"] == 7
+
+
+@pytest.mark.parametrize(
+    ("precision", "target_error", "match"),
+    [
+        ("high", None, "invalid precision"),
+        (9, 0.02, "can't be given with a precision"),
+        ("auto", 2, "invalid target_error"),
+    ],
+)
+def test_hll_cardinality_target_error_raises_error(
+    precision: int | str, target_error: float | None, match: str
+) -> None:
+    with pytest.raises(ValueError, match=match):
+        HLLCardinality("user_uuid", precision, target_error=target_error)
+
+
 @pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
 @pytest.mark.django_db()
 def test_hll_cardinality_with_filter(field: str, precision: int) -> None:
@@ -386,3 +599,1824 @@ def test_hll_cardinality_from_hash_pre_hashed_by_date(precision: int) -> None:
     )
     for i, row in enumerate(aggregation):
         assert fixtures[i] == row["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_multi_cardinality_by_date(precision: int) -> None:
+    fixtures = {
+        field: _get_reference_approximation(field, precision) for field in FIELDS
+    }
+
+    aggregation = (
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(
+            approx_uniques=HLLMultiCardinality(*FIELDS, precision=precision),
+            approx_uniques_from_hash=HLLMultiCardinalityFromHash(
+                "user_hash", HLLHash("user_uuid"), precision=precision
+            ),
+        )
+        .values("approx_uniques", "approx_uniques_from_hash", "date_of_session")
+        .order_by("date_of_session")
+    )
+    for i, row in enumerate(aggregation):
+        assert row["approx_uniques"] == [fixtures[field][i] for field in FIELDS]
+        assert row["approx_uniques_from_hash"] == [
+            _get_reference_approximation("user_hash", precision)[i],
+            fixtures["user_uuid"][i],
+        ]
+
+
+@pytest.mark.django_db()
+def test_hll_multi_cardinality_total() -> None:
+    # NULL values aren't counted, like HLLCardinality
+    user_ints_under_1000 = Case(When(user_int__lt=1000, then="user_int"))
+    assert Session.objects.filter(user_int__lt=20_000).aggregate(
+        approx_uniques=HLLMultiCardinality(
+            "user_uuid", user_ints_under_1000, filter=Q(user_int__gte=10)
+        ),
+    )["approx_uniques"] == list(
+        Session.objects.filter(user_int__lt=20_000)
+        .aggregate(
+            approx_unique_users=HLLCardinality("user_uuid", filter=Q(user_int__gte=10)),
+            approx_unique_ints=HLLCardinality(
+                user_ints_under_1000, filter=Q(user_int__gte=10)
+            ),
+        )
+        .values()
+    )
+
+
+@pytest.mark.django_db()
+def test_hll_multi_cardinality_of_no_rows() -> None:
+    assert Session.objects.filter(user_int__lt=0).aggregate(
+        approx_uniques=HLLMultiCardinality("user_uuid", "user_int")
+    ) == {"approx_uniques": [0, 0]}
+    assert Session.objects.none().aggregate(
+        approx_uniques=HLLMultiCardinality("user_uuid", "user_int")
+    ) == {"approx_uniques": [0, 0]}
+
+
+@pytest.mark.django_db()
+def test_hll_multi_cardinality_raises_error() -> None:
+    with pytest.raises(TypeError, match="requires expressions"):
+        HLLMultiCardinality()
+    with pytest.raises(InternalError, match="invalid hll_precision"):
+        Session.objects.aggregate(
+            approx_uniques=HLLMultiCardinality("user_uuid", "user_int", precision=27)
+        )
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_compact_cardinality_total(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCompactCardinality(field, precision),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_compact_cardinality_with_default_precision_total(field: str) -> None:
+    fixtures = _get_reference_approximation(field, 9)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCompactCardinality(field),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_compact_cardinality_from_hash_pre_hashed_total(precision: int) -> None:
+    fixtures = _get_reference_approximation("user_hash", precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCompactCardinalityFromHash("user_hash", precision),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_compact_cardinality_from_hash_by_date(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+
+    aggregation = (
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(
+            approx_unique_users=HLLCompactCardinalityFromHash(
+                HLLHash(field), precision
+            ),
+        )
+        .values("approx_unique_users", "date_of_session")
+        .order_by("date_of_session")
+    )
+    for i, row in enumerate(aggregation):
+        assert fixtures[i] == row["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_compact_state_has_one_byte_per_bucket(precision: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT LENGTH(hll_compact_bucket('', hll_hash(user_uuid), %s)) "
+            "FROM testapp_session LIMIT 1",
+            [precision],
+        )
+        (state_length,) = cursor.fetchone()
+
+    assert state_length == 2**precision
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_sketch_cardinality_total(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLSketchCardinality(HLLSketch(field, precision)),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_sketch_from_hash_pre_hashed_total(precision: int) -> None:
+    fixtures = _get_reference_approximation("user_hash", precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLSketchCardinality(
+            HLLSketchFromHash("user_hash", precision)
+        ),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_sketch_has_one_hash_per_bucket(precision: int) -> None:
+    aggregation = Session.objects.aggregate(sketch=HLLSketch("user_uuid", precision))
+
+    assert len(aggregation["sketch"]) == 2**precision
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_union_of_stored_sketches(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+    _store_daily_sketches(field, precision)
+
+    for day_of_week in range(TEST_DATA_N_SESSION_DAYS):
+        aggregation = DailySketch.objects.filter(
+            date__lte=(
+                TEST_DATA_BASE_TIMESTAMP + timedelta(days=day_of_week + 1)
+            ).date()
+        ).aggregate(
+            approx_unique_users=HLLSketchCardinality(HLLUnion("sketch")),
+        )
+        assert fixtures[day_of_week] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.django_db()
+def test_hll_union_of_stored_sketches_round_trips() -> None:
+    _store_daily_sketches("user_uuid", 9)
+    aggregation = DailySketch.objects.aggregate(sketch=HLLUnion("sketch"))
+    DailySketch.objects.create(
+        date=(TEST_DATA_BASE_TIMESTAMP - timedelta(days=1)).date(),
+        sketch=aggregation["sketch"],
+    )
+
+    assert (
+        DailySketch.objects.aggregate(sketch=HLLUnion("sketch"))["sketch"]
+        == aggregation["sketch"]
+    )
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, (4, 9, 12)))
+@pytest.mark.django_db()
+def test_hll_cumulative_cardinality_by_date(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+
+    aggregation = (
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(sketch=HLLSketch(field, precision))
+        .annotate(
+            approx_unique_users=HLLCumulativeCardinality(
+                "sketch", order_by="date_of_session"
+            ),
+        )
+        .order_by("date_of_session")
+    )
+    assert [row["approx_unique_users"] for row in aggregation] == [
+        fixtures[day_of_week] for day_of_week in range(TEST_DATA_N_SESSION_DAYS)
+    ]
+
+
+@pytest.mark.parametrize("buckets", [1, 3])
+@pytest.mark.django_db()
+def test_hll_cumulative_cardinality_of_last_buckets(buckets: int) -> None:
+    aggregation = (
+        Session.objects.annotate(bucket=F("user_int") / 10_000)
+        .values("bucket")
+        .annotate(sketch=HLLSketch("user_uuid", 11))
+        .annotate(
+            approx_unique_users=HLLCumulativeCardinality(
+                "sketch", order_by="bucket", buckets=buckets
+            ),
+        )
+        .order_by("bucket")
+    )
+
+    assert len(aggregation) > buckets
+    for row in aggregation:
+        first_bucket = max(row["bucket"] - buckets + 1, 0)
+        assert (
+            row["approx_unique_users"]
+            == Session.objects.filter(
+                user_int__gte=first_bucket * 10_000,
+                user_int__lt=(row["bucket"] + 1) * 10_000,
+            ).aggregate(approx_unique_users=HLLCardinality("user_uuid", 11))[
+                "approx_unique_users"
+            ]
+        )
+
+
+@pytest.mark.django_db()
+def test_hll_cumulative_cardinality_of_stored_sketches() -> None:
+    fixtures = _get_reference_approximation("user_uuid", 9)
+    _store_daily_sketches("user_uuid", 9)
+
+    aggregation = DailySketch.objects.annotate(
+        approx_unique_users=HLLCumulativeCardinality("sketch", order_by="date")
+    ).order_by("date")
+    assert [row.approx_unique_users for row in aggregation] == [
+        fixtures[day_of_week] for day_of_week in range(TEST_DATA_N_SESSION_DAYS)
+    ]
+    assert DailySketch.objects.aggregate(
+        approx_unique_users=HLLUnionCardinality("sketch")
+    ) == {"approx_unique_users": fixtures[TEST_DATA_N_SESSION_DAYS - 1]}
+
+
+def test_hll_cumulative_cardinality_raises_error() -> None:
+    with pytest.raises(ValueError, match="invalid buckets"):
+        HLLCumulativeCardinality("sketch", order_by="created", buckets=0)
+
+
+@pytest.mark.parametrize("precision", [4, 9, 11])
+@pytest.mark.django_db()
+def test_approx_distinct(precision: int) -> None:
+    fixtures = _get_reference_approximation("user_uuid", precision)
+    cache.clear()
+
+    for _ in range(2):
+        # from the database, then from the cache
+        approximations = Session.objects.approx_distinct(
+            "user_uuid", by=TruncDate("created"), precision=precision
+        )
+        assert list(approximations.values()) == [
+            fixtures[day_of_week] for day_of_week in range(TEST_DATA_N_SESSION_DAYS)
+        ]
+    assert (
+        Session.objects.approx_distinct(
+            "user_uuid", by=TruncDate("created"), precision=precision, cache=None
+        )
+        == approximations
+    )
+
+    sketches = Session.objects.hll_sketches(
+        "user_uuid", by=TruncDate("created"), precision=precision
+    )
+    assert list(sketches) == list(approximations)
+    total = Sketch(precision)
+    for sketch in sketches.values():
+        total.merge(sketch)
+    assert total.cardinality() == fixtures[TEST_DATA_N_SESSION_DAYS - 1]
+    cache.clear()
+
+
+@pytest.mark.django_db()
+def test_approx_distinct_only_aggregates_the_latest_partitions() -> None:
+    cache.clear()
+    by_date = Session.objects.filter(user_int__lt=20_000)
+    approximations = by_date.approx_distinct("user_uuid", by=TruncDate("created"))
+    first_date, last_date = min(approximations), max(approximations)
+
+    def add_sessions(date_of_session: date, n_sessions: int) -> None:
+        Session.objects.bulk_create(
+            Session(
+                user_uuid=UUID(int=10_000_000 + i),
+                user_int=i,
+                user_str="",
+                user_hash=0,
+                created=datetime.combine(date_of_session, time(12), tzinfo=UTC),
+                group_id=UUID(int=0),
+            )
+            for i in range(n_sessions)
+        )
+
+    add_sessions(first_date, 1000)
+    add_sessions(last_date, 2000)
+    add_sessions(last_date + timedelta(days=1), 3000)
+
+    with CaptureQueriesContext(connection) as queries:
+        updated = by_date.approx_distinct("user_uuid", by=TruncDate("created"))
+    # the latest partitions are filtered on the column, which an index applies to
+    (query,) = queries.captured_queries
+    assert '"testapp_session"."created" >= ' in query["sql"]
+    # sessions added to a cached partition aren't counted until the next refresh
+    assert updated[first_date] == approximations[first_date]
+    assert updated[last_date] > approximations[last_date]
+    assert updated[last_date + timedelta(days=1)] > 0
+    assert (
+        by_date.approx_distinct("user_uuid", by=TruncDate("created"), refresh=True)
+        == by_date.approx_distinct("user_uuid", by=TruncDate("created"), cache=None)
+        != updated
+    )
+    # other queries, fields and precisions are cached separately
+    assert Session.objects.filter(user_int__lt=20_000).approx_distinct(
+        "user_uuid", by=TruncDate("created"), precision=10
+    ) == by_date.approx_distinct(
+        "user_uuid", by=TruncDate("created"), precision=10, cache=None
+    )
+    cache.clear()
+
+
+@pytest.mark.parametrize("precision", [9, 11])
+@pytest.mark.django_db()
+def test_approx_distinct_rollup(precision: int) -> None:
+    rollup = Session.objects.filter(user_int__lt=50_000).approx_distinct_rollup(
+        "user_uuid", {"date": TruncDate("created"), "group": "group"}, precision
+    )
+
+    assert list(rollup) == [("date", "group"), ("date",), ("group",), ()]
+    sessions = Session.objects.filter(user_int__lt=50_000)
+    for grouping_set in [("date", "group"), ("date",), ("group",)]:
+        rows = (
+            sessions.annotate(date=TruncDate("created"))
+            .values(*grouping_set)
+            .annotate(n=HLLCardinality("user_uuid", precision))
+            .order_by()
+        )
+        assert rollup[grouping_set] == {
+            tuple(row[name] for name in grouping_set): row["n"] for row in rows
+        }
+    assert rollup[()] == {
+        (): sessions.aggregate(n=HLLCardinality("user_uuid", precision))["n"]
+    }
+
+
+@pytest.mark.django_db()
+def test_approx_distinct_rollup_grouping_sets() -> None:
+    rollup = Session.objects.approx_distinct_rollup(
+        "user_uuid",
+        {"group": "group", "half": Case(When(user_int__lt=70_000, then=0))},
+        grouping_sets=[("half", "group"), ("half",)],
+    )
+    assert rollup[("half",)] == {
+        (0,): Session.objects.filter(user_int__lt=70_000).aggregate(
+            n=HLLCardinality("user_uuid")
+        )["n"],
+        # NULL dimensions are kept apart from merged ones
+        (None,): Session.objects.filter(user_int__gte=70_000).aggregate(
+            n=HLLCardinality("user_uuid")
+        )["n"],
+    }
+    assert (
+        rollup[("half", "group")][(0, UUID(int=1))]
+        == (
+            Session.objects.filter(group_id=UUID(int=1)).aggregate(
+                n=HLLCardinality("user_uuid")
+            )["n"]
+        )
+    )
+
+    with pytest.raises(ValueError, match="invalid grouping set"):
+        Session.objects.approx_distinct_rollup(
+            "user_uuid", ["group"], grouping_sets=[("date",)]
+        )
+    with pytest.raises(ValueError, match="duplicate grouping set"):
+        Session.objects.approx_distinct_rollup(
+            "user_uuid",
+            {"date": TruncDate("created"), "group": "group"},
+            grouping_sets=[("date", "group"), ("group", "date")],
+        )
+    with pytest.raises(ValueError, match="at least one dimension"):
+        Session.objects.approx_distinct_rollup("user_uuid", [])
+
+
+@pytest.mark.django_db()
+def test_hll_profile(caplog: pytest.LogCaptureFixture) -> None:
+    with (
+        caplog.at_level("INFO", "django_pg_simple_hll.profiling"),
+        hll_profile() as profile,
+    ):
+        approximations = (
+            Session.objects.filter(user_int__lt=20_000)
+            .values("group_id")
+            .annotate(users=HLLCompactCardinality("user_uuid", 9))
+        )
+        n_groups = len(approximations)
+
+    assert profile.tracks_functions
+    # the first query may read the hash columns, see `get_hash_columns`
+    record = profile.queries[-1]
+    assert record["functions"]["hll_compact_bucket"]["calls"] > 0
+    assert record["untracked_time"] > 0
+    assert record["plan"]["Execution Time"] > 0
+    assert record["groups"] == n_groups
+    log_record = caplog.records[-1]
+    assert log_record.hll_profile is record  # type: ignore[attr-defined]
+    assert "hll_compact_bucket" in log_record.getMessage()
+
+
+@pytest.mark.django_db()
+def test_hll_profile_without_explain() -> None:
+    with hll_profile(explain=False) as profile:
+        Session.objects.filter(user_int__lt=1000).aggregate(
+            users=HLLCompactCardinality("user_uuid", 9)
+        )
+        Group.objects.filter(pk=UUID(int=0)).update(created=TEST_DATA_BASE_TIMESTAMP)
+    select, update = profile.queries[-2:]
+    assert select["functions"]["hll_compact_bucket"]["calls"] > 0
+    assert select["plan"] is None
+    assert update["functions"] == {}
+
+
+@pytest.mark.django_db()
+def test_hll_profile_of_cte() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW track_functions")
+        (track_functions,) = cursor.fetchone()
+
+    with hll_profile() as profile, connection.cursor() as cursor:
+        cursor.execute(
+            "WITH updated AS ("
+            "  UPDATE testapp_group SET created = created RETURNING id"
+            ") "
+            "SELECT hll_compact_cardinality(id, 9) FROM updated"
+        )
+    (record,) = profile.queries
+    assert record["functions"]["hll_compact_bucket"]["calls"] > 0
+    assert record["plan"]["Plan"]["Node Type"] == "Aggregate"
+
+    # track_functions is set for the block only
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW track_functions")
+        assert cursor.fetchone() == (track_functions,)
+
+
+@pytest.mark.django_db()
+def test_hll_rollup_matches_cardinality_by_date() -> None:
+    fixtures = _get_reference_approximation("user_uuid", 9)
+    call_command("hll_rollup", "daily_sessions_by_group", stdout=StringIO())
+
+    aggregation = (
+        SessionDailyRollup.objects.values("date")
+        .annotate(approx_unique_users=HLLSketchCardinality(HLLUnion("sketch")))
+        .order_by("date")
+    )
+    assert len(aggregation) == TEST_DATA_N_SESSION_DAYS
+    for i, row in enumerate(aggregation):
+        assert fixtures[i] == row["approx_unique_users"]
+
+
+@pytest.mark.django_db()
+def test_hll_rollup_merges_new_rows_only() -> None:
+    call_command("hll_rollup", "daily_sessions_by_group", stdout=StringIO())
+
+    last_group = Group.objects.order_by("created").last()
+    assert last_group is not None
+    # sessions are created at a whole minute, so these are newer than any other
+    created = last_group.created + timedelta(hours=23, minutes=59, seconds=30)
+    Session.objects.bulk_create(
+        Session(
+            user_uuid=UUID(int=1_000_000 + i),
+            user_int=1_000_000 + i,
+            user_str=f"new-{i}",
+            user_hash=i,
+            created=created,
+            group=last_group,
+        )
+        for i in range(1_000)
+    )
+
+    stdout = StringIO()
+    call_command("hll_rollup", "daily_sessions_by_group", stdout=stdout)
+    assert stdout.getvalue() == "Updated daily_sessions_by_group\n"
+
+    rollup = SessionDailyRollup.objects.get(group=last_group)
+    expected = Session.objects.filter(group=last_group).aggregate(
+        sketch=HLLSketch("user_uuid")
+    )
+    assert rollup.sketch == expected["sketch"]
+
+    stdout = StringIO()
+    call_command("hll_rollup", "daily_sessions_by_group", stdout=stdout)
+    assert stdout.getvalue() == "daily_sessions_by_group is up to date\n"
+
+
+@pytest.mark.django_db()
+def test_hll_rollup_rebuild() -> None:
+    call_command("hll_rollup", stdout=StringIO())
+    sketches = dict(SessionDailyRollup.objects.values_list("date", "sketch"))
+
+    call_command("hll_rollup", "--rebuild", stdout=StringIO())
+    assert dict(SessionDailyRollup.objects.values_list("date", "sketch")) == sketches
+
+
+@pytest.mark.django_db()
+def test_hll_rollup_raises_error_with_unknown_name() -> None:
+    with pytest.raises(CommandError):
+        call_command("hll_rollup", "unknown", stdout=StringIO())
+
+
+@pytest.mark.parametrize("precision", [9, 10, 11, 12])
+@pytest.mark.django_db()
+def test_hll_sketch_of_small_group_is_sparse(precision: int) -> None:
+    n_buckets = 2**precision
+    aggregation = Session.objects.filter(user_int__lt=100).aggregate(
+        sketch=HLLSketch("user_uuid", precision)
+    )
+    sketch = aggregation["sketch"]
+
+    assert sketch[0] == -precision
+    assert len(sketch) <= 101
+    buckets = [bucket_hash & (n_buckets - 1) for bucket_hash in sketch[1:]]
+    assert buckets == sorted(set(buckets))
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality_of_small_groups(field: str, precision: int) -> None:
+    """The sparse state gives the same approximations as the compact dense state"""
+    aggregation = (
+        Session.objects.annotate(facet=F("user_int") / 200)
+        .values("facet")
+        .annotate(
+            approx_unique_users=HLLCardinality(field, precision),
+            compact_approx_unique_users=HLLCompactCardinality(field, precision),
+        )
+        .order_by()
+    )
+
+    assert len(aggregation) == 700
+    for row in aggregation:
+        assert row["approx_unique_users"] == row["compact_approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_union_of_sparse_sketches(precision: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_union(sketch) FROM ("
+            "  SELECT hll_sketch(user_uuid, %s) AS sketch "
+            "  FROM testapp_session GROUP BY user_int / 50"
+            ") AS sketches",
+            [precision],
+        )
+        (union,) = cursor.fetchone()
+
+    aggregation = Session.objects.aggregate(sketch=HLLSketch("user_uuid", precision))
+    assert union == aggregation["sketch"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality_set_strategy_total(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinality(field, precision, strategy="set"),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_cardinality_set_strategy_with_default_precision_total(field: str) -> None:
+    fixtures = _get_reference_approximation(field, 9)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinality(field, strategy="set"),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_cardinality_from_hash_set_strategy_pre_hashed_total(
+    precision: int,
+) -> None:
+    fixtures = _get_reference_approximation("user_hash", precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinalityFromHash(
+            "user_hash", precision, strategy="set"
+        ),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality_set_strategy_with_filter(field: str, precision: int) -> None:
+    days_for_filter = 2
+    fixtures = _get_reference_approximation(field, precision)
+
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinality(
+            field,
+            precision,
+            strategy="set",
+            filter=Q(
+                created__lt=TEST_DATA_BASE_TIMESTAMP
+                + timedelta(days=days_for_filter + 2)
+            ),
+        ),
+    )
+    assert fixtures[days_for_filter] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality_set_strategy_by_date(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation(field, precision)
+
+    aggregation = (
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(
+            approx_unique_users=HLLCardinality(field, precision, strategy="set"),
+        )
+        .values("approx_unique_users", "date_of_session")
+        .order_by("date_of_session")
+    )
+    for i, row in enumerate(aggregation):
+        assert fixtures[i] == row["approx_unique_users"]
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_estimate_of_buckets_grouped_by_date(precision: int) -> None:
+    """The set strategy written as a GROUP BY bucket, as documented in the README"""
+    fixtures = _get_reference_approximation("user_uuid", precision)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_estimate(%s, COUNT(*), SUM(POW(2, -bucket_rank::numeric))) "
+            "FROM ("
+            "  SELECT"
+            "    created::date AS date_of_session,"
+            "    hll_hash(user_uuid) & ((1 << %s) - 1) AS bucket,"
+            "    MAX(hll_rank(hll_hash(user_uuid))) AS bucket_rank"
+            "  FROM testapp_session"
+            "  GROUP BY date_of_session, bucket"
+            ") AS buckets "
+            "GROUP BY date_of_session ORDER BY date_of_session",
+            [precision, precision],
+        )
+        rows = cursor.fetchall()
+
+    assert [approx_unique_users for (approx_unique_users,) in rows] == [
+        fixtures[i] for i in range(TEST_DATA_N_SESSION_DAYS)
+    ]
+
+
+def test_hll_cardinality_raises_error_with_unknown_strategy() -> None:
+    with pytest.raises(ValueError, match="Unknown HLL strategy"):
+        HLLCardinality("user_uuid", strategy="unknown")
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality64_total(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation64(field, precision)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinality64(field, precision),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_cardinality64_with_default_precision_total(field: str) -> None:
+    fixtures = _get_reference_approximation64(field, 9)
+    aggregation = Session.objects.aggregate(
+        approx_unique_users=HLLCardinality64(field),
+    )
+
+    assert fixtures[TEST_DATA_N_SESSION_DAYS - 1] == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, PRECISIONS_TO_TEST))
+@pytest.mark.django_db()
+def test_hll_cardinality64_from_hash_by_date(field: str, precision: int) -> None:
+    fixtures = _get_reference_approximation64(field, precision)
+
+    aggregation = (
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(
+            approx_unique_users=HLLCardinality64FromHash(HLLHash64(field), precision),
+        )
+        .values("approx_unique_users", "date_of_session")
+        .order_by("date_of_session")
+    )
+    for i, row in enumerate(aggregation):
+        assert fixtures[i] == row["approx_unique_users"]
+
+
+@pytest.mark.parametrize(("field", "precision"), product(FIELDS, (8, 9, 10, 11, 12)))
+@pytest.mark.django_db()
+def test_hll_cardinality64_error(field: str, precision: int) -> None:
+    """
+    The approximation stays within 3 standard errors, 1.04 / sqrt(n_buckets)
+    (the error isn't normally distributed with fewer buckets)
+    """
+    fixtures = _get_reference_approximation64(field, precision)
+    max_error = 3 * 1.04 / (2 ** (precision / 2))
+
+    for day_of_week in range(TEST_DATA_N_SESSION_DAYS):
+        n_unique_users = (
+            (day_of_week + 1) * TEST_DATA_N_USER_IDS // TEST_DATA_N_SESSION_DAYS
+        )
+        assert abs(fixtures[day_of_week] / n_unique_users - 1) < max_error
+
+
+@pytest.mark.django_db()
+def test_hll_cardinality64_of_small_groups() -> None:
+    """Small cardinalities are counted almost exactly by the improved estimator"""
+    aggregation = (
+        Session.objects.filter(user_int__lt=1000)
+        .annotate(facet=F("user_int") / 10)
+        .values("facet")
+        .annotate(approx_unique_users=HLLCardinality64("user_uuid", 12))
+        .order_by()
+    )
+
+    assert len(aggregation) == 100
+    for row in aggregation:
+        assert row["approx_unique_users"] == 10
+
+
+@pytest.mark.parametrize("precision", PRECISIONS_TO_TEST)
+@pytest.mark.django_db()
+def test_hll_cardinality_of_small_groups_matches_reference(precision: int) -> None:
+    """Groups of 1000 users, which are approximated with linear counting"""
+    references: dict[int, HyperLogLog] = {}
+    for row in Session.objects.annotate(
+        facet=F("user_int") / 1000, hash=HLLHash("user_uuid")
+    ).values("facet", "hash"):
+        references.setdefault(row["facet"], HyperLogLog(precision)).add(row["hash"])
+
+    aggregation = (
+        Session.objects.annotate(facet=F("user_int") / 1000)
+        .values("facet")
+        .annotate(
+            approx_unique_users=HLLCardinality("user_uuid", precision),
+            compact_approx_unique_users=HLLCompactCardinality("user_uuid", precision),
+            set_approx_unique_users=HLLCardinality(
+                "user_uuid", precision, strategy="set"
+            ),
+        )
+        .order_by()
+    )
+
+    assert len(aggregation) == len(references)
+    for row in aggregation:
+        reference = references[row["facet"]].cardinality()
+        assert row["approx_unique_users"] == reference
+        assert row["compact_approx_unique_users"] == reference
+        assert row["set_approx_unique_users"] == reference
+
+
+@pytest.mark.django_db()
+def test_hll_benchmark_final_functions() -> None:
+    stdout = StringIO()
+    call_command(
+        "hll_benchmark",
+        "final",
+        "--groups=10",
+        "--values-per-group=10",
+        "--repeat=1",
+        stdout=stdout,
+    )
+
+    lines = stdout.getvalue().splitlines()
+    assert [line.split(":")[0] for line in lines] == [
+        "hll_approximate",
+        "hll_approximate (sparse)",
+        "hll_compact_approximate",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("aggregate", "precision", "max_user_int"),
+    product(
+        (HLLCardinality, HLLCompactCardinality, HLLCardinality64),
+        (4, 9, 12),
+        (1000, TEST_DATA_N_USER_IDS),
+    ),
+)
+@pytest.mark.django_db()
+def test_hll_cardinality_in_parallel_matches_serial(
+    aggregate: type[HLLCardinality], precision: int, max_user_int: int
+) -> None:
+    """
+    With 1000 users per group, the states are sparse, and some workers
+    see no rows of a group and hand over an empty state
+    """
+    sessions = Session.objects.filter(user_int__lt=max_user_int)
+    queryset = (
+        sessions.values("group")
+        .annotate(approx_unique_users=aggregate("user_uuid", precision))
+        .order_by("group")
+    )
+    serial = list(queryset)
+    total = sessions.aggregate(approx_unique_users=aggregate("user_uuid", precision))
+
+    with force_parallel_plans(4):
+        plan = queryset.explain()
+        assert "Partial" in plan
+        assert "Finalize" in plan
+        assert list(queryset) == serial
+        assert (
+            sessions.aggregate(approx_unique_users=aggregate("user_uuid", precision))
+            == total
+        )
+
+
+@pytest.mark.django_db()
+def test_hll_combine_of_empty_states() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT "
+            "  hll_bucket_combine('{}', hll_sketch_from_hash(1, 9)),"
+            "  hll_bucket_combine(hll_sketch_from_hash(1, 9), '{}'),"
+            "  ENCODE(hll_compact_bucket_combine('', '\\x0102'::bytea), 'hex'),"
+            "  ENCODE(hll_compact_bucket_combine('\\x0102'::bytea, ''), 'hex')"
+        )
+        assert cursor.fetchone() == ([-9, 1], [-9, 1], "0102", "0102")
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT hll_bucket_combine(hll_sketch_from_hash(1, 9), hll_sketch_from_hash(1, 10))",
+        "SELECT hll_bucket_combine("
+        "  hll_densify(hll_sketch_from_hash(1, 9)), hll_sketch_from_hash(1, 10)"
+        ")",
+        "SELECT hll_compact_bucket_combine('\\x0102'::bytea, '\\x010203'::bytea)",
+    ],
+)
+@pytest.mark.django_db()
+def test_hll_combine_of_different_precisions_raises_error(sql: str) -> None:
+    with (
+        pytest.raises(InternalError, match="different precisions"),
+        connection.cursor() as cursor,
+    ):
+        cursor.execute(sql)
+
+
+@pytest.mark.parametrize(
+    ("precision", "reduced_precision", "max_user_int"),
+    [
+        (12, 12, TEST_DATA_N_USER_IDS),
+        (12, 9, TEST_DATA_N_USER_IDS),
+        (12, 4, TEST_DATA_N_USER_IDS),
+        (9, 5, 100),
+        (14, 8, 50),
+        (14, 11, 1000),
+    ],
+)
+@pytest.mark.django_db()
+def test_hll_reduce_precision(
+    precision: int, reduced_precision: int, max_user_int: int
+) -> None:
+    """Dense and sparse sketches are reduced to the sketch of the lower precision"""
+    sessions = Session.objects.filter(user_int__lt=max_user_int)
+    aggregation = sessions.aggregate(
+        sketch=HLLSketch("user_uuid", precision),
+        reduced_sketch=HLLReducePrecision(
+            HLLSketch("user_uuid", precision), reduced_precision
+        ),
+        reference_sketch=HLLSketch("user_uuid", reduced_precision),
+    )
+
+    assert aggregation["reduced_sketch"] == aggregation["reference_sketch"]
+    assert (
+        Sketch.from_state(aggregation["sketch"])
+        .reduce_precision(reduced_precision)
+        .to_state()
+        == aggregation["reference_sketch"]
+    )
+
+
+@pytest.mark.django_db()
+def test_hll_union_of_different_precisions() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_union(sketch), hll_union_cardinality(sketch) FROM ("
+            "  SELECT hll_sketch(user_uuid, 8 + MOD(user_int, 3) * 2) AS sketch "
+            "  FROM testapp_session GROUP BY MOD(user_int, 3)"
+            "  UNION ALL SELECT NULL"
+            ") AS sketches",
+        )
+        union, cardinality = cursor.fetchone()
+
+    aggregation = Session.objects.aggregate(
+        sketch=HLLSketch("user_uuid", 8),
+        approx_unique_users=HLLCardinality("user_uuid", 8),
+    )
+    assert union == aggregation["sketch"]
+    assert cardinality == aggregation["approx_unique_users"]
+
+
+@pytest.mark.parametrize(
+    ("sql", "message"),
+    [
+        (
+            "SELECT hll_reduce_precision(hll_sketch_from_hash(1, 9), 10)",
+            "cannot increase the precision",
+        ),
+        (
+            "SELECT hll_reduce_precision(hll_sketch_from_hash(1, 9), 3)",
+            "invalid hll_precision",
+        ),
+    ],
+)
+@pytest.mark.django_db()
+def test_hll_reduce_precision_raises_error(sql: str, message: str) -> None:
+    with pytest.raises(InternalError, match=message), connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+@pytest.mark.django_db()
+def test_hll_set_operations_of_stored_sketches() -> None:
+    _store_daily_sketches("user_uuid", 11)
+    first_day = DailySketch.objects.order_by("date").values("sketch")[:1]
+
+    matrix = DailySketch.objects.annotate(
+        union=HLLSketchCardinality(
+            HLLSketchUnion("sketch", Subquery(first_day), Subquery(first_day))
+        ),
+        retained=HLLIntersectionCardinality("sketch", Subquery(first_day)),
+        new=HLLDifferenceCardinality("sketch", Subquery(first_day)),
+        first_day=HLLSketchCardinality(Subquery(first_day)),
+        cardinality=HLLSketchCardinality("sketch"),
+    ).order_by("date")
+    assert len(matrix) == TEST_DATA_N_SESSION_DAYS
+    # every day has the users of the first day, so the union is every day's sketch
+    for row in matrix:
+        assert row.union == row.cardinality
+        assert row.retained == row.first_day
+        assert row.new == row.cardinality - row.first_day
+
+
+@pytest.mark.django_db()
+def test_hll_set_operations_of_different_precisions() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT"
+            "  hll_intersection_cardinality(hll_sketch(user_uuid, 12), hll_sketch(user_int, 9)),"
+            "  hll_difference_cardinality(hll_sketch(user_uuid, 12), hll_sketch(user_uuid, 9)),"
+            "  hll_intersection_cardinality(hll_sketch(user_uuid, 12), '{}'),"
+            "  hll_cardinality(user_uuid, 9) "
+            "FROM testapp_session"
+        )
+        intersection, difference, empty_intersection, cardinality = cursor.fetchone()
+    assert intersection < cardinality * 0.1
+    assert difference == 0
+    assert empty_intersection == 0
+
+
+def _kmv_sketch(user_ints: range, k: int) -> list[int]:
+    """The KMV sketch of the user_uuid of some user_int, see `data.generate_test_data`"""
+    hashes = sorted({hll_hash(UUID(int=user_int)) for user_int in user_ints})
+    return [k, *hashes[:k]]
+
+
+@pytest.mark.django_db()
+def test_hll_kmv_sketch() -> None:
+    users_per_day = TEST_DATA_N_USER_IDS // TEST_DATA_N_SESSION_DAYS
+    sketches = list(
+        Session.objects.annotate(date_of_session=TruncDate("created"))
+        .values("date_of_session")
+        .annotate(
+            kmv=HLLKMVSketch("user_uuid"),
+            kmv_from_hash=HLLKMVSketchFromHash(HLLHash("user_uuid"), 256),
+        )
+        .order_by("date_of_session")
+    )
+    assert sketches[0]["kmv"] == _kmv_sketch(range(users_per_day), 1024)
+    assert sketches[0]["kmv_from_hash"] == _kmv_sketch(range(users_per_day), 256)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_kmv_cardinality(%s::int[]), hll_kmv_cardinality(%s::int[]),"
+            "  hll_kmv_intersection_cardinality(%s::int[], %s::int[])",
+            [
+                sketches[0]["kmv"],
+                sketches[-1]["kmv"],
+                sketches[0]["kmv"],
+                sketches[-1]["kmv"],
+            ],
+        )
+        first_day, last_day, retained = cursor.fetchone()
+    assert abs(first_day - users_per_day) < users_per_day * 0.1
+    assert abs(last_day - TEST_DATA_N_USER_IDS) < TEST_DATA_N_USER_IDS * 0.1
+    # the first day is a seventh of the last one
+    assert abs(retained - users_per_day) < users_per_day * 0.25
+
+
+@pytest.mark.django_db()
+def test_hll_kmv_intersection_of_small_sets_is_exact() -> None:
+    sketches = Session.objects.aggregate(
+        left=HLLKMVSketch("user_uuid", filter=Q(user_int__lt=500)),
+        right=HLLKMVSketch("user_uuid", filter=Q(user_int__gte=300, user_int__lt=700)),
+        union=HLLKMVSketch("user_uuid", filter=Q(user_int__lt=700)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_kmv_intersection_cardinality(%s::int[], %s::int[]),"
+            "  hll_kmv_cardinality(%s::int[])",
+            [sketches["left"], sketches["right"], sketches["union"]],
+        )
+        assert cursor.fetchone() == (200, 700)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+@pytest.mark.django_db()
+def test_hll_kmv_union(parallel: bool) -> None:
+    with force_parallel_plans(4 if parallel else 0), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_kmv_union(kmv) FROM ("
+            "  SELECT hll_kmv_sketch(user_uuid, 256 + MOD(user_int, 2)) AS kmv"
+            "  FROM testapp_session GROUP BY MOD(user_int, 2)"
+            "  UNION ALL SELECT NULL"
+            ") AS sketches",
+        )
+        (union,) = cursor.fetchone()
+        aggregation = Session.objects.aggregate(kmv=HLLKMVSketch("user_uuid", 256))
+
+    assert union == aggregation["kmv"] == _kmv_sketch(range(TEST_DATA_N_USER_IDS), 256)
+
+
+@pytest.mark.django_db()
+def test_hll_benchmark_parallel() -> None:
+    stdout = StringIO()
+    call_command(
+        "hll_benchmark",
+        "parallel",
+        "--precision=9",
+        "--max-workers=2",
+        "--repeat=1",
+        stdout=stdout,
+    )
+
+    lines = stdout.getvalue().splitlines()
+    assert [line.split(" (")[0] for line in lines] == [
+        f"{name}: {n_workers} workers"
+        for name in ("HLLCardinality", "HLLCompactCardinality", "HLLCardinality64")
+        for n_workers in range(3)
+    ]
+
+
+@pytest.mark.django_db()
+def test_hll_benchmark_suite(tmp_path: Path) -> None:
+    options = [
+        "--fields=user_int",
+        "--precisions=8",
+        "--workers",
+        "0",
+        "2",
+        "--repeat=1",
+    ]
+    call_command(
+        "hll_benchmark", "suite", *options, f"--output={tmp_path / 'baseline.json'}"
+    )
+    baseline = json.loads((tmp_path / "baseline.json").read_text())
+    assert baseline["n_sessions"] == Session.objects.count()
+    assert [
+        (result["aggregate"], result["precision"], result["facet"], result["workers"])
+        for result in baseline["results"]
+    ] == [
+        (aggregate, precision, facet, workers)
+        for aggregate, precision in (
+            ("Count", None),
+            ("HLLCardinality", 8),
+            ("HLLCardinalityFromHash", 8),
+        )
+        for facet in ("total", "date")
+        for workers in (0, 2)
+    ]
+
+    stdout = StringIO()
+    call_command(
+        "hll_benchmark",
+        "suite",
+        *options,
+        f"--compare={tmp_path / 'baseline.json'}",
+        stdout=stdout,
+    )
+    lines = stdout.getvalue().splitlines()
+    assert len(lines) == len(baseline["results"])
+    assert all(line.endswith("x baseline") for line in lines)
+
+
+@pytest.mark.django_db()
+def test_load_sessions() -> None:
+    """The sessions of 700 users over a week, as in the tests with 140k users"""
+    assert load_sessions(700) == 2800
+    assert Session.objects.aggregate(
+        unique_users=Count("user_uuid", distinct=True)
+    ) == {"unique_users": 700}
+
+
+@pytest.mark.django_db()
+def test_user_hash_of_test_data() -> None:
+    """The sessions are generated in postgres, with the same user_hash as python"""
+    sessions = Session.objects.filter(user_int__lt=1000).values(
+        "user_uuid", "user_hash"
+    )
+    assert len(sessions) > 0
+    for session in sessions:
+        assert session["user_hash"] == uuid_hash_31bit(session["user_uuid"])
+
+
+@pytest.mark.parametrize(
+    ("precision", "max_user_int", "use_numpy"),
+    product(PRECISIONS_TO_TEST, (100, TEST_DATA_N_USER_IDS), (True, False)),
+)
+@pytest.mark.django_db()
+def test_sketch_matches_hll_sketch(
+    precision: int, max_user_int: int, use_numpy: bool
+) -> None:
+    """With 100 users per group, the states are sparse"""
+    if use_numpy:
+        pytest.importorskip("numpy")
+    sessions = Session.objects.filter(user_int__lt=max_user_int)
+    sketches: dict[UUID, Sketch] = {}
+    for row in sessions.annotate(hash=HLLHash("user_uuid")).values("group", "hash"):
+        sketch = sketches.setdefault(
+            row["group"], Sketch(precision, use_numpy=use_numpy)
+        )
+        sketch.add(row["hash"])
+
+    aggregation = sessions.values("group").annotate(
+        sketch=HLLSketch("user_uuid", precision),
+        approx_unique_users=HLLSketchCardinality(HLLSketch("user_uuid", precision)),
+    )
+    assert len(aggregation) == len(sketches)
+    for row in aggregation:
+        sketch = sketches[row["group"]]
+        assert sketch.to_state() == row["sketch"]
+        assert sketch.cardinality() == row["approx_unique_users"]
+        assert (
+            Sketch.from_state(row["sketch"], use_numpy=use_numpy).to_state()
+            == (row["sketch"])
+        )
+
+
+@pytest.mark.parametrize(("precision", "use_numpy"), product((4, 9, 12), (True, False)))
+@pytest.mark.django_db()
+def test_sketch_merge_matches_hll_union(precision: int, use_numpy: bool) -> None:
+    if use_numpy:
+        pytest.importorskip("numpy")
+    _store_daily_sketches("user_uuid", precision)
+
+    merged = Sketch(precision, use_numpy=use_numpy)
+    for daily_sketch in DailySketch.objects.all():
+        merged.merge(Sketch.from_state(daily_sketch.sketch, use_numpy=not use_numpy))
+
+    aggregation = DailySketch.objects.aggregate(
+        union=HLLUnion("sketch"),
+        approx_unique_users=HLLSketchCardinality(HLLUnion("sketch")),
+    )
+    assert merged.to_state() == aggregation["union"]
+    assert merged.cardinality() == aggregation["approx_unique_users"]
+
+
+def test_sketch_add_many() -> None:
+    numpy = pytest.importorskip("numpy")
+    hashes = numpy.random.default_rng(0).integers(0, 2**31, 100_000)
+    vectorised = Sketch(12, use_numpy=True)
+    vectorised.add_many(hashes)
+    one_by_one = Sketch(12, use_numpy=False)
+    for hashed in hashes.tolist():
+        one_by_one.add(hashed)
+
+    assert vectorised.to_state() == one_by_one.to_state()
+    assert vectorised.cardinality() == one_by_one.cardinality()
+
+
+def test_empty_sketch() -> None:
+    sketch = Sketch.from_state([], precision=9)
+    assert sketch.to_state() == []
+    assert sketch.cardinality() == 0
+
+
+@pytest.mark.parametrize(
+    ("function", "message"),
+    [
+        (lambda: Sketch(27), "invalid precision"),
+        (lambda: Sketch.from_state([]), "precision of an empty state"),
+        (lambda: Sketch.from_state([None] * 100), "invalid state"),
+        (lambda: Sketch.from_state([-9, 1], precision=10), "precision of 9"),
+        (lambda: Sketch(9).add(-1), "must be 31 bits"),
+        (lambda: Sketch(9).add(2**31), "must be 31 bits"),
+        (lambda: Sketch(9).merge(Sketch(10)), "different precisions"),
+        (lambda: Sketch(9).reduce_precision(10), "cannot increase the precision"),
+    ],
+)
+def test_sketch_raises_error(function: Callable[[], object], message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        function()
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_hash_matches_sql(field: str) -> None:
+    rows = Session.objects.annotate(hash=HLLHash(field)).values(field, "hash")[:5000]
+    assert len(rows) == 5000
+    for row in rows:
+        assert hll_hash(row[field]) == row["hash"]
+
+
+@pytest.mark.django_db()
+def test_hll_hash_of_text_matches_sql() -> None:
+    """Text of every length up to a few blocks of 12 bytes, and multi-byte characters"""
+    texts = ["", "é", "日本語", "🦆" * 5] + [
+        "abcdefghijklmnopq"[:n] * 2 for n in range(18)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_hash(text) FROM UNNEST(%s::text []) AS text", [texts]
+        )
+        assert [hll_hash(text) for text in texts] == [
+            hashed for (hashed,) in cursor.fetchall()
+        ]
+
+
+@pytest.mark.django_db()
+def test_hll_hash_of_dates_matches_sql_with_iso_date_style() -> None:
+    dates = [date(1, 1, 1), date(1999, 12, 31), date(2026, 10, 17)]
+    sql = "SELECT hll_hash(value) FROM UNNEST(%s::date []) AS value"
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL DateStyle = 'ISO, DMY'")
+        cursor.execute(sql, [dates])
+        assert [hll_hash(value) for value in dates] == [
+            hashed for (hashed,) in cursor.fetchall()
+        ]
+
+        # e.g. 17/10/2026
+        cursor.execute("SET LOCAL DateStyle = 'SQL, DMY'")
+        cursor.execute(sql, [dates])
+        for value, (hashed,) in zip(dates, cursor.fetchall(), strict=True):
+            assert hll_hash(value) != hashed
+
+
+def test_hll_hash_raises_error_with_unsupported_type() -> None:
+    with pytest.raises(TypeError):
+        hll_hash(1.5)
+
+
+@pytest.mark.parametrize("field", FIELDS)
+@pytest.mark.django_db()
+def test_hll_native_hash_matches_python(field: str) -> None:
+    rows = Session.objects.annotate(hash=HLLNativeHash(field)).values(field, "hash")[
+        :5000
+    ]
+    assert len(rows) == 5000
+    for row in rows:
+        assert hll_native_hash(row[field]) == row["hash"]
+
+
+@pytest.mark.django_db()
+def test_hll_native_hash_of_integers() -> None:
+    """Integers of every size hash the same, as in postgres' hash indexes"""
+    values = [0, 1, -1, 12345, -32768, 2**31 - 1, -(2**31), 2**31, -(2**40), 2**63 - 1]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_native_hash(value), "
+            "CASE WHEN value BETWEEN -2147483648 AND 2147483647 "
+            "THEN hll_native_hash(value::int) END, "
+            "CASE WHEN value BETWEEN -32768 AND 32767 "
+            "THEN hll_native_hash(value::smallint) END "
+            "FROM UNNEST(%s::bigint []) AS value",
+            [values],
+        )
+        for value, (hashed, int_hashed, smallint_hashed) in zip(
+            values, cursor.fetchall(), strict=True
+        ):
+            assert hashed == hll_native_hash(value)
+            assert int_hashed == (hashed if -(2**31) <= value < 2**31 else None)
+            assert smallint_hashed == (hashed if -(2**15) <= value < 2**15 else None)
+
+
+@pytest.mark.parametrize(
+    ("field", "precision", "strategy"),
+    product(FIELDS, (4, 9, 12), ("state", "set")),
+)
+@pytest.mark.django_db()
+def test_hll_native_cardinality(field: str, precision: int, strategy: str) -> None:
+    sessions = Session.objects.filter(user_int__lt=20_000)
+    sketch = Sketch(precision)
+    sketch.add_many(
+        hll_native_hash(value) for value in sessions.values_list(field, flat=True)
+    )
+
+    aggregation = sessions.aggregate(
+        approx_unique_users=HLLNativeCardinality(field, precision, strategy=strategy),
+    )
+    assert aggregation["approx_unique_users"] == sketch.cardinality()
+    if field == "user_str":
+        # text is hashed as `HLLHash` does
+        assert aggregation == sessions.aggregate(
+            approx_unique_users=HLLCardinality(field, precision)
+        )
+
+
+@pytest.mark.parametrize("strategy", ["state", "set"])
+@pytest.mark.django_db()
+def test_hll_native_cardinality_with_default_precision(strategy: str) -> None:
+    sessions = Session.objects.filter(user_int__lt=20_000)
+    assert sessions.aggregate(
+        n=HLLNativeCardinality("user_uuid", strategy=strategy)
+    ) == sessions.aggregate(n=HLLNativeCardinality("user_uuid", 9, strategy=strategy))
+
+
+@pytest.mark.django_db()
+def test_hll_hash_field_is_set_on_save() -> None:
+    visits = [
+        Visit.objects.create(user_uuid=UUID(int=1)),
+        *Visit.objects.bulk_create(
+            [Visit(user_uuid=UUID(int=2)), Visit(user_uuid=None)]
+        ),
+    ]
+    assert [visit.user_uuid_hash for visit in visits] == [
+        hll_hash(UUID(int=1)),
+        hll_hash(UUID(int=2)),
+        None,
+    ]
+    assert list(
+        Visit.objects.annotate(hash=HLLHash("user_uuid"))
+        .order_by("pk")
+        .values_list("user_uuid_hash", "hash")
+    ) == [(visit.user_uuid_hash, visit.user_uuid_hash) for visit in visits]
+
+
+@pytest.mark.django_db()
+def test_hll_backfill_hashes() -> None:
+    Visit.objects.bulk_create(
+        [Visit(user_uuid=UUID(int=i)) for i in range(10)] + [Visit(user_uuid=None)]
+    )
+    Visit.objects.update(user_uuid_hash=None)
+
+    stdout = StringIO()
+    call_command(
+        "hll_backfill_hashes",
+        "testapp.Visit",
+        "user_uuid_hash",
+        "--batch-size=3",
+        stdout=stdout,
+    )
+
+    assert stdout.getvalue().splitlines()[-1] == (
+        "Hashed 10 rows of testapp.Visit.user_uuid_hash"
+    )
+    for visit in Visit.objects.all():
+        assert visit.user_uuid_hash == (
+            None if visit.user_uuid is None else hll_hash(visit.user_uuid)
+        )
+
+
+@pytest.mark.parametrize(
+    ("model", "field"),
+    [
+        ("testapp.Visit", "user_uuid"),
+        ("testapp.Visit", "unknown"),
+        ("testapp.Unknown", "user_uuid_hash"),
+    ],
+)
+@pytest.mark.django_db()
+def test_hll_backfill_hashes_raises_error(model: str, field: str) -> None:
+    with pytest.raises(CommandError):
+        call_command("hll_backfill_hashes", model, field, stdout=StringIO())
+
+
+@pytest.mark.parametrize(
+    ("aggregate", "from_hash_aggregate", "from_hash_function"),
+    [
+        (
+            HLLCardinality,
+            HLLCardinalityFromHash,
+            # the variant of the precision, see `HLLPrecisionVariantMixin`
+            "hll_cardinality_from_hash_p{precision}",
+        ),
+        (
+            HLLCompactCardinality,
+            HLLCompactCardinalityFromHash,
+            "hll_compact_cardinality_from_hash",
+        ),
+        (HLLSketch, HLLSketchFromHash, "hll_sketch_from_hash"),
+    ],
+)
+@pytest.mark.parametrize("precision", [4, 9])
+@pytest.mark.django_db()
+def test_hll_aggregates_use_hash_column(
+    aggregate: Callable,
+    from_hash_aggregate: Callable,
+    from_hash_function: str,
+    precision: int,
+) -> None:
+    Visit.objects.bulk_create(
+        [Visit(user_uuid=UUID(int=i % 700)) for i in range(2000)]
+        + [Visit(user_uuid=None)]
+    )
+    # the generated column of testapp's migration 0005
+    assert get_hash_columns(connection)["testapp_visit", "user_uuid"] == (
+        "user_uuid_hll_hash"
+    )
+
+    query = Visit.objects.filter(pk__gt=0)
+    sql = str(query.annotate(n=aggregate("user_uuid", precision)).query)
+    from_hash_function = from_hash_function.format(precision=precision)
+    assert f'{from_hash_function}("testapp_visit"."user_uuid_hll_hash"' in sql
+    assert "hll_hash(" not in sql
+
+    assert query.aggregate(result=aggregate("user_uuid", precision)) == query.aggregate(
+        result=from_hash_aggregate(HLLHash("user_uuid"), precision)
+    )
+
+
+@pytest.mark.django_db()
+def test_hll_aggregates_use_hash_column_with_default_precision() -> None:
+    Visit.objects.bulk_create([Visit(user_uuid=UUID(int=i % 700)) for i in range(2000)])
+
+    aggregation = Visit.objects.aggregate(
+        cardinality=HLLCardinality("user_uuid"),
+        compact_cardinality=HLLCompactCardinality("user_uuid"),
+        reference=HLLCardinalityFromHash(HLLHash("user_uuid"), 9),
+        compact_reference=HLLCompactCardinalityFromHash(HLLHash("user_uuid"), 9),
+    )
+    assert aggregation["cardinality"] == aggregation["reference"]
+    assert aggregation["compact_cardinality"] == aggregation["compact_reference"]
+
+    with_filter = Q(user_uuid__lt=UUID(int=300))
+    aggregation = Visit.objects.aggregate(
+        cardinality=HLLCardinality("user_uuid", filter=with_filter),
+        compact_cardinality=HLLCompactCardinality("user_uuid", filter=with_filter),
+        sketch=HLLSketchCardinality(HLLSketch("user_uuid", filter=with_filter)),
+        reference=HLLCardinalityFromHash(HLLHash("user_uuid"), 9, filter=with_filter),
+        precision_reference=HLLCardinality("user_uuid", 9, filter=with_filter),
+        compact_reference=HLLCompactCardinalityFromHash(
+            HLLHash("user_uuid"), 9, filter=with_filter
+        ),
+    )
+    assert aggregation["cardinality"] == aggregation["reference"]
+    assert aggregation["precision_reference"] == aggregation["reference"]
+    assert aggregation["sketch"] == aggregation["reference"]
+    assert aggregation["compact_cardinality"] == aggregation["compact_reference"]
+    # 300 of the 700 users
+    assert aggregation["reference"] < 500
+
+
+@pytest.mark.django_db()
+def test_hll_cardinality_set_strategy_uses_hash_column() -> None:
+    Visit.objects.bulk_create([Visit(user_uuid=UUID(int=i % 700)) for i in range(2000)])
+
+    aggregation = Visit.objects.aggregate(
+        result=HLLCardinality("user_uuid", 9, strategy="set"),
+        reference=HLLCardinalityFromHash(HLLHash("user_uuid"), 9),
+    )
+    assert aggregation["result"] == aggregation["reference"]
+
+
+@pytest.mark.django_db()
+def test_add_hll_hash_column() -> None:
+    operation = AddHLLHashColumn("session", "user_int", index_fields=["created"])
+    from_state = ProjectState.from_apps(apps)
+    to_state = from_state.clone()
+    operation.state_forwards("testapp", to_state)
+
+    with connection.schema_editor() as schema_editor:
+        operation.database_forwards("testapp", schema_editor, from_state, to_state)
+    try:
+        assert get_hash_columns(connection)["testapp_session", "user_int"] == (
+            "user_int_hll_hash"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes "
+                "WHERE tablename = 'testapp_session' AND indexname LIKE '%%_hll'"
+            )
+            [(index_definition,)] = cursor.fetchall()
+        assert "(created, user_int_hll_hash)" in index_definition
+
+        sql = str(Session.objects.annotate(n=HLLCardinality("user_int")).query)
+        assert (
+            'hll_cardinality_from_hash_p9("testapp_session"."user_int_hll_hash"' in sql
+        )
+        aggregation = Session.objects.aggregate(
+            result=HLLCardinality("user_int", 11),
+            reference=HLLCardinalityFromHash(HLLHash("user_int"), 11),
+        )
+        assert aggregation["result"] == aggregation["reference"]
+    finally:
+        with connection.schema_editor() as schema_editor:
+            operation.database_backwards("testapp", schema_editor, to_state, from_state)
+
+    assert ("testapp_session", "user_int") not in get_hash_columns(connection)
+    assert operation.deconstruct() == (
+        "AddHLLHashColumn",
+        [],
+        {"model_name": "session", "field": "user_int", "index_fields": ["created"]},
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize(
+    ("precision", "n_users", "batch_size"),
+    [(9, 100, 7), (9, 20000, 3000), (11, 1000, 1000), (4, 50, 1)],
+)
+def test_hll_add_hashes(precision: int, n_users: int, batch_size: int) -> None:
+    hashes = [hll_hash(UUID(int=n)) for n in range(n_users)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT hll_sketch_from_hash(h, %s) FROM UNNEST(%s) h", [precision, hashes]
+        )
+        ((expected,),) = cursor.fetchall()
+
+        state = None
+        for start in range(0, n_users, batch_size):
+            cursor.execute(
+                "SELECT hll_add_hashes(%s::int[], %s::int[], %s)",
+                [state, [*hashes[start : start + batch_size], None], precision],
+            )
+            ((state,),) = cursor.fetchall()
+    assert state == expected
+
+
+@pytest.mark.django_db()
+def test_hll_counter_increment() -> None:
+    HLLCounter.objects.increment("empty", [])
+    HLLCounter.objects.increment("users", [UUID(int=n) for n in range(300)], 11)
+    # existing counters keep their precision
+    HLLCounter.objects.increment("users", [UUID(int=n) for n in range(200, 5000)], 9)
+    HLLCounter.objects.increment("users", [None, UUID(int=0)])
+
+    counters = dict(HLLCounter.objects.values_list("key", "sketch"))
+    assert counters["empty"] == []
+    sketch = Sketch(11)
+    sketch.add_many(hll_hash(UUID(int=n)) for n in range(5000))
+    assert counters["users"] == sketch.to_state()
+    assert (
+        HLLCounter.objects.annotate(n=HLLSketchCardinality("sketch")).get(key="users").n
+        == sketch.cardinality()
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("key_field", [None, "group"])
+def test_add_hll_counter_trigger(key_field: str | None) -> None:
+    operation = AddHLLCounterTrigger(
+        "session", "user_uuid", name="users", key_field=key_field, precision=11
+    )
+    from_state = ProjectState.from_apps(apps)
+    to_state = from_state.clone()
+    operation.state_forwards("testapp", to_state)
+
+    def insert_sessions(users: range) -> None:
+        Session.objects.bulk_create(
+            Session(
+                user_uuid=UUID(int=n),
+                user_int=n,
+                user_str="",
+                user_hash=0,
+                created=TEST_DATA_BASE_TIMESTAMP,
+                group_id=UUID(int=n % 2 + 1),
+            )
+            for n in users
+        )
+
+    with connection.schema_editor() as schema_editor:
+        operation.database_forwards("testapp", schema_editor, from_state, to_state)
+    try:
+        insert_sessions(range(1000))
+        insert_sessions(range(500, 3000))
+    finally:
+        with connection.schema_editor() as schema_editor:
+            operation.database_backwards("testapp", schema_editor, to_state, from_state)
+    # rows inserted without the trigger aren't counted
+    insert_sessions(range(3000, 4000))
+
+    counters = dict(HLLCounter.objects.values_list("key", "sketch"))
+    expected = {}
+    for key, users in (
+        [("users", range(3000))]
+        if key_field is None
+        else [
+            (f"users:{UUID(int=1)}", range(0, 3000, 2)),
+            (f"users:{UUID(int=2)}", range(1, 3000, 2)),
+        ]
+    ):
+        sketch = Sketch(11)
+        sketch.add_many(hll_hash(UUID(int=n)) for n in users)
+        expected[key] = sketch.to_state()
+    assert counters == expected
+    assert operation.deconstruct() == (
+        "AddHLLCounterTrigger",
+        [],
+        {
+            "model_name": "session",
+            "field": "user_uuid",
+            "name": "users",
+            **({"key_field": key_field} if key_field else {}),
+            "precision": 11,
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    ("output", "expected"),
+    [
+        (["hll_cardinality(user_int, 16)"], state_bytes(16)),
+        (["hll_cardinality_from_hash_p11(user_uuid_hll_hash)"], state_bytes(11)),
+        (["user_int", "hll_sketch(user_uuid)"], state_bytes(9)),
+        (
+            [
+                "PARTIAL hll_cardinality_from_hash((hashtext((user_uuid)::text) & "
+                "2147483647), 11) FILTER (WHERE (user_int > 3))"
+            ],
+            state_bytes(11),
+        ),
+        (
+            ["hll_compact_cardinality(user_int, 12)", "hll_cardinality64(user_int)"],
+            state_bytes(12, compact=True) + state_bytes(9, compact=True),
+        ),
+        (
+            ["hll_multi_cardinality(ARRAY[hll_hash(a), hll_hash(b)], 9)"],
+            # the precision and 2 blocks of buckets
+            24 + 136 + 4 * 1025,
+        ),
+        (["hll_kmv_sketch(user_uuid, 256)"], 24 + 4 * 257),
+        (["hll_sketch_cardinality(sketch)", "count(*)"], 0),
+    ],
+)
+def test_get_output_state_bytes(output: list[str], expected: int) -> None:
+    assert get_output_state_bytes(output) == expected
+
+
+def test_state_bytes() -> None:
+    assert state_bytes(9) == 2136
+    assert state_bytes(16) == 24 + 8192 + 4 * 65536
+    assert state_bytes(9, compact=True) == 516
+
+
+@pytest.mark.django_db()
+def test_hll_aggregates_state_space() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT aggregate.aggtransspace "
+            "FROM pg_aggregate aggregate "
+            "JOIN pg_proc function ON function.oid = aggregate.aggfnoid "
+            "WHERE function.proname IN ('hll_cardinality', 'hll_sketch_from_hash')"
+        )
+        assert cursor.fetchall() == [(state_bytes(),)]
+
+        cursor.execute(
+            "SELECT function.proname, aggregate.aggtransspace, aggregate.agginitval "
+            "FROM pg_aggregate aggregate "
+            "JOIN pg_proc function ON function.oid = aggregate.aggfnoid "
+            "WHERE function.proname = 'hll_cardinality_p11'"
+        )
+        assert cursor.fetchall() == [("hll_cardinality_p11", state_bytes(11), "{-11}")]
+
+
+@pytest.mark.parametrize("precision", [4, 9, 16])
+@pytest.mark.django_db()
+def test_hll_cardinality_precision_variants(precision: int) -> None:
+    """
+    With 5000 users, the states are dense at precisions 4 and 9,
+    and densified at precision 16
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT "
+            f"  hll_cardinality(user_uuid, {precision}),"
+            f"  hll_cardinality_p{precision}(user_uuid),"
+            f"  hll_cardinality_from_hash(user_hash, {precision}),"
+            f"  hll_cardinality_from_hash_p{precision}(user_hash),"
+            f"  hll_cardinality_p{precision}(user_uuid) FILTER (WHERE user_int < 0) "
+            "FROM testapp_session "
+            "WHERE user_int < 5000 "
+            "GROUP BY group_id"
+        )
+        rows = cursor.fetchall()
+
+    assert len(rows) == TEST_DATA_N_SESSION_DAYS
+    for cardinality, variant, from_hash, from_hash_variant, empty in rows:
+        assert variant == cardinality
+        assert from_hash_variant == from_hash
+        assert empty is None
+
+
+@pytest.mark.django_db()
+def test_hll_cardinality_uses_precision_variants() -> None:
+    sessions = Session.objects.values("group")
+
+    def get_sql(aggregate: Aggregate) -> str:
+        return str(sessions.annotate(n=aggregate).query)
+
+    assert 'hll_cardinality_p11("testapp_session"."user_uuid")' in get_sql(
+        HLLCardinality("user_uuid", 11)
+    )
+    assert "hll_cardinality_p9(" in get_sql(HLLCardinality("user_uuid"))
+    assert "hll_cardinality_from_hash_p12(" in get_sql(
+        HLLCardinalityFromHash("user_hash", 12)
+    )
+    assert 'FILTER (WHERE "testapp_session"."user_int" < 3)' in get_sql(
+        HLLCardinality("user_uuid", 11, filter=Q(user_int__lt=3))
+    )
+    # precisions that aren't constants, and the set strategy, don't have variants
+    assert "hll_cardinality(" in get_sql(HLLCardinality("user_uuid", Value(10) + 1))
+    assert "_p11" not in get_sql(HLLCardinality("user_uuid", 11, strategy="set"))
+
+
+@pytest.mark.django_db()
+def test_hll_memory_guard(caplog: pytest.LogCaptureFixture) -> None:
+    by_group = (
+        Session.objects.filter(user_int__lt=500)
+        .values("group")
+        .annotate(n=HLLCardinality("user_uuid", 12))
+        .order_by()
+    )
+    expected = dict(by_group.values_list("group", "n"))
+    total = Session.objects.filter(user_int__lt=500).aggregate(
+        n=HLLCardinality("user_uuid", 12)
+    )
+    # so that postgres hashes the few rows of each group rather than sorting them
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_sort = off")
+
+    # 7 groups of 12 bit states are about 115 KB
+    with pytest.raises(HLLMemoryError, match="more than the budget"):
+        with hll_memory_guard(budget=50_000):
+            dict(by_group.values_list("group", "n"))
+    # queries that start with a CTE too
+    with pytest.raises(HLLMemoryError, match="more than the budget"):
+        with hll_memory_guard(budget=50_000), connection.cursor() as cursor:
+            cursor.execute(
+                "WITH sessions AS ("
+                "  SELECT * FROM testapp_session WHERE user_int < 500"
+                ") "
+                "SELECT group_id, hll_cardinality(user_uuid, 12) "
+                "FROM sessions GROUP BY group_id"
+            )
+
+    with (
+        caplog.at_level("WARNING", "django_pg_simple_hll.memory"),
+        hll_memory_guard(budget=50_000, on_exceed="sort"),
+    ):
+        assert dict(by_group.values_list("group", "n")) == expected
+        # other queries run as usual
+        assert (
+            Session.objects.filter(user_int__lt=500).aggregate(
+                n=HLLCardinality("user_uuid", 12)
+            )
+            == total
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW enable_hashagg")
+            assert cursor.fetchall() == [("on",)]
+
+        # a query that fails leaves the transaction usable, and the setting restored
+        zero = F("user_int") - F("user_int")
+        with pytest.raises(DataError, match="division by zero"):
+            dict(
+                by_group.filter(user_int__gt=F("user_int") / zero).values_list(
+                    "group", "n"
+                )
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW enable_hashagg")
+            assert cursor.fetchall() == [("on",)]
+    assert caplog.text.count("run without hashed aggregates") == 2
+
+    with hll_memory_guard():
+        assert dict(by_group.values_list("group", "n")) == expected
+
+    with pytest.raises(ValueError, match="invalid on_exceed"):
+        with hll_memory_guard(on_exceed="lower"):
+            pass